@@ -0,0 +1,125 @@
+import numpy as np
+
+from scenario_operations import sequence_dtype
+
+batch_moves = ('swap', 'move', 'split', 'merge', 'transfer') # neighbor moves of the batch sequences
+
+def normalize_batch_sequence(batch_sequence):
+
+    """
+        Merges the adjacent batches of the same product (and removes the empty ones), so that each unit sequence has a
+        single batch sequence.
+    """
+
+    normalized_batch_sequence = []
+
+    for product_id, count in batch_sequence:
+
+        if count == 0:
+            continue
+
+        if normalized_batch_sequence and normalized_batch_sequence[-1][0] == product_id:
+            normalized_batch_sequence[-1] = (product_id, normalized_batch_sequence[-1][1] + count)
+        else:
+            normalized_batch_sequence.append((product_id, count))
+
+    return normalized_batch_sequence
+
+def expand_batch_sequence(batch_sequence):
+
+    """
+        Unit production sequence (array of product IDs) of a batch sequence.
+    """
+
+    if not batch_sequence:
+        return np.zeros(0, dtype=sequence_dtype)
+
+    product_ids, counts = zip(*batch_sequence)
+
+    return np.repeat(np.array(product_ids, dtype=sequence_dtype), counts)
+
+def create_batch_sequence(production_sequence, batch_size, rng):
+
+    """
+        Initial batch sequence with the products of production_sequence: the units of each product are divided into
+        batches of (almost) the same size, with at most batch_size units, which are shuffled with rng.
+    """
+
+    product_counts = np.bincount(production_sequence)
+
+    batch_sequence = []
+    for product_id, count in enumerate(product_counts.tolist()):
+
+        batches_count = -(-count // batch_size)
+
+        for batch_index in range(batches_count):
+            batch_sequence.append((product_id, count // batches_count + (batch_index < count % batches_count)))
+
+    rng.shuffle(batch_sequence)
+
+    return normalize_batch_sequence(batch_sequence)
+
+def generate_batch_neighbor(batch_sequence, rng):
+
+    """
+        Neighbor of a batch sequence, with the same number of units of each product, generated by one of the
+        batch_moves (chosen with rng):
+            - swap: swaps two batches
+            - move: moves a batch to another position
+            - split: splits a batch in two and moves one of the parts to another position
+            - merge: merges a batch into another batch of the same product
+            - transfer: moves some units from a batch to another batch of the same product
+
+        Returns the (normalized) neighbor and the move. When the chosen move isn't possible (e.g. merge without two
+        batches of the same product), another one is chosen.
+    """
+
+    batches_count = len(batch_sequence)
+
+    if batches_count < 2: # a single batch has no neighbors
+        return list(batch_sequence), 'swap'
+
+    while True:
+
+        move = rng.choice(batch_moves)
+        neighbor_batch_sequence = list(batch_sequence)
+
+        if move == 'swap':
+
+            first_index, second_index = rng.sample(range(batches_count), 2)
+            neighbor_batch_sequence[first_index], neighbor_batch_sequence[second_index] = neighbor_batch_sequence[second_index], neighbor_batch_sequence[first_index]
+
+        elif move == 'move':
+
+            batch = neighbor_batch_sequence.pop(rng.randrange(batches_count))
+            neighbor_batch_sequence.insert(rng.randrange(batches_count), batch)
+
+        elif move == 'split':
+
+            splittable_indexes = [index for index, (_, count) in enumerate(batch_sequence) if count > 1]
+            if not splittable_indexes:
+                continue
+
+            batch_index = rng.choice(splittable_indexes)
+            product_id, count = batch_sequence[batch_index]
+            split_count = rng.randint(1, count - 1)
+
+            neighbor_batch_sequence[batch_index] = (product_id, count - split_count)
+            neighbor_batch_sequence.insert(rng.randrange(batches_count + 1), (product_id, split_count))
+
+        else: # merge or transfer, between two batches of the same product
+
+            batch_index = rng.randrange(batches_count)
+            product_id, count = batch_sequence[batch_index]
+
+            other_indexes = [index for index, (other_product_id, _) in enumerate(batch_sequence) if other_product_id == product_id and index != batch_index]
+            if not other_indexes or (move == 'transfer' and count < 2):
+                continue
+
+            other_index = rng.choice(other_indexes)
+            moved_count = count if move == 'merge' else rng.randint(1, count - 1)
+
+            neighbor_batch_sequence[batch_index] = (product_id, count - moved_count)
+            neighbor_batch_sequence[other_index] = (product_id, batch_sequence[other_index][1] + moved_count)
+
+        return normalize_batch_sequence(neighbor_batch_sequence), move
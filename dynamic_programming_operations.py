@@ -0,0 +1,199 @@
+import math
+
+import numpy as np
+
+from survival_function_operations import get_survival_cycles
+from scenario_operations import sequence_dtype
+
+dynamic_programming_memory_budget = 512 * 1024**2 # max memory (in bytes) of the count vector grids of the dynamic programming solver
+dynamic_programming_work_budget = 5 * 10**9 # max number of grid cells updated by the dynamic programming solver (a few seconds)
+
+def calculate_segment_capacities(scenario, initial_cycles, s_maintenance_max, survival_dict):
+
+    """
+        Calculates the maximum number of cycles each machine can produce in a segment of the production sequence (the
+        products between two maintenances): it produces less than (maintenance cycles - current cycle) cycles, where the
+        maintenance cycles are the ones at s_maintenance_max, so:
+            - first_capacities: for the first segment, from the initial cycles (negative if the machine needs immediate maintenance)
+            - capacities: for the segments after a maintenance, from cycle 1
+
+        Returns both as arrays indexed by machine ID.
+    """
+
+    maintenance_cycles = np.array([get_survival_cycles(machine, s_maintenance_max, survival_dict) for machine in scenario.machines], dtype=np.int64)
+    machine_initial_cycles = np.array([initial_cycles.get(machine, 0) for machine in scenario.machines], dtype=np.int64)
+
+    return maintenance_cycles - machine_initial_cycles - 1, maintenance_cycles - 2
+
+def estimate_dynamic_programming_memory(product_counts, expected_segments):
+
+    """
+        Estimates the memory (in bytes) used by pack_production_segments: a boolean grid over the count vectors (one
+        cell for each vector of remaining units of each product) for each segment, plus the cycles of each grid cell.
+    """
+
+    grid_size = math.prod(count + 1 for count in product_counts)
+
+    return grid_size * (expected_segments + 2 * np.dtype(np.int64).itemsize)
+
+def calculate_feasible_segments(product_counts, cycle_matrix, capacities):
+
+    """
+        Boolean grid over the count vectors (with shape product_counts + 1) where a cell is True if a segment with that
+        number of units of each product doesn't exceed the capacity of any machine.
+    """
+
+    grid_shape = tuple(count + 1 for count in product_counts)
+    feasible_segments = np.ones(grid_shape, dtype=bool)
+
+    for machine_id, capacity in enumerate(capacities):
+
+        segment_cycles = np.zeros(grid_shape, dtype=np.int64)
+
+        for product_id, product_cycles in enumerate(cycle_matrix[:, machine_id]):
+            axis_shape = [1] * len(grid_shape)
+            axis_shape[product_id] = grid_shape[product_id]
+            segment_cycles += (np.arange(grid_shape[product_id], dtype=np.int64) * product_cycles).reshape(axis_shape)
+
+        feasible_segments &= segment_cycles <= capacity
+
+    return feasible_segments
+
+def calculate_maximal_segments(feasible_segments):
+
+    """
+        Count vectors of the feasible segments that can't get one more unit of any product (the segments of an optimal
+        packing can always be extended to one of these).
+    """
+
+    maximal_segments = feasible_segments.copy()
+
+    for axis in range(feasible_segments.ndim):
+
+        extended_segments = np.zeros_like(feasible_segments) # if the segment with one more unit of this product is feasible
+        source_slice = [slice(None)] * feasible_segments.ndim
+        target_slice = [slice(None)] * feasible_segments.ndim
+        source_slice[axis] = slice(1, None)
+        target_slice[axis] = slice(None, -1)
+        extended_segments[tuple(target_slice)] = feasible_segments[tuple(source_slice)]
+
+        maximal_segments &= ~extended_segments
+
+    return np.argwhere(maximal_segments)
+
+def close_downward(packable_counts):
+
+    """
+        Every count vector lower than a packable one is packable too.
+    """
+
+    for axis in range(packable_counts.ndim):
+        packable_counts = np.flip(np.logical_or.accumulate(np.flip(packable_counts, axis), axis), axis)
+
+    return packable_counts
+
+def add_segment(packable_counts, maximal_segments):
+
+    """
+        Count vectors that can be packed with one more segment: the packable ones shifted by each maximal segment.
+    """
+
+    grid_shape = packable_counts.shape
+    extended_counts = packable_counts.copy()
+
+    for segment in maximal_segments:
+
+        target_slice = tuple(slice(units, None) for units in segment)
+        source_slice = tuple(slice(None, size - units) for size, units in zip(grid_shape, segment))
+        extended_counts[target_slice] |= packable_counts[source_slice]
+
+    return close_downward(extended_counts)
+
+def pack_production_segments(product_counts, cycle_matrix, first_capacities, capacities, max_segments=None, max_work=dynamic_programming_work_budget):
+
+    """
+        Dynamic programming over the count vectors of the remaining units of each product: finds the minimum number
+        of segments (products between maintenances) needed to produce product_counts, with first_capacities for the
+        first segment and capacities for the others.
+
+        This is a relaxation of the production simulation, where every machine is maintained at each maintenance (in
+        the simulation only the machine that reaches its maintenance cycles, and the ones that can share its
+        maintenance, are maintained, so no sequence needs less maintenances than segments - 1).
+
+        Each additional segment shifts the grid of the packable count vectors by every maximal segment, so it updates
+        (grid size * maximal segments) cells: if the updated cells would exceed max_work (None for no limit) the
+        search is abandoned.
+
+        Returns the segments (count vector of each segment, in production order) and the number of maintenances, or
+        None, None if the products don't fit in max_segments segments or the search exceeds max_work.
+    """
+
+    product_counts = [int(count) for count in product_counts]
+    total_counts = tuple(product_counts)
+
+    maximal_segments = calculate_maximal_segments(calculate_feasible_segments(product_counts, cycle_matrix, capacities))
+
+    segment_work = math.prod(count + 1 for count in product_counts) * len(maximal_segments)
+    work = 0
+
+    immediate_maintenances = 0
+    if np.any(first_capacities < 0): # a machine needs maintenance before producing anything
+        first_capacities = capacities
+        immediate_maintenances = 1
+
+    # packable_counts[k][r] is True if the count vector r fits in k + 1 segments
+    packable_counts = [close_downward(calculate_feasible_segments(product_counts, cycle_matrix, first_capacities))]
+
+    while not packable_counts[-1][total_counts]:
+
+        if (max_segments is not None and len(packable_counts) >= max_segments) or len(maximal_segments) == 0:
+            return None, None
+
+        work += segment_work
+        if max_work is not None and work > max_work:
+            return None, None
+
+        next_packable_counts = add_segment(packable_counts[-1], maximal_segments)
+
+        if np.array_equal(next_packable_counts, packable_counts[-1]): # no product fits in a segment
+            return None, None
+
+        packable_counts.append(next_packable_counts)
+
+    # rebuild the segments from the last one
+    segments = []
+    remaining_counts = np.array(total_counts)
+
+    for segment_index in range(len(packable_counts) - 1, 0, -1):
+
+        for segment in maximal_segments:
+
+            previous_counts = np.maximum(remaining_counts - segment, 0)
+
+            if packable_counts[segment_index - 1][tuple(previous_counts)]:
+                segments.append(remaining_counts - previous_counts)
+                remaining_counts = previous_counts
+                break
+
+    segments.append(remaining_counts)
+    segments.reverse()
+
+    return segments, len(segments) - 1 + immediate_maintenances
+
+def build_segment_sequence(segments):
+
+    """
+        Production sequence (array of product IDs) of the segments, with the units of each product spread evenly
+        through its segment.
+    """
+
+    production_sequence = []
+
+    for segment in segments:
+
+        segment_units = [((unit_index + 0.5) / count, product_id) for product_id, count in enumerate(segment) for unit_index in range(count)]
+        segment_units.sort()
+
+        production_sequence.extend(product_id for _, product_id in segment_units)
+
+    return np.array(production_sequence, dtype=sequence_dtype)
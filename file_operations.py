@@ -1,14 +1,67 @@
 import os
 import math
-import pandas as pd
+import numpy as np
+
+from schedule_operations import schedule_state_labels
 
 data_folder_path = 'data/'
 
+default_export_formats = ('parquet',) # formats of the production export: the long formats of export_writers and/or 'excel' (opt-in, wide tables)
+csv_chunk_rows = 1000000 # rows written at a time by the CSV writer
+
+def export_production_information(schedule, final_time_slot, machine_operation_information, export_formats=None):
+
+    """
+        Exports the production information in each of export_formats (None = default_export_formats):
+            - the formats of export_writers (parquet, feather, csv): one long table, production_timeline, with a row
+              per machine and timeslot (see transform_machine_operation_information_to_long_df), without column limit
+            - excel: the wide schedule and machine operation information tables
+              (see save_schedule_and_machine_operation_information_excel_files)
+
+        Returns the paths of the saved files.
+    """
+
+    if export_formats is None:
+        export_formats = default_export_formats
+
+    saved_files = []
+    long_formats = [export_format for export_format in export_formats if export_format != 'excel']
+
+    if long_formats:
+
+        df_production_timeline = transform_machine_operation_information_to_long_df(machine_operation_information, final_time_slot)
+
+        for export_format in long_formats:
+
+            if export_format not in export_writers:
+                raise ValueError(f"Unknown export format '{export_format}' (available: {', '.join(export_writers)}, excel)")
+
+            extension, writer = export_writers[export_format]
+            production_timeline_file = os.path.join(data_folder_path, f'production_timeline{extension}')
+
+            try:
+                writer(df_production_timeline, production_timeline_file)
+
+            except ImportError: # parquet and feather need pyarrow
+                print(f"\n{export_format} export isn't available (pyarrow isn't installed), using csv instead.")
+
+                extension, writer = export_writers['csv']
+                production_timeline_file = os.path.join(data_folder_path, f'production_timeline{extension}')
+                writer(df_production_timeline, production_timeline_file)
+
+            print(f'\nSaved production timeline at \'{production_timeline_file}\'.')
+            saved_files.append(production_timeline_file)
+
+    if 'excel' in export_formats:
+        saved_files += save_schedule_and_machine_operation_information_excel_files(schedule, final_time_slot, machine_operation_information)
+
+    return saved_files
+
 def save_schedule_and_machine_operation_information_excel_files(schedule, final_time_slot, machine_operation_information):
 
     """
         Save the schedule table and the production information in Excel files.
-        The production information has the following structure:
+        The production information (saved up to the final time slot, exclusive) has the following structure:
 
         -> Machine 'mx' (row)
             -> Timeslot 'ty' (main column)
@@ -16,10 +69,11 @@ def save_schedule_and_machine_operation_information_excel_files(schedule, final_
                                                     ex: A0_4 = the 4th A0 product being produced
                 -> Cycle (sub-column 2): the current cycle number of that machine
                 -> State (sub-column 3): "Producing"/"Free"/"Maintenance"/"Unavailable"
+
+        Returns the paths of the saved files.
     """
 
-    final_time_slot_schedule_index = schedule.columns.get_loc('t' + str(final_time_slot))
-    schedule = schedule.iloc[:, :final_time_slot_schedule_index + 1]
+    schedule = schedule.to_dataframe(final_time_slot) # labelled scheduling table, up to the final time slot
 
     schedule_file = os.path.join(data_folder_path, 'production_schedule.xlsx')
 
@@ -28,12 +82,14 @@ def save_schedule_and_machine_operation_information_excel_files(schedule, final_
 
         filenames = divide_large_excel_files(schedule, 'production_schedule')
         print(f'\nSaved production scheduling table at \'{filenames}\'.')
+        saved_files = list(filenames)
 
     else:
         print(f'\nSaved production scheduling table at \'{schedule_file}\'.')
         schedule.to_excel(schedule_file)
+        saved_files = [schedule_file]
 
-    # transform machine_operation_information dict into a df save it in an Excel
+    # transform machine_operation_information into a df save it in an Excel
     machine_operation_information_file = os.path.join(data_folder_path, 'machine_operation_information.xlsx')
 
     # ------ NOTA ------
@@ -41,31 +97,27 @@ def save_schedule_and_machine_operation_information_excel_files(schedule, final_
     # tempo é pq a produção acabou (na maneira como o scheduling está agora não há problema, só haveria problema
     # se essa lógica fosse alterada)
 
-    machine_operation_information = {
-        machine: {
-            time_slot: data
-            for time_slot, data in machine_info.items()
-            if int(time_slot[1:]) < final_time_slot
-        }
-        for machine, machine_info in machine_operation_information.items()
-    }
-
-    df_machine_operation_information = transform_machine_operation_information_to_df(machine_operation_information)
+    df_machine_operation_information = transform_machine_operation_information_to_df(machine_operation_information, final_time_slot)
 
     if len(df_machine_operation_information.columns) > 16384: # max number of columns supported in an Excel sheet
         filenames = divide_large_excel_files(df_machine_operation_information, 'machine_operation_information')
         print(f'\nSaved production scheduling table at \'{filenames}\'.')
+        saved_files += filenames
 
     else:
         df_machine_operation_information.to_excel(machine_operation_information_file)
         print(f'Saved production information at \'{machine_operation_information_file}\'.')
+        saved_files.append(machine_operation_information_file)
+
+    return saved_files
 
 
-def transform_machine_operation_information_to_df(machine_operation_information):
+def transform_machine_operation_information_to_df(machine_operation_information, final_time_slot):
 
     """
-        Transforms machine_operation_information (a nested dictonary) into a DF with
+        Transforms machine_operation_information (columnar arrays per machine and timeslot) into a DF with
         multi-index columns, where the rows are 'Machines' and the columns are 'TimeSlot' and 'Cycle', 'State', 'Product'.
+        Only the timeslots before final_time_slot are included.
 
         Example:
 
@@ -77,27 +129,91 @@ def transform_machine_operation_information_to_df(machine_operation_information)
          ...
     """
 
-    df_time_slots = list(next(iter(machine_operation_information.values())).keys())
+    import pandas as pd # only needed for the export
+
+    machine_operation_information.ensure_time_units(final_time_slot)
+
+    df_time_slots = [f"t{i}" for i in range(final_time_slot)]
     attributes = ['Product', 'State', 'Cycle']
 
     columns = pd.MultiIndex.from_product([df_time_slots, attributes])
 
-    df_machine_operation_information = pd.DataFrame(index=machine_operation_information.keys(), columns=columns)
-
-    for machine, data in machine_operation_information.items():
+    # (machines x timeslots x attributes) cells, built from the whole arrays (one row per machine) and flattened to
+    # the order of the columns
+    machines_count = len(machine_operation_information.machines)
 
-        for time_slot, values in data.items():
-            cycle_number = values['cycle_number']
-            df_machine_operation_information.at[machine, (time_slot, 'Cycle')] = cycle_number
+    product_labels = np.array(machine_operation_information.product_labels + [None], dtype=object) # product_id -1 -> None
+    state_labels = np.array(schedule_state_labels, dtype=object)
 
-            production_flag = values['production_flag']
-            df_machine_operation_information.at[machine, (time_slot, 'State')] = production_flag
+    cells = np.empty((machines_count, final_time_slot, len(attributes)), dtype=object)
+    cells[:, :, 0] = product_labels[machine_operation_information.product_ids[:, :final_time_slot]]
+    cells[:, :, 1] = state_labels[machine_operation_information.production_flags[:, :final_time_slot]]
+    cells[:, :, 2] = machine_operation_information.cycle_numbers[:, :final_time_slot].astype(object) # python ints, like the other cells
 
-            product_label = values['product_label']
-            df_machine_operation_information.at[machine, (time_slot, 'Product')] = product_label
+    df_machine_operation_information = pd.DataFrame(cells.reshape(machines_count, -1), index=machine_operation_information.machines, columns=columns, dtype=object)
 
     return df_machine_operation_information
 
+def transform_machine_operation_information_to_long_df(machine_operation_information, final_time_slot):
+
+    """
+        Transforms machine_operation_information into a long DF, with one row per machine and timeslot (before
+        final_time_slot) and typed columns:
+            - machine: category
+            - slot: int32
+            - state: category ('Free', 'Producing', 'Maintenance', 'Unavailable')
+            - cycle: int32 (-1 under maintenance)
+            - product: category, with the product label (missing when no product is being processed)
+
+        Example:
+
+            | machine | slot | state     | cycle | product |
+            |   m1    |  0   | Free      |   1   |   NaN   |
+            |   m1    |  1   | Producing |   2   |   A0_1  |
+            ...
+    """
+
+    import pandas as pd # only needed for the export
+
+    machine_operation_information.ensure_time_units(final_time_slot)
+
+    machines_count = len(machine_operation_information.machines)
+
+    product_ids = machine_operation_information.product_ids[:, :final_time_slot].ravel()
+
+    # the same label can be used by several products (one per machine), so the categories are the unique labels
+    product_labels, product_label_codes = np.unique(np.array(machine_operation_information.product_labels, dtype=str), return_inverse=True)
+    product_codes = np.where(product_ids >= 0, product_label_codes[product_ids] if len(product_label_codes) else -1, -1)
+
+    return pd.DataFrame({
+        'machine': pd.Categorical.from_codes(np.repeat(np.arange(machines_count), final_time_slot), categories=machine_operation_information.machines),
+        'slot': np.tile(np.arange(final_time_slot, dtype=np.int32), machines_count),
+        'state': pd.Categorical.from_codes(machine_operation_information.production_flags[:, :final_time_slot].ravel(), categories=schedule_state_labels),
+        'cycle': machine_operation_information.cycle_numbers[:, :final_time_slot].ravel().astype(np.int32),
+        'product': pd.Categorical.from_codes(product_codes, categories=product_labels)
+    })
+
+def write_parquet_file(df, filename):
+    df.to_parquet(filename, index=False)
+
+def write_feather_file(df, filename):
+    df.to_feather(filename)
+
+def write_csv_file(df, filename, chunk_rows=csv_chunk_rows):
+
+    """
+        Writes a DF to a CSV file in chunks of chunk_rows rows, so that large tables aren't formatted all at once.
+    """
+
+    for chunk_start in range(0, max(len(df), 1), chunk_rows):
+        df.iloc[chunk_start:chunk_start + chunk_rows].to_csv(filename, mode='w' if chunk_start == 0 else 'a', header=chunk_start == 0, index=False)
+
+export_writers = { # long format writers: format -> (file extension, writer)
+    'parquet': ('.parquet', write_parquet_file),
+    'feather': ('.feather', write_feather_file),
+    'csv': ('.csv', write_csv_file)
+}
+
 def divide_large_excel_files(df, filename):
 
     """
@@ -112,6 +228,8 @@ def divide_large_excel_files(df, filename):
     number_of_files = math.ceil(total_columns / max_columns)
     starting_column = 0
 
+    import pandas as pd # only needed for the export
+
     # flatten in case of multi-index columns
     if isinstance(df.columns, pd.MultiIndex):
         df.columns = ['_'.join(map(str, col)).strip() for col in df.columns]
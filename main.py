@@ -4,10 +4,24 @@ import datetime
 import time
 
 from survival_function_operations import starting_survival_function_data
+from survival_function_operations import get_survival_function_cache_info
+from survival_function_operations import build_survival_threshold_index
 from simulation_operations import production_simulation
+from simulation_operations import calculate_downtime_lower_bound
+from scenario_operations import compile_scenario
+from report_operations import ReportPipeline
 from optimization_algorithm import simulated_annealing
+from optimization_algorithm import parallel_simulated_annealing
+from optimization_algorithm import parallel_tempering
+from optimization_algorithm import batch_simulated_annealing
+from optimization_algorithm import dynamic_programming_solver
 from user_input_operations import user_input_simulation_interface
 from plot_print_operations import format_duration
+from plot_print_operations import print_stats_annealing_chains
+from plot_print_operations import print_stats_tempering_replicas
+from plot_print_operations import print_stats_batch_annealing
+from plot_print_operations import print_stats_dynamic_programming
+from plot_print_operations import print_optimization_progress
 
 log_file_path = r'data/logs/production_simulation_log.log'
 logger = logging.getLogger()
@@ -15,6 +29,26 @@ logger = logging.getLogger()
 user_input_active = 0 # if the flag is set to 1, the simulation parameters can be edited directly in the terminal
                       # and the production requirements must be provided by the user
 
+annealing_chains = 1 # number of simulated annealing chains, with more than one they run in parallel (multi-start)
+annealing_workers = None # number of processes for the parallel chains (None = one per CPU)
+annealing_time_budget = None # wall-clock limit of the optimization, in seconds (None = no limit); the serial (and batch) simulated annealing
+                             # runs until it (reheating the chain if it ends before) and returns the best sequence found so far
+tempering_replicas = 0 # number of replicas of the parallel tempering optimizer, used instead of simulated annealing if greater than 1
+                       # (it also uses annealing_workers and annealing_time_budget)
+batch_annealing = 0 # if the flag is set to 1, the simulated annealing searches over batches of the same product instead of single units
+                    # (for large production requirements)
+exact_solver = 1 # if the flag is set to 1, the dynamic programming solver is used when the instance fits its memory budget (otherwise
+                 # simulated annealing), and the sequence is proven optimal when it reaches the downtime lower bound
+annealing_trace_path = None # file (.csv or .npz) where the serial simulated annealing records each iteration, e.g. r'data/logs/annealing_trace.csv'
+                            # (None = no trace)
+annealing_screening = 0 # if the flag is set to 1, the serial simulated annealing rejects the neighbors whose surrogate downtime (from the divisions of
+                        # the sequence only) can't be accepted, without simulating them
+annealing_neighbors = 1 # neighbors generated by each iteration of the serial simulated annealing (without screening): with more than one, they are
+                        # simulated together by the population evaluator and the best one is proposed (faster per neighbor from about 64)
+export_formats = None # formats of the exported production timeline: 'parquet', 'feather' and/or 'csv' (long tables, one row per machine and
+                      # timeslot), and 'excel' for the wide schedule and machine operation information tables (slower), e.g. ['csv', 'excel']
+                      # (None = default_export_formats of file_operations)
+
 def main():
 
     logging.basicConfig(filename=log_file_path, level=logging.INFO, format='%(message)s' )
@@ -84,17 +118,89 @@ def main():
 
     for m in operating_machines_list: starting_survival_function_data(m, survival_dict)
 
-    #  turn the production requirements into an initial random production sequence
+    build_survival_threshold_index(operating_machines_list, [s_maintenance_min, s_maintenance_max], survival_dict) # the thresholds are fixed for the whole run
+
+    # integer IDs of the products and machines, and their cycle matrix, used by the simulation and the optimization
+    scenario = compile_scenario(operating_machines_list, product_machine_cycles_mapping_dict, production_requirements_dict)
+
+    #  turn the production requirements into an initial random production sequence (of product IDs)
     initial_sequence = [product for product, count in production_requirements_dict.items() for _ in range(count)]
     random.shuffle(initial_sequence)
+    initial_sequence = scenario.encode_sequence(initial_sequence)
+
+    # the optimization stops if it reaches this downtime, since no sequence can have less
+    downtime_lower_bound, machine_min_maintenance_counts = calculate_downtime_lower_bound(scenario, initial_sequence, initial_cycles, maintenance_duration,
+                                                                                          s_maintenance_max, survival_dict)
+
+    print('\nDowntime Lower Bound:', downtime_lower_bound*cycle_duration, 'cycles (minimum maintenances per machine:', machine_min_maintenance_counts, ')')
+    logger.info(f'DOWNTIME LOWER BOUND: {downtime_lower_bound*cycle_duration} cycles (minimum maintenances per machine: {machine_min_maintenance_counts})')
+    logger.info(' ')
 
     start_time_simulation = time.time()
-    optimized_sequence, optimized_downtime, best_maintenance_intervals = simulated_annealing(initial_sequence,operating_machines_list,
-                                                                                             product_machine_cycles_mapping_dict,
-                                                                                             maintenance_duration,s_maintenance_min,
-                                                                                             s_maintenance_max,
-                                                                                             survival_dict,initial_cycles,
-                                                                                             production_requirements_dict)
+
+    if tempering_replicas > 1:
+
+        optimized_sequence, optimized_downtime, best_maintenance_intervals, replica_statistics = parallel_tempering(initial_sequence, scenario,
+                                                                                                                   maintenance_duration, s_maintenance_min,
+                                                                                                                   s_maintenance_max,
+                                                                                                                   survival_dict, initial_cycles,
+                                                                                                                   production_requirements_dict,
+                                                                                                                   tempering_replicas, annealing_workers,
+                                                                                                                   annealing_time_budget,
+                                                                                                                   progress_callback=print_optimization_progress)
+
+        print_stats_tempering_replicas(replica_statistics, logger)
+
+    elif batch_annealing == 1:
+
+        optimized_sequence, optimized_downtime, best_maintenance_intervals, chain_statistics = batch_simulated_annealing(initial_sequence, scenario,
+                                                                                                                        maintenance_duration, s_maintenance_min,
+                                                                                                                        s_maintenance_max,
+                                                                                                                        survival_dict, initial_cycles,
+                                                                                                                        production_requirements_dict,
+                                                                                                                        time_budget=annealing_time_budget,
+                                                                                                                        progress_callback=print_optimization_progress)
+
+        print_stats_batch_annealing(chain_statistics, logger)
+
+    elif annealing_chains > 1:
+
+        optimized_sequence, optimized_downtime, best_maintenance_intervals, chain_statistics = parallel_simulated_annealing(initial_sequence, scenario,
+                                                                                                                           maintenance_duration, s_maintenance_min,
+                                                                                                                           s_maintenance_max,
+                                                                                                                           survival_dict, initial_cycles,
+                                                                                                                           production_requirements_dict,
+                                                                                                                           annealing_chains, annealing_workers,
+                                                                                                                           annealing_time_budget,
+                                                                                                                           progress_callback=print_optimization_progress)
+
+        print_stats_annealing_chains(chain_statistics, logger)
+
+    elif exact_solver == 1:
+
+        optimized_sequence, optimized_downtime, best_maintenance_intervals, solver_statistics = dynamic_programming_solver(initial_sequence, scenario,
+                                                                                                                          maintenance_duration, s_maintenance_min,
+                                                                                                                          s_maintenance_max,
+                                                                                                                          survival_dict, initial_cycles,
+                                                                                                                          production_requirements_dict,
+                                                                                                                          time_budget=annealing_time_budget,
+                                                                                                                          progress_callback=print_optimization_progress,
+                                                                                                                          trace_path=annealing_trace_path,
+                                                                                                                          screening=annealing_screening == 1,
+                                                                                                                          neighbors_per_iteration=annealing_neighbors)
+
+        print_stats_dynamic_programming(solver_statistics, logger)
+
+    else:
+
+        optimized_sequence, optimized_downtime, best_maintenance_intervals = simulated_annealing(initial_sequence,scenario,
+                                                                                                 maintenance_duration,s_maintenance_min,
+                                                                                                 s_maintenance_max,
+                                                                                                 survival_dict,initial_cycles,
+                                                                                                 production_requirements_dict,
+                                                                                                 annealing_time_budget, print_optimization_progress,
+                                                                                                 trace_path=annealing_trace_path, screening=annealing_screening == 1,
+                                                                                                 neighbors_per_iteration=annealing_neighbors)
 
     simulation_duration = round(time.time() - start_time_simulation, 2)
 
@@ -106,16 +212,24 @@ def main():
     logger.info(f'OPTIMIZATION AND SIMULATION DURATION: {format_duration(simulation_duration)}')
     logger.info(' ')
 
-    print("\n   Optimal Production Sequence:", optimized_sequence)
+    print("\n   Optimal Production Sequence:", scenario.decode_sequence(optimized_sequence))
     print("   Suggested Intervals to Schedule Maintenance to Reduce Downtime:", best_maintenance_intervals)
     print("   Total Downtime:", optimized_downtime*cycle_duration, 'cycles')
 
-    _,_ =  production_simulation(production_requirements_dict, optimized_sequence, operating_machines_list,
-                          initial_cycles, product_machine_cycles_mapping_dict, maintenance_duration,
-                          s_maintenance_min, s_maintenance_max, survival_dict, logger, optimized_sequence)
+    with ReportPipeline() as report_pipeline: # the export and the plot run in the background (the pipeline is shut down even if they fail)
+
+        _, _, report_handle =  production_simulation(production_requirements_dict, optimized_sequence, scenario,
+                              initial_cycles, maintenance_duration,
+                              s_maintenance_min, s_maintenance_max, survival_dict, logger, optimized_sequence, export_formats,
+                              report_pipeline)
+
+        survival_function_cache_info = get_survival_function_cache_info()
+        logger.info(f'SURVIVAL FUNCTION FITS: {survival_function_cache_info["misses"]} fitted, {survival_function_cache_info["hits"]} cache hits')
+        logger.info(' ')
 
-    print(f"Logged simulation statistics in {log_file_path}.")
+        print(f"Logged simulation statistics in {log_file_path}.")
 
+        report_handle.wait() # raises the errors of the reports, if any
 
 if __name__ == '__main__':
     main()
@@ -1,79 +1,1145 @@
 import random
 import math
+import sys
+import time
 
-from simulation_operations import production_simulation
+import numpy as np
 
-def simulated_annealing(initial_sequence, operating_machines_list, product_machine_cycles_mapping_dict, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict, initial_cycles, production_requirements_dict):
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
-    print('\nOptimization with Simulated Annealing...')
+from simulation_operations import evaluate_production_sequence_incrementally
+from simulation_operations import evaluate_production_sequences
+from simulation_operations import calculate_downtime_lower_bound
+from simulation_operations import estimate_production_sequence_downtime
+from batch_sequence_operations import batch_moves
+from batch_sequence_operations import create_batch_sequence
+from batch_sequence_operations import expand_batch_sequence
+from batch_sequence_operations import generate_batch_neighbor
+from dynamic_programming_operations import dynamic_programming_memory_budget
+from dynamic_programming_operations import calculate_segment_capacities
+from dynamic_programming_operations import estimate_dynamic_programming_memory
+from dynamic_programming_operations import pack_production_segments
+from dynamic_programming_operations import build_segment_sequence
+from survival_function_operations import build_survival_threshold_index
+
+# SA parameters
+initial_temperature = 1000
+min_temperature = 0.1
+cooling_factor = 0.95
+max_iterations = 5000
+max_stagnation = 100  # max iterations without finding a new sequence
+progress_interval = 1.0 # seconds between two calls of the progress callback of the optimizers
+fitness_cache_size = 100000 # max number of tested sequences whose downtime is kept by each chain (the least recently used are evicted)
+zobrist_seed = 0 # seed of the random keys of the Zobrist fingerprints (the same for all the chains)
+screening_audit_interval = 20 # one of this number of neighbors rejected by the surrogate screening is simulated anyway, to measure its false rejections
+
+# parallel tempering parameters
+tempering_min_temperature = 0.5 # temperatures of the coldest and hottest replicas (the others are spaced geometrically)
+tempering_max_temperature = 100
+
+# batch simulated annealing parameters
+initial_batch_size = 6 # max number of units of the batches of the initial batch sequence
+
+annealing_worker_scenario = None # scenario of the chains run by this process, when it is a worker of parallel_simulated_annealing
+annealing_worker_caches = {} # fitness caches of the chains run by this process, by chain index (they stay in the worker between the rounds)
+
+def create_annealing_scenario(initial_sequence, compiled_scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict, initial_cycles):
+
+    """
+        Groups the simulation parameters needed to evaluate the sequences of an annealing chain, the Zobrist keys of
+        the sequences with the length of initial_sequence, and the downtime lower bound of its products (computed once,
+        the chains stop as soon as they reach it).
+    """
+
+    downtime_lower_bound, _ = calculate_downtime_lower_bound(compiled_scenario, initial_sequence, initial_cycles, maintenance_duration, s_maintenance_max, survival_dict)
+
+    return {
+        'compiled_scenario': compiled_scenario,
+        'zobrist_table': create_zobrist_table(len(initial_sequence), len(compiled_scenario.products)),
+        'downtime_lower_bound': downtime_lower_bound,
+        'maintenance_duration': maintenance_duration,
+        's_maintenance_min': s_maintenance_min,
+        's_maintenance_max': s_maintenance_max,
+        'survival_dict': survival_dict,
+        'initial_cycles': initial_cycles
+    }
+
+def evaluate_annealing_sequence(production_sequence, scenario, reference_evaluation=None, changed_positions=None):
+
+    return evaluate_production_sequence_incrementally(production_sequence, scenario['compiled_scenario'], scenario['initial_cycles'], scenario['maintenance_duration'],
+                                                      scenario['s_maintenance_min'], scenario['s_maintenance_max'], scenario['survival_dict'],
+                                                      reference_evaluation=reference_evaluation, changed_positions=changed_positions)
+
+def evaluate_annealing_sequences(production_sequences, scenario):
+
+    """
+        Evaluates the production sequences (list of arrays with the same length) with one call of the population
+        evaluator, and returns the evaluation of each one, without checkpoints (the downtime of a sequence that can't be
+        completed is inf).
+    """
+
+    scheduled_maintenance_intervals, total_downtimes, final_time_slots = evaluate_production_sequences(np.array(production_sequences), scenario['compiled_scenario'], scenario['initial_cycles'],
+                                                                                                       scenario['maintenance_duration'], scenario['s_maintenance_min'],
+                                                                                                       scenario['s_maintenance_max'], scenario['survival_dict'])
+
+    return [
+        {
+            'scheduled_maintenance_intervals': maintenance_intervals,
+            'total_downtime': total_downtime if math.isinf(total_downtime) else int(total_downtime),
+            'final_time_slot': final_time_slot
+        }
+        for maintenance_intervals, total_downtime, final_time_slot in zip(scheduled_maintenance_intervals, total_downtimes.tolist(), final_time_slots.tolist())
+    ]
+
+def estimate_annealing_sequence(production_sequence, scenario, reference_evaluation, changed_positions):
+
+    return estimate_production_sequence_downtime(production_sequence, scenario['compiled_scenario'], scenario['initial_cycles'], scenario['maintenance_duration'],
+                                                 scenario['s_maintenance_min'], scenario['s_maintenance_max'], scenario['survival_dict'],
+                                                 reference_evaluation, changed_positions)
+
+def create_zobrist_table(sequence_length, products_count, seed=zobrist_seed):
+
+    """
+        Random 64-bit key of each (position, product ID) pair, for the Zobrist fingerprints of the sequences.
+    """
+
+    return np.random.default_rng(seed).integers(0, 2**64, size=(sequence_length, products_count), dtype=np.uint64, endpoint=False)
+
+def zobrist_key(production_sequence, scenario):
+
+    """
+        Zobrist fingerprint of a production sequence: the XOR of the keys of the product at each position.
+    """
+
+    return int(np.bitwise_xor.reduce(scenario['zobrist_table'][np.arange(len(production_sequence)), production_sequence]))
+
+def update_zobrist_key(key, scenario, changed_positions, production_sequence, new_production_sequence):
+
+    """
+        Zobrist fingerprint of new_production_sequence, given the key of production_sequence and the positions where
+        they differ: each changed position replaces the key of its old product by the key of the new one, so a swap
+        of products costs O(1) instead of hashing the whole sequence.
+    """
+
+    zobrist_table = scenario['zobrist_table']
+
+    for position in changed_positions:
+        key ^= int(zobrist_table[position, production_sequence[position]]) ^ int(zobrist_table[position, new_production_sequence[position]])
+
+    return key
+
+
+class FitnessCache:
+
+    """
+        Downtime of the tested sequences, keyed by their Zobrist fingerprint, with at most max_size entries (None for
+        no limit): when it is full, the least recently used sequence is evicted.
+    """
+
+    def __init__(self, max_size):
+
+        self.max_size = max_size
+        self.downtimes = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+
+        return key in self.downtimes
+
+    def __len__(self):
+
+        return len(self.downtimes)
+
+    def get(self, key):
+
+        """
+            Returns the downtime of the sequence with this key, or None if it isn't in the cache.
+        """
+
+        downtime = self.downtimes.get(key)
+
+        if downtime is None:
+            self.misses += 1
+            return None
+
+        self.downtimes.move_to_end(key)
+        self.hits += 1
+
+        return downtime
+
+    def put(self, key, downtime):
+
+        self.downtimes[key] = downtime
+        self.downtimes.move_to_end(key)
+
+        if self.max_size is not None and len(self.downtimes) > self.max_size:
+            self.downtimes.popitem(last=False)
+            self.evictions += 1
+
+
+class AnnealingTrace:
+
+    """
+        Per-iteration trace of an annealing chain, buffered in a preallocated NumPy structured array (one field per
+        column) and saved at the end as a CSV or .npz file. The columns of each iteration are: iteration, temperature,
+        current and best downtime (after the iteration), if the neighbor was accepted, if its downtime came from the
+        fitness cache, if it was rejected by the surrogate screening (without simulation), the evaluation time of the neighbor (in seconds) and the stagnation count.
+    """
+
+    columns = (
+        ('iteration', np.int64, '%d'),
+        ('temperature', np.float64, '%.6g'),
+        ('downtime', np.int64, '%d'),
+        ('best_downtime', np.int64, '%d'),
+        ('accepted', np.bool_, '%d'),
+        ('cache_hit', np.bool_, '%d'),
+        ('screened', np.bool_, '%d'),
+        ('evaluation_time', np.float64, '%.6g'),
+        ('stagnation_count', np.int64, '%d')
+    )
+
+    def __init__(self, capacity=max_iterations):
+
+        self.size = 0
+        self.stop_reason = None
+        self.rows = np.zeros(max(capacity, 1), dtype=[(name, dtype) for name, dtype, _ in self.columns])
+
+    def record(self, iteration, temperature, downtime, best_downtime, accepted, cache_hit, screened, evaluation_time, stagnation_count):
+
+        if self.size == len(self.rows): # without max_iterations (anytime mode) the buffer grows when it's full
+            self.rows = np.concatenate([self.rows, np.zeros_like(self.rows)])
+
+        self.rows[self.size] = (iteration, temperature, downtime, best_downtime, accepted, cache_hit, screened, evaluation_time, stagnation_count)
+        self.size += 1
+
+    def save(self, trace_path):
+
+        """
+            Saves the recorded iterations as a .npz file (one array per column, plus the stop_reason of the chain) or,
+            for any other extension, as a CSV file.
+        """
+
+        rows = self.rows[:self.size]
+
+        if trace_path.endswith('.npz'):
+            np.savez(trace_path, stop_reason=np.array(str(self.stop_reason)), **{name: rows[name] for name, _, _ in self.columns})
+
+        else:
+            np.savetxt(trace_path, rows, fmt=[column_format for _, _, column_format in self.columns], delimiter=',',
+                       header=','.join(name for name, _, _ in self.columns), comments='')
+
+
+def create_annealing_chain(initial_sequence, rng, chain_index=0, seed=None, temperature=initial_temperature, chain_cooling_factor=cooling_factor,
+                           chain_max_stagnation=max_stagnation, initial_batch_sequence=None, chain_max_iterations=max_iterations, screening=False,
+                           neighbors_per_iteration=1):
+
+    """
+        Creates the state of a simulated annealing chain that starts from initial_sequence (array of product IDs of the
+        CompiledScenario) and draws its random numbers from rng (a random.Random, or the random module itself). The
+        state is updated by run_annealing_chain, and can be sent to another process between two runs.
+
+        With chain_cooling_factor = 1 the chain runs at a fixed temperature (and min_temperature doesn't stop it), and
+        with chain_max_stagnation = None (or chain_max_iterations = None) it doesn't stop on stagnation (or after a
+        number of iterations).
+
+        With an initial_batch_sequence (list of (product ID, count) batches, see batch_sequence_operations) the chain
+        searches over batch sequences with the batch_moves instead of swapping single units, and initial_sequence is
+        ignored (the sequence of the chain is always the expansion of its batch sequence).
+
+        With screening (only for the chains that swap single units), the Metropolis random number of each iteration is
+        drawn before the evaluation of the neighbor, and the neighbors whose surrogate downtime (see
+        estimate_production_sequence_downtime) would be rejected with it aren't simulated. One of screening_audit_interval of
+        these neighbors is simulated anyway, to count the false rejections (neighbors that would have been accepted).
+
+        With neighbors_per_iteration > 1 (only for the chains that swap single units, without screening), each
+        iteration generates this number of neighbors, scores the ones that aren't cached with one call of
+        evaluate_production_sequences, and proposes the best one to the Metropolis criterion.
+    """
+
+    if initial_batch_sequence is not None:
+        initial_sequence = expand_batch_sequence(initial_batch_sequence)
+
+    return {
+        'chain_index': chain_index,
+        'seed': seed,
+        'rng': rng,
+
+        'sequence': initial_sequence,
+        'evaluation': None, # evaluation of the current sequence, computed when the chain runs
+        'downtime': None,
+        'maintenance_intervals': None, # maintenance intervals of the last sequence that improved the downtime
+        'temperature': temperature,
+        'cooling_factor': chain_cooling_factor,
+        'max_stagnation': chain_max_stagnation,
+        'max_iterations': chain_max_iterations,
+        'iteration': 0,
+        'stagnation_count': 0,
+        'batch_sequence': initial_batch_sequence, # None when the chain swaps single units
+        'sequence_key': None, # Zobrist fingerprint of the current sequence (or the batch sequence), computed with its evaluation
+        'fitness_cache': FitnessCache(fitness_cache_size), # downtime of the already tested sequences (None while the chain is sent between processes)
+        'screening': screening and initial_batch_sequence is None,
+        'neighbors_per_iteration': neighbors_per_iteration if initial_batch_sequence is None and not screening else 1,
+        'stop_reason': None, # set when the chain ends
+
+        'best_sequence': initial_sequence,
+        'best_batch_sequence': initial_batch_sequence,
+        'best_downtime': None,
+        'best_maintenance_intervals': None,
+
+        # statistics
+        'evaluations': 0,
+        'accepted_moves': 0,
+        'improvements': 0,
+        'cache_hits': 0,
+        'shared_best_adoptions': 0,
+        'reheats': 0,
+        'swap_attempts': 0,
+        'swaps': 0,
+        'move_attempts': dict.fromkeys(batch_moves, 0), # of the batch sequences
+        'accepted_batch_moves': dict.fromkeys(batch_moves, 0),
+        'screened_rejections': 0, # neighbors rejected by the surrogate screening without simulation
+        'screening_audits': 0, # neighbors rejected by the surrogate screening and simulated anyway
+        'screening_false_rejections': 0, # audited neighbors that were accepted
+        'run_time': 0.0,
+        'next_progress_time': 0.0, # time.time() value of the next call of the progress callback
+        'trace': None # AnnealingTrace, if the iterations are traced
+    }
+
+def annealing_progress(iteration, best_downtime, evaluations, elapsed_time):
 
-    # SA parameters
-    current_sequence = initial_sequence
-    current_temp = 1000
-    min_temp = 0.1
-    alpha = 0.95  # cooling factor
-    max_iterations = 5000
+    """
+        Progress of an optimization, for the progress callbacks: iteration, best downtime found so far, evaluated
+        sequences, evaluations per second and elapsed time (in seconds).
+    """
 
-    tested_sequences = set() # to store already tested sequences
-    tested_sequences.add(tuple(current_sequence))
+    return {
+        'iteration': iteration,
+        'best_downtime': best_downtime,
+        'evaluations': evaluations,
+        'evaluations_per_second': evaluations / elapsed_time if elapsed_time > 0 else 0.0,
+        'elapsed_time': elapsed_time
+    }
 
-    current_best_maintenance_intervals, current_downtime = production_simulation(production_requirements_dict, current_sequence, operating_machines_list,
-                                                                                 initial_cycles, product_machine_cycles_mapping_dict, maintenance_duration,
-                                                                                 s_maintenance_min, s_maintenance_max, survival_dict, logger=None, optimized_sequence=None)
+def score_annealing_neighbors(chain, scenario, current_sequence):
 
-    stagnation_count = 0 # counter for stagnation
-    max_stagnation = 100  # max iterations without finding a new sequence
+    """
+        Generates chain['neighbors_per_iteration'] neighbors of current_sequence (4 products swapped), scores the ones
+        that aren't in the fitness cache with one call of evaluate_annealing_sequences, and returns the best neighbor:
+        its sequence, changed positions, Zobrist key, downtime, evaluation (None if its downtime came from the cache)
+        and if it was cached. A neighbor that can't be completed has an inf downtime, so it's never the one proposed
+        (unless they all are, and then it's rejected).
+    """
 
-    for iteration in range(max_iterations):
+    rng = chain['rng']
+    fitness_cache = chain['fitness_cache']
 
-        if current_temp < min_temp:
+    neighbors = []
+
+    for _ in range(chain['neighbors_per_iteration']):
+
+        i, j, w, k = rng.sample(range(len(current_sequence)), 4)
+        neighbor_sequence = current_sequence.copy()
+        neighbor_sequence[[i, j, w, k]] = current_sequence[[k, w, i, j]]
+
+        changed_positions = [position for position in (i, j, w, k) if neighbor_sequence[position] != current_sequence[position]]
+        neighbors.append((neighbor_sequence, changed_positions, update_zobrist_key(chain['sequence_key'], scenario, changed_positions, current_sequence, neighbor_sequence)))
+
+    neighbor_downtimes = {} # by Zobrist key (the same neighbor can be generated twice)
+    neighbor_evaluations = {}
+    cached_keys = set()
+    scored_neighbors = []
+
+    for neighbor_sequence, _, neighbor_key in neighbors:
+
+        if neighbor_key in neighbor_downtimes:
+            continue
+
+        neighbor_downtime = fitness_cache.get(neighbor_key)
+
+        if neighbor_downtime is None:
+            neighbor_downtimes[neighbor_key] = None
+            scored_neighbors.append((neighbor_key, neighbor_sequence))
+
+        else:
+            neighbor_downtimes[neighbor_key] = neighbor_downtime
+            cached_keys.add(neighbor_key)
+            chain['cache_hits'] += 1
+
+    if scored_neighbors:
+
+        for (neighbor_key, _), neighbor_evaluation in zip(scored_neighbors, evaluate_annealing_sequences([neighbor_sequence for _, neighbor_sequence in scored_neighbors], scenario)):
+            neighbor_downtimes[neighbor_key] = neighbor_evaluation['total_downtime']
+            neighbor_evaluations[neighbor_key] = neighbor_evaluation
+            fitness_cache.put(neighbor_key, neighbor_evaluation['total_downtime'])
+
+        chain['evaluations'] += len(scored_neighbors)
+
+    neighbor_sequence, changed_positions, neighbor_key = min(neighbors, key=lambda neighbor: neighbor_downtimes[neighbor[2]])
+
+    return neighbor_sequence, changed_positions, neighbor_key, neighbor_downtimes[neighbor_key], neighbor_evaluations.get(neighbor_key), neighbor_key in cached_keys
+
+def run_annealing_chain(chain, scenario, iterations, deadline=None, progress_callback=None, chain_progress_interval=progress_interval, cancel_event=None):
+
+    """
+        Runs up to iterations iterations of a simulated annealing chain (or until the deadline, a time.time() value),
+        and returns its updated state. chain['stop_reason'] is set when the chain ends: 'lower bound' (its best
+        sequence reached the downtime lower bound of the scenario, so it can't be improved), 'cancelled' (the
+        cancel_event, a threading.Event, was set by another thread), 'min temperature', 'stagnation', 'max iterations'
+        or 'time budget'.
+
+        If a progress_callback is given, it is called every chain_progress_interval seconds with the annealing_progress
+        of the chain, and if the chain has a trace each iteration is recorded in it.
+    """
+
+    run_start_time = time.time()
+    rng = chain['rng']
+    trace = chain['trace']
+
+    if chain['evaluation'] is None:
+
+        # the evaluation of the current sequence keeps the simulation checkpoints, so that its neighbors are evaluated
+        # by resuming the simulation before the first swapped product instead of simulating them from the start
+        chain['evaluation'] = evaluate_annealing_sequence(chain['sequence'], scenario)
+        chain['downtime'] = chain['evaluation']['total_downtime']
+        chain['evaluations'] += 1
+
+        chain['sequence_key'] = zobrist_key(chain['sequence'], scenario) if chain['batch_sequence'] is None else tuple(chain['batch_sequence'])
+        chain['fitness_cache'].put(chain['sequence_key'], chain['downtime'])
+
+        if chain['maintenance_intervals'] is None:
+            chain['maintenance_intervals'] = chain['evaluation']['scheduled_maintenance_intervals']
+
+        if chain['best_downtime'] is None or chain['downtime'] < chain['best_downtime']:
+            chain['best_sequence'] = chain['sequence']
+            chain['best_batch_sequence'] = chain['batch_sequence']
+            chain['best_downtime'] = chain['downtime']
+            chain['best_maintenance_intervals'] = chain['evaluation']['scheduled_maintenance_intervals']
+
+    current_sequence = chain['sequence']
+    fitness_cache = chain['fitness_cache']
+
+    for _ in range(iterations):
+
+        if chain['best_downtime'] <= scenario['downtime_lower_bound']:
+            chain['stop_reason'] = 'lower bound'
             break
 
-        # generate a neighboring solution by swapping 4 products in the sequence
-        neighbor_sequence = current_sequence[:]
-        i, j, w, k = random.sample(range(len(current_sequence)), 4)
-        neighbor_sequence[i], neighbor_sequence[j], neighbor_sequence[w], neighbor_sequence[k] = neighbor_sequence[k], neighbor_sequence[w], neighbor_sequence[i], neighbor_sequence[j]
+        if cancel_event is not None and cancel_event.is_set():
+            chain['stop_reason'] = 'cancelled'
+            break
 
-        neighbor_tuple = tuple(neighbor_sequence)
+        if chain['max_iterations'] is not None and chain['iteration'] >= chain['max_iterations']:
+            chain['stop_reason'] = 'max iterations'
+            break
 
-        if neighbor_tuple in tested_sequences:
-            continue # skip this neighbor if it has already been tested
+        if chain['cooling_factor'] < 1 and chain['temperature'] < min_temperature:
+            chain['stop_reason'] = 'min temperature'
+            break
 
-        # print(f'\nSequence {neighbor_sequence}')
+        if deadline is not None and time.time() >= deadline:
+            chain['stop_reason'] = 'time budget'
+            break
 
-        tested_sequences.add(neighbor_tuple)
+        chain['iteration'] += 1
 
-        # print(' Simulating...')
-        neighbor_best_maintenance_intervals, neighbor_downtime = production_simulation(production_requirements_dict, neighbor_sequence, operating_machines_list,
-                                                                                       initial_cycles, product_machine_cycles_mapping_dict, maintenance_duration,
-                                                                                       s_maintenance_min, s_maintenance_max, survival_dict, logger=None, optimized_sequence=None)
+        if chain['batch_sequence'] is None and chain['neighbors_per_iteration'] == 1:
 
-        # print(f'    Downtime: {neighbor_downtime}, Maintenance Intervals: {neighbor_best_maintenance_intervals}')
+            # generate a neighboring solution by swapping 4 products in the sequence
+            i, j, w, k = rng.sample(range(len(current_sequence)), 4)
+            neighbor_sequence = current_sequence.copy()
+            neighbor_sequence[[i, j, w, k]] = current_sequence[[k, w, i, j]]
 
-        if neighbor_downtime < current_downtime:
-            current_sequence = neighbor_sequence
-            current_downtime = neighbor_downtime
-            current_best_maintenance_intervals = neighbor_best_maintenance_intervals
-            stagnation_count = 0  # reset stagnation count since a better sequence was found
+            changed_positions = [position for position in (i, j, w, k) if neighbor_sequence[position] != current_sequence[position]]
+            neighbor_key = update_zobrist_key(chain['sequence_key'], scenario, changed_positions, current_sequence, neighbor_sequence)
+
+        elif chain['batch_sequence'] is not None:
+
+            # generate a neighboring batch sequence, keyed by its batches, and evaluate its expansion from the first to
+            # the last unit that changed
+            neighbor_batch_sequence, batch_move = generate_batch_neighbor(chain['batch_sequence'], rng)
+            neighbor_sequence = expand_batch_sequence(neighbor_batch_sequence)
+            chain['move_attempts'][batch_move] += 1
+
+            changed_positions = np.flatnonzero(neighbor_sequence != current_sequence)
+            changed_positions = [int(changed_positions[0]), int(changed_positions[-1])] if len(changed_positions) else []
+            neighbor_key = tuple(neighbor_batch_sequence)
+
+        if trace is not None:
+            evaluation_start_time = time.perf_counter()
+
+        # a sequence that was already tested is answered by the cache, and only simulated again if the chain moves to it
+        neighbor_evaluation = None
+        neighbor_screened = False
+        neighbor_audited = False
+
+        if chain['neighbors_per_iteration'] > 1:
+            neighbor_sequence, changed_positions, neighbor_key, neighbor_downtime, neighbor_evaluation, neighbor_cached = score_annealing_neighbors(chain, scenario, current_sequence)
 
         else:
-            delta = current_downtime - neighbor_downtime
-            acceptance_probability = math.exp(delta / current_temp)
+            neighbor_downtime = fitness_cache.get(neighbor_key)
+            neighbor_cached = neighbor_downtime is not None
 
-            if random.random() < acceptance_probability:
-                current_sequence = neighbor_sequence
-                current_downtime = neighbor_downtime
-                stagnation_count = 0
+        if chain['screening']:
 
-        if neighbor_tuple not in tested_sequences:
-            stagnation_count = 0
+            acceptance_random = rng.random() # drawn before the evaluation, so that the surrogate can be screened with it
+
+            if neighbor_downtime is None and changed_positions:
+
+                estimated_downtime = estimate_annealing_sequence(neighbor_sequence, scenario, chain['evaluation'], changed_positions)
+
+                if estimated_downtime is not None and estimated_downtime > chain['downtime'] and acceptance_random >= math.exp((chain['downtime'] - estimated_downtime) / chain['temperature']):
+
+                    chain['screened_rejections'] += 1
+
+                    if chain['screened_rejections'] % screening_audit_interval == 0:
+                        chain['screening_audits'] += 1
+                        neighbor_audited = True
+
+                    else:
+                        neighbor_screened = True
+
+        if neighbor_screened:
+            neighbor_accepted = False
+
+        elif neighbor_downtime is None:
+            neighbor_evaluation = evaluate_annealing_sequence(neighbor_sequence, scenario, reference_evaluation=chain['evaluation'], changed_positions=changed_positions)
+            neighbor_downtime = neighbor_evaluation['total_downtime']
+            chain['evaluations'] += 1
+
+            fitness_cache.put(neighbor_key, neighbor_downtime)
+
+        elif chain['neighbors_per_iteration'] == 1: # the neighbors scored together are counted by score_annealing_neighbors
+            chain['cache_hits'] += 1
+
+        if not neighbor_screened:
+
+            neighbor_improves = neighbor_downtime < chain['downtime']
+
+            if not neighbor_improves:
+                delta = chain['downtime'] - neighbor_downtime
+                acceptance_probability = math.exp(delta / chain['temperature'])
+
+            if chain['screening']:
+                neighbor_accepted = neighbor_improves or acceptance_random < acceptance_probability
+            else:
+                neighbor_accepted = neighbor_improves or rng.random() < acceptance_probability
+
+            if neighbor_audited and neighbor_accepted:
+                chain['screening_false_rejections'] += 1
+
+        if neighbor_accepted:
+
+            if neighbor_evaluation is None and chain['neighbors_per_iteration'] > 1: # the scored neighbors don't need checkpoints
+                neighbor_evaluation = evaluate_annealing_sequences([neighbor_sequence], scenario)[0]
+                chain['evaluations'] += 1
+
+            elif neighbor_evaluation is None: # the checkpoints of the current sequence are needed to evaluate its neighbors
+                neighbor_evaluation = evaluate_annealing_sequence(neighbor_sequence, scenario, reference_evaluation=chain['evaluation'], changed_positions=changed_positions)
+                chain['evaluations'] += 1
+
+            current_sequence = neighbor_sequence
+            chain['sequence_key'] = neighbor_key
+            if chain['batch_sequence'] is not None:
+                chain['batch_sequence'] = neighbor_batch_sequence
+                chain['accepted_batch_moves'][batch_move] += 1
+            chain['downtime'] = neighbor_downtime
+            chain['evaluation'] = neighbor_evaluation
+            chain['stagnation_count'] = 0  # reset stagnation count since a new sequence was accepted
+            chain['accepted_moves'] += 1
+
+            if neighbor_improves:
+                neighbor_best_maintenance_intervals = neighbor_evaluation['scheduled_maintenance_intervals']
+
+                chain['maintenance_intervals'] = neighbor_best_maintenance_intervals
+                chain['improvements'] += 1
+
+                if neighbor_downtime < chain['best_downtime']:
+                    chain['best_sequence'] = neighbor_sequence
+                    chain['best_batch_sequence'] = chain['batch_sequence']
+                    chain['best_downtime'] = neighbor_downtime
+                    chain['best_maintenance_intervals'] = neighbor_best_maintenance_intervals
+
+        if neighbor_key not in fitness_cache and not neighbor_screened:
+            chain['stagnation_count'] = 0
 
         else: # if this sequence has already been tested, increase the stagnation
-            stagnation_count += 1
+            chain['stagnation_count'] += 1
 
-        if stagnation_count >= max_stagnation:
+        if trace is not None:
+            trace.record(chain['iteration'], chain['temperature'], chain['downtime'], chain['best_downtime'], neighbor_accepted, neighbor_cached, neighbor_screened,
+                         time.perf_counter() - evaluation_start_time, chain['stagnation_count'])
+
+        if chain['max_stagnation'] is not None and chain['stagnation_count'] >= chain['max_stagnation']:
+            chain['stop_reason'] = 'stagnation'
             break
 
-        current_temp *= alpha
+        chain['temperature'] *= chain['cooling_factor']
+
+        if progress_callback is not None:
+
+            now = time.time()
+
+            if now >= chain['next_progress_time']:
+                progress_callback(annealing_progress(chain['iteration'], chain['best_downtime'], chain['evaluations'], chain['run_time'] + now - run_start_time))
+                chain['next_progress_time'] = now + chain_progress_interval
+
+    chain['sequence'] = current_sequence
+    chain['run_time'] += time.time() - run_start_time
+
+    if trace is not None:
+        trace.stop_reason = chain['stop_reason']
+
+    return chain
+
+def reheat_annealing_chain(chain):
+
+    """
+        Restarts an ended chain from its best sequence, at the initial temperature (the sequence is evaluated again
+        with checkpoints when the chain runs).
+    """
+
+    chain['sequence'] = chain['best_sequence']
+    chain['batch_sequence'] = chain['best_batch_sequence']
+    chain['evaluation'] = None
+    chain['downtime'] = chain['best_downtime']
+    chain['maintenance_intervals'] = chain['best_maintenance_intervals']
+    chain['temperature'] = initial_temperature
+    chain['stagnation_count'] = 0
+    chain['stop_reason'] = None
+    chain['reheats'] += 1
+
+def adopt_sequence(chain, production_sequence, downtime, maintenance_intervals):
+
+    """
+        Moves a chain to another sequence (the best one found by all the chains), which is evaluated again with
+        checkpoints when the chain runs.
+    """
+
+    chain['sequence'] = production_sequence
+    chain['evaluation'] = None
+    chain['downtime'] = downtime
+    chain['maintenance_intervals'] = maintenance_intervals
+    chain['shared_best_adoptions'] += 1
+
+def annealing_chain_statistics(chain):
+
+    """
+        Summary of a chain run, for the logs.
+    """
+
+    return {
+        'chain': chain['chain_index'],
+        'seed': chain['seed'],
+        'best_downtime': chain['best_downtime'],
+        'iterations': chain['iteration'],
+        'evaluations': chain['evaluations'],
+        'accepted_moves': chain['accepted_moves'],
+        'improvements': chain['improvements'],
+        'cache_hits': chain['cache_hits'],
+        'shared_best_adoptions': chain['shared_best_adoptions'],
+        'reheats': chain['reheats'],
+        'screened_rejections': chain['screened_rejections'],
+        'screening_audits': chain['screening_audits'],
+        'screening_false_rejections': chain['screening_false_rejections'],
+        'final_temperature': chain['temperature'],
+        'run_time': chain['run_time'],
+        'stop_reason': chain['stop_reason']
+    }
+
+def save_annealing_trace(chain, trace_path):
+
+    if trace_path is None or chain['trace'] is None:
+        return
+
+    chain['trace'].save(trace_path)
+    print(f'   Annealing trace ({chain["trace"].size} iterations) saved to {trace_path}')
+
+def print_screening_statistics(chain):
+
+    if not chain['screening'] or chain['screened_rejections'] == 0:
+        return
+
+    false_rejection_rate = chain['screening_false_rejections'] / chain['screening_audits'] if chain['screening_audits'] else 0.0
+    print(f'   Surrogate screening: {chain["screened_rejections"]} neighbors rejected ({chain["screened_rejections"] - chain["screening_audits"]} without simulation), '
+          f'false rejection rate {false_rejection_rate:.1%} ({chain["screening_false_rejections"]}/{chain["screening_audits"]} audited)')
+
+def simulated_annealing(initial_sequence, compiled_scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict, initial_cycles, production_requirements_dict,
+                        time_budget=None, progress_callback=None, cancel_event=None, trace_path=None, screening=False, neighbors_per_iteration=1):
+
+    """
+        Anytime mode: with a time_budget (in seconds), the optimization runs until the deadline instead of
+        max_iterations, and the chain is reheated (restarted from the best sequence, at the initial temperature)
+        whenever it ends by temperature or stagnation before it. It also stops if it reaches the downtime lower bound.
+
+        The progress_callback, if given, is called every progress_interval seconds with the annealing_progress
+        (iteration, best downtime, evaluations per second, ...), and the optimization can be stopped from another
+        thread by setting the cancel_event (a threading.Event).
+
+        When the optimization stops early (time budget or cancelled) the best sequence found so far, its downtime and
+        maintenance intervals are returned.
+
+        With a trace_path (.csv or .npz), each iteration is recorded in an AnnealingTrace saved to that file at the end.
+
+        With screening, the neighbors that the surrogate downtime rejects aren't simulated (see create_annealing_chain),
+        and with neighbors_per_iteration > 1 each iteration scores that number of neighbors together and proposes the
+        best one.
+    """
+
+    print('\nOptimization with Simulated Annealing...')
+
+    scenario = create_annealing_scenario(initial_sequence, compiled_scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict, initial_cycles)
+
+    if time_budget is None:
+        deadline = None
+        chain = create_annealing_chain(initial_sequence, random, screening=screening, neighbors_per_iteration=neighbors_per_iteration) # single chain using the global random number generator
+
+    else:
+        deadline = time.time() + time_budget
+        chain = create_annealing_chain(initial_sequence, random, chain_max_iterations=None, screening=screening, neighbors_per_iteration=neighbors_per_iteration)
+
+    if trace_path is not None:
+        chain['trace'] = AnnealingTrace(max_iterations)
+
+    chain = run_annealing_chain(chain, scenario, sys.maxsize, deadline, progress_callback, progress_interval, cancel_event)
+
+    while deadline is not None and chain['stop_reason'] in ('min temperature', 'stagnation'):
+        reheat_annealing_chain(chain)
+        chain = run_annealing_chain(chain, scenario, sys.maxsize, deadline, progress_callback, progress_interval, cancel_event)
+
+    save_annealing_trace(chain, trace_path)
+    print_screening_statistics(chain)
+
+    if deadline is not None or chain['stop_reason'] == 'cancelled':
+        return chain['best_sequence'], chain['best_downtime'], chain['best_maintenance_intervals']
+
+    return chain['sequence'], chain['downtime'], chain['maintenance_intervals']
+
+def dynamic_programming_solver(initial_sequence, compiled_scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict, initial_cycles,
+                               production_requirements_dict, memory_budget=dynamic_programming_memory_budget, time_budget=None, progress_callback=None,
+                               cancel_event=None, trace_path=None, screening=False, neighbors_per_iteration=1):
+
+    """
+        Exact solver for the instances whose count vectors (the remaining units of each product) fit the memory_budget,
+        with simulated_annealing as fallback for the larger ones.
+
+        The dynamic programming over the count vectors (see pack_production_segments, which gives up if it exceeds its
+        work budget) finds the minimum number of maintenances when every machine is maintained at each maintenance,
+        which is a lower bound of the downtime of any sequence, and a sequence with those segments. If the simulation
+        of that sequence reaches the bound, it is optimal. Otherwise the simulated annealing continues from it, and
+        stops if it reaches the bound.
+
+        time_budget, progress_callback, cancel_event, trace_path, screening and neighbors_per_iteration are used by the
+        simulated annealing (see simulated_annealing).
+
+        Returns the best sequence found, its downtime and maintenance intervals, and the statistics of the solver:
+        solver used, estimated memory, downtime lower bound, if the sequence is proven optimal, and the statistics of
+        the annealing chain (None if the sequence of the dynamic programming was optimal).
+    """
+
+    _, machine_min_maintenance_counts = calculate_downtime_lower_bound(compiled_scenario, initial_sequence, initial_cycles, maintenance_duration, s_maintenance_max, survival_dict)
+
+    product_counts = np.bincount(initial_sequence, minlength=len(compiled_scenario.products))
+    estimated_memory = estimate_dynamic_programming_memory(product_counts, max(machine_min_maintenance_counts.values(), default=0) + 2)
+
+    if estimated_memory > memory_budget:
+
+        print(f'\nThe Dynamic Programming solver needs about {estimated_memory / 1024**2:.0f} MB (budget {memory_budget / 1024**2:.0f} MB).')
+
+        optimized_sequence, optimized_downtime, best_maintenance_intervals = simulated_annealing(initial_sequence, compiled_scenario, maintenance_duration, s_maintenance_min, s_maintenance_max,
+                                                                                                 survival_dict, initial_cycles, production_requirements_dict,
+                                                                                                 time_budget, progress_callback, cancel_event, trace_path, screening,
+                                                                                                 neighbors_per_iteration)
+
+        solver_statistics = {
+            'solver': 'simulated annealing',
+            'estimated_memory': estimated_memory,
+            'downtime_lower_bound': None,
+            'optimal': None,
+            'chain_statistics': None
+        }
+
+        return optimized_sequence, optimized_downtime, best_maintenance_intervals, solver_statistics
+
+    print('\nOptimization with Dynamic Programming...')
+
+    scenario = create_annealing_scenario(initial_sequence, compiled_scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict, initial_cycles)
+
+    first_capacities, capacities = calculate_segment_capacities(compiled_scenario, initial_cycles, s_maintenance_max, survival_dict)
+    segments, min_maintenances = pack_production_segments(product_counts, compiled_scenario.cycle_matrix, first_capacities, capacities)
+
+    chain_sequence = initial_sequence
+
+    if segments is not None:
+
+        scenario['downtime_lower_bound'] = max(scenario['downtime_lower_bound'], min_maintenances * maintenance_duration)
+        segment_sequence = build_segment_sequence(segments)
+
+        try:
+            evaluate_annealing_sequence(segment_sequence, scenario)
+            chain_sequence = segment_sequence
+
+        except ValueError: # the immediate maintenances of the sequence repeat endlessly
+            pass
+
+    else:
+        print('   The Dynamic Programming solver exceeded its work budget, using Simulated Annealing...')
+
+    if time_budget is None:
+        deadline = None
+        chain = create_annealing_chain(chain_sequence, random, screening=screening, neighbors_per_iteration=neighbors_per_iteration) # single chain using the global random number generator
+
+    else:
+        deadline = time.time() + time_budget
+        chain = create_annealing_chain(chain_sequence, random, chain_max_iterations=None, screening=screening, neighbors_per_iteration=neighbors_per_iteration)
+
+    if trace_path is not None:
+        chain['trace'] = AnnealingTrace(max_iterations)
+
+    chain = run_annealing_chain(chain, scenario, sys.maxsize, deadline, progress_callback, progress_interval, cancel_event)
+
+    while deadline is not None and chain['stop_reason'] in ('min temperature', 'stagnation'):
+        reheat_annealing_chain(chain)
+        chain = run_annealing_chain(chain, scenario, sys.maxsize, deadline, progress_callback, progress_interval, cancel_event)
+
+    save_annealing_trace(chain, trace_path)
+    print_screening_statistics(chain)
+
+    optimal = chain['best_downtime'] <= scenario['downtime_lower_bound']
+
+    if segments is None:
+        solver = 'simulated annealing'
+
+    elif chain['iteration'] == 0 and optimal:
+        solver = 'dynamic programming'
+
+    else:
+        solver = 'dynamic programming + simulated annealing'
+
+    solver_statistics = {
+        'solver': solver,
+        'estimated_memory': estimated_memory,
+        'downtime_lower_bound': scenario['downtime_lower_bound'],
+        'optimal': optimal,
+        'chain_statistics': None if chain['iteration'] == 0 else annealing_chain_statistics(chain)
+    }
+
+    return chain['best_sequence'], chain['best_downtime'], chain['best_maintenance_intervals'], solver_statistics
+
+def batch_simulated_annealing(initial_sequence, compiled_scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict, initial_cycles,
+                              production_requirements_dict, batch_size=initial_batch_size, time_budget=None, progress_callback=None, cancel_event=None):
+
+    """
+        Simulated annealing over batch sequences (run-length encoded (product ID, count) batches) instead of single
+        units: identical products are interchangeable, so most swaps of single units give equivalent sequences, while
+        the batch moves (swap, move, split, merge and transfer of units between batches of the same product) only
+        generate different ones. The search starts from the products of initial_sequence divided into shuffled batches
+        of at most batch_size units, and the batch sequences are expanded to units to be evaluated (from the first to the last
+        changed unit).
+
+        time_budget, progress_callback and cancel_event work like in simulated_annealing (anytime mode with reheats,
+        progress reports and cancellation from another thread).
+
+        Returns the best sequence found (expanded to units), its downtime and maintenance intervals, and the statistics
+        of the chain (including its number of batches and the attempted and accepted batch moves).
+    """
+
+    print('\nOptimization with Batch Simulated Annealing...')
+
+    scenario = create_annealing_scenario(initial_sequence, compiled_scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict, initial_cycles)
+
+    initial_batch_sequence = create_batch_sequence(initial_sequence, batch_size, random)
+
+    if time_budget is None:
+        deadline = None
+        chain = create_annealing_chain(initial_sequence, random, initial_batch_sequence=initial_batch_sequence) # single chain using the global random number generator
+
+    else:
+        deadline = time.time() + time_budget
+        chain = create_annealing_chain(initial_sequence, random, initial_batch_sequence=initial_batch_sequence, chain_max_iterations=None)
+
+    chain = run_annealing_chain(chain, scenario, max_iterations if deadline is None else sys.maxsize, deadline, progress_callback, progress_interval, cancel_event)
+
+    while deadline is not None and chain['stop_reason'] in ('min temperature', 'stagnation'):
+        reheat_annealing_chain(chain)
+        chain = run_annealing_chain(chain, scenario, sys.maxsize, deadline, progress_callback, progress_interval, cancel_event)
+
+    chain_statistics = annealing_chain_statistics(chain)
+    chain_statistics['batches'] = len(chain['best_batch_sequence'])
+    chain_statistics['move_attempts'] = chain['move_attempts']
+    chain_statistics['accepted_batch_moves'] = chain['accepted_batch_moves']
+
+    return chain['best_sequence'], chain['best_downtime'], chain['best_maintenance_intervals'], chain_statistics
+
+def initialize_annealing_worker(scenario):
+
+    """
+        Runs once in each worker process of parallel_simulated_annealing: keeps the scenario (with the survival data),
+        so that it isn't sent again with every chain run, and prepares the survival thresholds of the machines.
+    """
+
+    global annealing_worker_scenario, annealing_worker_caches
+    annealing_worker_scenario = scenario
+    annealing_worker_caches = {}
+
+    build_survival_threshold_index(scenario['compiled_scenario'].machines, [scenario['s_maintenance_min'], scenario['s_maintenance_max']], scenario['survival_dict'])
+
+def run_annealing_chain_in_worker(chain, iterations, deadline):
+
+    """
+        Runs a chain in a worker process. Its fitness cache (up to fitness_cache_size sequences) stays in the worker,
+        and the chain is returned without it, so that only the chain state is sent between the processes each round.
+        A chain that runs in another worker than in the previous round starts there with an empty cache.
+    """
+
+    fitness_cache = annealing_worker_caches.get(chain['chain_index'])
+
+    if fitness_cache is None:
+        fitness_cache = chain['fitness_cache'] if chain['fitness_cache'] is not None else FitnessCache(fitness_cache_size)
+        annealing_worker_caches[chain['chain_index']] = fitness_cache
+
+    chain['fitness_cache'] = fitness_cache
+    chain = run_annealing_chain(chain, annealing_worker_scenario, iterations, deadline)
+    chain['fitness_cache'] = None
+
+    return chain
+
+def parallel_simulated_annealing(initial_sequence, compiled_scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict,
+                                 initial_cycles, production_requirements_dict, chains_count, workers_count=None, time_budget=None, sharing_interval=50, seed=None,
+                                 progress_callback=None, cancel_event=None):
+
+    """
+        Multi-start simulated annealing: runs chains_count independent chains, each one with its own seed and its own
+        shuffle of initial_sequence (the first chain starts from initial_sequence), on a pool of workers_count processes
+        (by default, one per CPU).
+
+        The chains run in rounds of sharing_interval iterations. After each round, the chains whose current sequence is
+        worse than the best sequence found so far by any chain continue from that one. The optimization stops when all
+        the chains end, when a chain reaches the downtime lower bound, when the time_budget (in seconds) is over or
+        when the cancel_event (a threading.Event) is set by another thread (checked after each round). The
+        progress_callback, if given, is called after the rounds, at most every progress_interval seconds, with the
+        annealing_progress of all the chains.
+
+        Returns the best sequence found, its downtime and maintenance intervals, and the statistics of each chain.
+    """
+
+    print(f'\nOptimization with Parallel Simulated Annealing ({chains_count} chains)...')
+
+    scenario = create_annealing_scenario(initial_sequence, compiled_scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict, initial_cycles)
+
+    base_seed = random.randrange(2**32) if seed is None else seed
+
+    chains = []
+    for chain_index in range(chains_count):
+
+        chain_seed = base_seed + chain_index
+        chain_rng = random.Random(chain_seed)
+
+        chain_sequence = initial_sequence.copy()
+        if chain_index > 0:
+            chain_rng.shuffle(chain_sequence)
+
+        chains.append(create_annealing_chain(chain_sequence, chain_rng, chain_index, chain_seed))
+
+    start_time = time.time()
+    deadline = None if time_budget is None else start_time + time_budget
+    next_progress_time = start_time
+
+    # the scenario (and the survival data) is sent once to each worker, only the chain states are sent with each run
+    with ProcessPoolExecutor(max_workers=workers_count, initializer=initialize_annealing_worker, initargs=(scenario,)) as executor:
+
+        running_chains = chains
+
+        while running_chains:
+
+            futures = [executor.submit(run_annealing_chain_in_worker, chain, sharing_interval, deadline) for chain in running_chains]
+
+            for future in futures:
+                chain = future.result()
+                chains[chain['chain_index']] = chain
+
+            best_chain = min(chains, key=lambda chain: chain['best_downtime'])
+            running_chains = [chain for chain in chains if chain['stop_reason'] is None]
+
+            if best_chain['best_downtime'] <= scenario['downtime_lower_bound']: # the best sequence can't be improved
+                for chain in running_chains:
+                    chain['stop_reason'] = 'lower bound'
+                running_chains = []
+
+            if cancel_event is not None and cancel_event.is_set():
+                for chain in running_chains:
+                    chain['stop_reason'] = 'cancelled'
+                running_chains = []
+
+            if progress_callback is not None and time.time() >= next_progress_time:
+                progress_callback(annealing_progress(sum(chain['iteration'] for chain in chains), best_chain['best_downtime'],
+                                                     sum(chain['evaluations'] for chain in chains), time.time() - start_time))
+                next_progress_time = time.time() + progress_interval
+
+            # share the best sequence found so far
+            for chain in running_chains:
+                if chain['downtime'] > best_chain['best_downtime']:
+                    adopt_sequence(chain, best_chain['best_sequence'], best_chain['best_downtime'], best_chain['best_maintenance_intervals'])
+
+    chain_statistics = [annealing_chain_statistics(chain) for chain in chains]
+
+    return best_chain['best_sequence'], best_chain['best_downtime'], best_chain['best_maintenance_intervals'], chain_statistics
+
+def tempering_temperatures(replicas_count, coldest_temperature=tempering_min_temperature, hottest_temperature=tempering_max_temperature):
+
+    """
+        Temperatures of the replicas of parallel_tempering, spaced geometrically from the coldest to the hottest.
+    """
+
+    if replicas_count == 1:
+        return [coldest_temperature]
+
+    temperature_ratio = (hottest_temperature / coldest_temperature) ** (1 / (replicas_count - 1))
+
+    return [coldest_temperature * temperature_ratio ** replica_index for replica_index in range(replicas_count)]
+
+def exchange_replica_states(replica, other_replica):
+
+    """
+        Swaps the current states (sequence, evaluation, ...) of two replicas, which keep their temperature, random
+        number generator, fitness cache and statistics. A replica that receives a state better than its best sequence
+        keeps it as its best.
+    """
+
+    for key in ('sequence', 'batch_sequence', 'sequence_key', 'evaluation', 'downtime', 'maintenance_intervals', 'stagnation_count'):
+        replica[key], other_replica[key] = other_replica[key], replica[key]
+
+    for exchanged_replica in (replica, other_replica):
+
+        exchanged_replica['swaps'] += 1
+
+        if exchanged_replica['downtime'] < exchanged_replica['best_downtime']:
+            exchanged_replica['best_sequence'] = exchanged_replica['sequence']
+            exchanged_replica['best_batch_sequence'] = exchanged_replica['batch_sequence']
+            exchanged_replica['best_downtime'] = exchanged_replica['downtime']
+            exchanged_replica['best_maintenance_intervals'] = exchanged_replica['evaluation']['scheduled_maintenance_intervals']
+
+def tempering_replica_statistics(replica):
+
+    """
+        Summary of a replica run, for the logs: the acceptance rate is the share of the proposed neighbors (one per
+        iteration) that were accepted, and the swap rate the share of the attempted exchanges with the adjacent replicas that were done.
+    """
+
+    return {
+        'replica': replica['chain_index'],
+        'temperature': replica['temperature'],
+        'seed': replica['seed'],
+        'best_downtime': replica['best_downtime'],
+        'final_downtime': replica['downtime'], # downtime of the last state of the replica
+        'iterations': replica['iteration'],
+        'evaluations': replica['evaluations'],
+        'cache_hits': replica['cache_hits'],
+        'acceptance_rate': replica['accepted_moves'] / replica['iteration'] if replica['iteration'] else 0.0,
+        'swap_attempts': replica['swap_attempts'],
+        'swap_rate': replica['swaps'] / replica['swap_attempts'] if replica['swap_attempts'] else 0.0,
+        'run_time': replica['run_time'],
+        'stop_reason': replica['stop_reason']
+    }
+
+def parallel_tempering(initial_sequence, compiled_scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict,
+                       initial_cycles, production_requirements_dict, replicas_count, workers_count=None, time_budget=None, exchange_interval=50,
+                       temperatures=None, seed=None, progress_callback=None, cancel_event=None):
+
+    """
+        Replica exchange (parallel tempering) version of simulated_annealing: runs replicas_count chains at fixed
+        temperatures (from the coldest to the hottest, by default tempering_temperatures(replicas_count)) on a pool of workers_count processes, each one
+        for max_iterations iterations (they don't stop on stagnation). If temperatures are given, there must be
+        replicas_count of them.
+
+        The replicas run in rounds of exchange_interval iterations. After each round, the states of adjacent replicas
+        (the pairs starting with the even replicas in one round and with the odd ones in the next) are swapped with the
+        Metropolis criterion min(1, exp((downtime_cold - downtime_hot) * (1/temperature_cold - 1/temperature_hot))),
+        so that the good sequences found by the hot replicas move to the cold ones. The optimization stops when all
+        the replicas end, when a replica reaches the downtime lower bound, when the time_budget (in seconds) is over or
+        when the cancel_event is set (see parallel_simulated_annealing, also for the progress_callback).
+
+        Returns the best sequence found, its downtime and maintenance intervals, and the statistics of each replica
+        (including its acceptance and swap rates).
+    """
+
+    if temperatures is not None and len(temperatures) != replicas_count:
+        raise ValueError(f'{len(temperatures)} temperatures were given for {replicas_count} replicas')
+
+    print(f'\nOptimization with Parallel Tempering ({replicas_count} replicas)...')
+
+    scenario = create_annealing_scenario(initial_sequence, compiled_scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict, initial_cycles)
+
+    if temperatures is None:
+        temperatures = tempering_temperatures(replicas_count)
+
+    base_seed = random.randrange(2**32) if seed is None else seed
+    exchange_rng = random.Random(base_seed - 1) # random numbers of the exchanges, independent of the replicas
+
+    replicas = []
+    for replica_index, temperature in enumerate(temperatures):
+
+        replica_seed = base_seed + replica_index
+        replica_rng = random.Random(replica_seed)
+
+        replica_sequence = initial_sequence.copy()
+        if replica_index > 0:
+            replica_rng.shuffle(replica_sequence)
+
+        replicas.append(create_annealing_chain(replica_sequence, replica_rng, replica_index, replica_seed, temperature,
+                                               chain_cooling_factor=1, chain_max_stagnation=None))
+
+    start_time = time.time()
+    deadline = None if time_budget is None else start_time + time_budget
+    next_progress_time = start_time
+    exchange_round = 0
+
+    # the scenario (and the survival data) is sent once to each worker, only the replica states are sent with each run
+    with ProcessPoolExecutor(max_workers=workers_count, initializer=initialize_annealing_worker, initargs=(scenario,)) as executor:
+
+        while any(replica['stop_reason'] is None for replica in replicas):
+
+            futures = [executor.submit(run_annealing_chain_in_worker, replica, exchange_interval, deadline) for replica in replicas if replica['stop_reason'] is None]
+
+            for future in futures:
+                replica = future.result()
+                replicas[replica['chain_index']] = replica
+
+            best_downtime = min(replica['best_downtime'] for replica in replicas)
+
+            if progress_callback is not None and time.time() >= next_progress_time:
+                progress_callback(annealing_progress(sum(replica['iteration'] for replica in replicas), best_downtime,
+                                                     sum(replica['evaluations'] for replica in replicas), time.time() - start_time))
+                next_progress_time = time.time() + progress_interval
+
+            if best_downtime <= scenario['downtime_lower_bound'] or (cancel_event is not None and cancel_event.is_set()):
+                for replica in replicas:
+                    if replica['stop_reason'] is None:
+                        replica['stop_reason'] = 'lower bound' if best_downtime <= scenario['downtime_lower_bound'] else 'cancelled'
+                break
+
+            # exchange the states of adjacent replicas
+            for replica_index in range(exchange_round % 2, len(replicas) - 1, 2):
+
+                cold_replica, hot_replica = replicas[replica_index], replicas[replica_index + 1]
+
+                if cold_replica['stop_reason'] is not None or hot_replica['stop_reason'] is not None:
+                    continue
+
+                cold_replica['swap_attempts'] += 1
+                hot_replica['swap_attempts'] += 1
+
+                exchange_exponent = (cold_replica['downtime'] - hot_replica['downtime']) * (1 / cold_replica['temperature'] - 1 / hot_replica['temperature'])
+
+                if exchange_exponent >= 0 or exchange_rng.random() < math.exp(exchange_exponent):
+                    exchange_replica_states(cold_replica, hot_replica)
+
+            exchange_round += 1
+
+    best_replica = min(replicas, key=lambda replica: replica['best_downtime'])
+    replica_statistics = [tempering_replica_statistics(replica) for replica in replicas]
 
-    return current_sequence, current_downtime, current_best_maintenance_intervals
\ No newline at end of file
+    return best_replica['best_sequence'], best_replica['best_downtime'], best_replica['best_maintenance_intervals'], replica_statistics
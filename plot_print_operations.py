@@ -1,65 +1,102 @@
-import matplotlib.pyplot as plt
 import numpy as np
 import datetime
 
-from survival_function_operations import get_survival_prob
+from survival_function_operations import get_machines_survival_probs
 
 plots_folder_path = 'data/plots/'
 
-def plot_survival_prob_over_cycles(machine_operation_information, survival_dict, final_time_slot):
+def calculate_survival_probs_over_cycles(machine_operation_information, survival_dict, final_time_slot):
 
     """
-        Plots the survival probability over cycles for all the machines on one graph.
+        Survival probability of each machine in each timeslot (up to final_time_slot, inclusive), as a
+        (machines x timeslots) array, with NaN while the machine is under maintenance.
     """
 
-    plt.figure(figsize=(14, 6))
+    cycle_numbers = machine_operation_information.cycle_numbers[:, :final_time_slot + 1].astype(float)
+    cycle_numbers[cycle_numbers <= 0] = np.nan # no survival probability while the machine is under maintenance
 
-    for machine in machine_operation_information.keys():
+    return get_machines_survival_probs(machine_operation_information.machines, cycle_numbers, survival_dict, degree=5)
 
-        time_slots = []
-        survival_probs = []
+def downsample_min_max(values, buckets):
 
-        for timeslot, information in machine_operation_information[machine].items():
+    """
+        Downsamples a line to at most 2 * buckets points: the values are divided into buckets of consecutive points and
+        only the minimum and maximum of each bucket are kept (in their order), so the peaks of the line (e.g. the
+        maintenances) are still drawn. Returns the positions and the values of the kept points.
+    """
+
+    if len(values) <= 2 * buckets:
+        return np.arange(len(values)), values
+
+    bucket_size = -(-len(values) // buckets)
+    bucket_values = np.pad(values, (0, buckets * bucket_size - len(values)), mode='edge').reshape(buckets, bucket_size)
+
+    bucket_starts = np.arange(buckets)[:, None] * bucket_size
+    positions = np.sort(np.concatenate([bucket_values.argmin(axis=1)[:, None], bucket_values.argmax(axis=1)[:, None]], axis=1) + bucket_starts, axis=1).ravel()
+    positions = np.minimum(positions, len(values) - 1) # the padding repeats the last value
+
+    return positions, values[positions]
+
+def plot_survival_prob_over_cycles(machines, survival_probs_matrix):
+
+    """
+        Plots the survival probability over cycles for all the machines on one graph, from the survival probabilities
+        of each machine in each timeslot (see calculate_survival_probs_over_cycles).
 
-            if int(timeslot[1:]) <= final_time_slot:
+        The x axis is numeric (timeslot number) and each line is downsampled to the width of the figure in pixels
+        (see downsample_min_max), so the rendering time doesn't grow with the number of timeslots. The figure is
+        created with the matplotlib Figure API and rendered by the Agg canvas (without pyplot or a display), so it
+        can be drawn outside the main thread and in headless runs. matplotlib is only imported here, when a plot
+        is requested.
 
-                if information['cycle_number'] > 0:
-                    survival_prob = get_survival_prob(machine, information['cycle_number'], survival_dict, degree=5)
+        Returns the path of the saved plot.
+    """
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.ticker import FuncFormatter
+    from matplotlib.ticker import MaxNLocator
+
+    figure = Figure(figsize=(14, 6))
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
 
-                else:
-                    survival_prob = np.nan
+    pixel_budget = int(figure.get_figwidth() * figure.dpi)
 
-                time_slots.append(timeslot)
-                survival_probs.append(survival_prob)
+    for machine, survival_probs in zip(machines, survival_probs_matrix):
 
         # for the graph line to continue when the machine is under maintenance
-        survival_probs = np.array(survival_probs)
+        survival_probs = survival_probs.copy()
         nans = np.isnan(survival_probs)
         survival_probs[nans] = np.interp(np.flatnonzero(nans), np.flatnonzero(~nans), survival_probs[~nans])
 
-        plt.plot(time_slots, survival_probs, label=machine, marker='')
+        time_slots, survival_probs = downsample_min_max(survival_probs, pixel_budget)
+        axes.plot(time_slots, survival_probs, label=machine, marker='')
 
-    tick_positions = range(0, len(time_slots), int(len(time_slots)/50)) # only show timeslot from x in x
-    plt.xticks(tick_positions, rotation=25)
+    axes.xaxis.set_major_locator(MaxNLocator(nbins=25, integer=True))
+    axes.xaxis.set_major_formatter(FuncFormatter(lambda time_slot, _: f"t{int(time_slot)}"))
+    axes.tick_params(axis='x', labelrotation=25)
+    axes.set_xlim(0, max(survival_probs_matrix.shape[1] - 1, 1))
 
-    plt.xlabel('Time Slot / Cycle')
-    plt.ylabel('Survival Probability')
+    axes.set_xlabel('Time Slot / Cycle')
+    axes.set_ylabel('Survival Probability')
 
-    plt.title('Survival Probability over Cycles')
-    plt.legend(title='Machines')
+    axes.set_title('Survival Probability over Cycles')
+    axes.legend(title='Machines')
 
-    plt.grid(True)
-    plt.tight_layout()
+    axes.grid(True)
+    figure.tight_layout()
 
     simulation_datetime = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     plot_path = f"{plots_folder_path}survival_probability_over_cycles_{simulation_datetime}.png"
 
-    plt.savefig(plot_path)
-    print(f'Saved survival probability over cycles plot at \'{plot_path}.png\'.')
-    # plt.show()
+    figure.savefig(plot_path)
+    print(f'Saved survival probability over cycles plot at \'{plot_path}\'.')
 
+    return plot_path
 
-def print_stats_production(production_sequence, production_requirements_dict, final_time_slot, product_machine_cycles_mapping_dict, operating_machines_list, logger):
+
+def print_stats_production(production_sequence, production_requirements_dict, final_time_slot, scenario, logger):
 
     """
         Prints production information :
@@ -70,7 +107,7 @@ def print_stats_production(production_sequence, production_requirements_dict, fi
 
     from simulation_operations import calculate_required_cycle_for_production_sequence
 
-    required_cycles_for_production_sequence = calculate_required_cycle_for_production_sequence(product_machine_cycles_mapping_dict, production_sequence, operating_machines_list)
+    required_cycles_for_production_sequence = calculate_required_cycle_for_production_sequence(scenario, production_sequence)
 
     print('\n   --- PRODUCTION ---')
 
@@ -79,7 +116,7 @@ def print_stats_production(production_sequence, production_requirements_dict, fi
     logger.info(f'SIMULATION RESULTS - PRODUCTION')
     logger.info(f'  - Production duration (in cycles): {final_time_slot}')
 
-    for machine in operating_machines_list:
+    for machine in scenario.machines:
         print(f'     -Cycles used by machine {machine}: {required_cycles_for_production_sequence[machine][-1]}')
         logger.info(f'  - Cycles used by machine {machine}: {required_cycles_for_production_sequence[machine][-1]}')
 
@@ -121,6 +158,136 @@ def print_stats_maintenance(total_downtime, operating_machines_list, aux_count_m
     logger.info(' ')
 
 
+def print_stats_annealing_chains(chain_statistics, logger):
+
+    """
+        Prints the statistics of each chain of the parallel simulated annealing:
+            - Best downtime found by the chain
+            - Iterations, evaluated sequences, accepted moves and improvements
+            - Number of times the chain continued from the best sequence of all the chains
+            - Why the chain stopped
+    """
+
+    print('\n   --- SIMULATED ANNEALING CHAINS ---\n')
+
+    logger.info(f'OPTIMIZATION - SIMULATED ANNEALING CHAINS')
+
+    for statistics in chain_statistics:
+
+        chain_summary = (f"Chain {statistics['chain']} (seed {statistics['seed']}): best downtime {statistics['best_downtime']}, "
+                         f"{statistics['iterations']} iterations, {statistics['evaluations']} evaluations, {statistics['cache_hits']} cache hits, "
+                         f"{statistics['accepted_moves']} accepted moves, {statistics['improvements']} improvements, "
+                         f"{statistics['shared_best_adoptions']} shared best adoptions, stopped by {statistics['stop_reason']} "
+                         f"after {format_duration(statistics['run_time'])}")
+
+        print(f'     -{chain_summary}')
+        logger.info(f'  - {chain_summary}')
+
+    logger.info(' ')
+
+
+def print_stats_tempering_replicas(replica_statistics, logger):
+
+    """
+        Prints the statistics of each replica of the parallel tempering, to tune the temperatures:
+            - Temperature and best downtime found by the replica
+            - Acceptance rate per iteration (accepted moves / iterations, one proposed neighbor each)
+            - Swap rate (exchanges with the adjacent replicas / attempted exchanges)
+    """
+
+    print('\n   --- PARALLEL TEMPERING REPLICAS ---\n')
+
+    logger.info(f'OPTIMIZATION - PARALLEL TEMPERING REPLICAS')
+
+    for statistics in replica_statistics:
+
+        replica_summary = (f"Replica {statistics['replica']} (temperature {statistics['temperature']:.3g}): best downtime {statistics['best_downtime']}, "
+                           f"{statistics['iterations']} iterations, {statistics['evaluations']} evaluations, {statistics['cache_hits']} cache hits, "
+                           f"acceptance rate {statistics['acceptance_rate']:.1%} per iteration, swap rate {statistics['swap_rate']:.1%} "
+                           f"({statistics['swap_attempts']} attempts), stopped by {statistics['stop_reason']} "
+                           f"after {format_duration(statistics['run_time'])}")
+
+        print(f'     -{replica_summary}')
+        logger.info(f'  - {replica_summary}')
+
+    logger.info(' ')
+
+
+def print_stats_dynamic_programming(solver_statistics, logger):
+
+    """
+        Prints the statistics of the dynamic programming solver:
+            - Solver used (dynamic programming, simulated annealing from its sequence, or simulated annealing if the
+              instance doesn't fit the memory or work budget) and its estimated memory
+            - Downtime lower bound, and if the sequence is proven optimal (it reaches the bound)
+    """
+
+    print('\n   --- DYNAMIC PROGRAMMING SOLVER ---\n')
+
+    logger.info(f'OPTIMIZATION - DYNAMIC PROGRAMMING SOLVER')
+
+    solver_summary = f"Solver: {solver_statistics['solver']} (estimated memory {solver_statistics['estimated_memory'] / 1024**2:.1f} MB)"
+
+    if solver_statistics['downtime_lower_bound'] is not None:
+        solver_summary += (f", downtime lower bound {solver_statistics['downtime_lower_bound']}, "
+                           f"{'proven optimal' if solver_statistics['optimal'] else 'not proven optimal'}")
+
+    print(f'     -{solver_summary}')
+    logger.info(f'  - {solver_summary}')
+
+    chain_statistics = solver_statistics['chain_statistics']
+
+    if chain_statistics is not None:
+
+        chain_summary = (f"Simulated annealing: best downtime {chain_statistics['best_downtime']}, {chain_statistics['iterations']} iterations, "
+                         f"{chain_statistics['evaluations']} evaluations, stopped by {chain_statistics['stop_reason']} "
+                         f"after {format_duration(chain_statistics['run_time'])}")
+
+        print(f'     -{chain_summary}')
+        logger.info(f'  - {chain_summary}')
+
+    logger.info(' ')
+
+
+def print_stats_batch_annealing(chain_statistics, logger):
+
+    """
+        Prints the statistics of the batch simulated annealing:
+            - Best downtime found and number of batches of the best batch sequence
+            - Iterations, evaluated sequences and accepted moves
+            - Attempted and accepted moves of each type (swap, move, split, merge, transfer)
+    """
+
+    print('\n   --- BATCH SIMULATED ANNEALING ---\n')
+
+    logger.info(f'OPTIMIZATION - BATCH SIMULATED ANNEALING')
+
+    chain_summary = (f"Best downtime {chain_statistics['best_downtime']} with {chain_statistics['batches']} batches, "
+                     f"{chain_statistics['iterations']} iterations, {chain_statistics['evaluations']} evaluations, {chain_statistics['cache_hits']} cache hits, "
+                     f"{chain_statistics['accepted_moves']} accepted moves, {chain_statistics['improvements']} improvements, "
+                     f"stopped by {chain_statistics['stop_reason']} after {format_duration(chain_statistics['run_time'])}")
+
+    moves_summary = ', '.join(f"{move} {chain_statistics['accepted_batch_moves'][move]}/{attempts}" for move, attempts in chain_statistics['move_attempts'].items())
+
+    print(f'     -{chain_summary}')
+    print(f'     -Accepted/attempted moves: {moves_summary}')
+    logger.info(f'  - {chain_summary}')
+    logger.info(f'  - Accepted/attempted moves: {moves_summary}')
+
+    logger.info(' ')
+
+
+def print_optimization_progress(progress):
+
+    """
+        Progress callback of the optimizers: prints the elapsed time, the iteration, the best downtime found so far and
+        the evaluated sequences per second.
+    """
+
+    print(f"   [{format_duration(progress['elapsed_time'])}] iteration {progress['iteration']}, best downtime {progress['best_downtime']}, "
+          f"{progress['evaluations_per_second']:.0f} evaluations/s")
+
+
 def format_duration(seconds):
     """
         Format the result of the optimization duration in seconds, minutes or hours.
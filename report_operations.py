@@ -0,0 +1,126 @@
+from collections import namedtuple
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+
+from plot_print_operations import calculate_survival_probs_over_cycles
+from plot_print_operations import plot_survival_prob_over_cycles
+
+report_workers = 1 # threads of the report pipeline (with one, the reports of consecutive simulations are written in order)
+
+# results of a production simulation needed by the reports (export and plot), with read-only arrays
+ReportSnapshot = namedtuple('ReportSnapshot', ['machines', 'final_time_slot', 'schedule', 'machine_operation_information', 'survival_probs_matrix'])
+
+def freeze_arrays(*arrays):
+
+    for array in arrays:
+        array.flags.writeable = False
+
+def create_report_snapshot(schedule, final_time_slot, machine_operation_information, survival_dict):
+
+    """
+        Snapshot of the results of a production simulation for the reports. The schedule and machine_operation_information
+        are the per-timeslot views built for the reports (the simulation doesn't use them afterwards), and their arrays
+        are made read-only. The survival probabilities are computed here, in the calling thread, so the reports
+        don't use survival_dict (or the cache of the survival function fits) while the next optimization runs.
+    """
+
+    survival_probs_matrix = calculate_survival_probs_over_cycles(machine_operation_information, survival_dict, final_time_slot)
+
+    freeze_arrays(schedule.states, schedule.product_ids, machine_operation_information.cycle_numbers, machine_operation_information.production_flags,
+                  machine_operation_information.product_ids, survival_probs_matrix)
+
+    return ReportSnapshot(tuple(machine_operation_information.machines), final_time_slot, schedule, machine_operation_information, survival_probs_matrix)
+
+def export_report(snapshot, export_formats):
+
+    from file_operations import export_production_information # pandas is only imported when the reports run
+
+    return export_production_information(snapshot.schedule, snapshot.final_time_slot, snapshot.machine_operation_information, export_formats)
+
+def plot_report(snapshot):
+    return [plot_survival_prob_over_cycles(snapshot.machines, snapshot.survival_probs_matrix)]
+
+class ReportHandle:
+
+    """
+        Wait handle of the reports (export and plot) of a production simulation.
+    """
+
+    def __init__(self, futures):
+
+        self.futures = futures
+
+    def done(self):
+
+        return all(future.done() for future in self.futures)
+
+    def wait(self, timeout=None):
+
+        """
+            Waits (at most timeout seconds for each report, None = no limit) until the reports are finished and returns
+            the paths of the saved files. If a report failed, its exception is raised here.
+        """
+
+        saved_files = []
+
+        for future in self.futures:
+            saved_files += future.result(timeout)
+
+        return saved_files
+
+class ReportPipeline:
+
+    """
+        Runs the reports of the production simulations in a pool of report_workers background threads, so that the
+        simulation results are returned (and logged) without waiting for them, and the reports of a simulation overlap
+        the optimization of the next one.
+
+        The plot uses the matplotlib Figure API (without pyplot), which can be used outside the main thread.
+    """
+
+    def __init__(self, workers=report_workers):
+
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report')
+
+    def submit(self, snapshot, export_formats=None):
+
+        return ReportHandle([self.executor.submit(export_report, snapshot, export_formats), self.executor.submit(plot_report, snapshot)])
+
+    def shutdown(self, wait=True):
+
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.shutdown()
+
+def run_reports(snapshot, export_formats=None, report_pipeline=None):
+
+    """
+        Runs the reports of a snapshot (export in export_formats, None = default_export_formats of file_operations,
+        and plot) in report_pipeline, or in the calling thread if it's None (then the returned handle is already done,
+        with the exceptions of the reports stored in it like in the pipeline).
+    """
+
+    if report_pipeline is not None:
+        return report_pipeline.submit(snapshot, export_formats)
+
+    futures = []
+
+    for report, arguments in ((export_report, (snapshot, export_formats)), (plot_report, (snapshot,))):
+
+        future = Future()
+
+        try:
+            future.set_result(report(*arguments))
+
+        except Exception as exception:
+            future.set_exception(exception)
+
+        futures.append(future)
+
+    return ReportHandle(futures)
@@ -0,0 +1,75 @@
+import numpy as np
+
+sequence_dtype = np.int16 # production sequences are arrays of product IDs
+
+def build_cycle_matrix(product_machine_cycles_mapping_dict, products, operating_machines_list):
+
+    """
+        Builds the (products x machines) matrix with the number of cycles required for each product on each machine.
+    """
+
+    return np.array([[product_machine_cycles_mapping_dict[machine].get(product, 0) for machine in operating_machines_list]
+                     for product in products], dtype=np.int64).reshape(len(products), len(operating_machines_list))
+
+
+class CompiledScenario:
+
+    """
+        Production scenario with dense integer IDs for the products and the machines (their index in products and
+        operating_machines_list), so that the simulation works with integers only:
+            - cycle_matrix: (products x machines) NumPy array with the cycles required for each product on each machine
+            - product_operations: for each product ID, the (machine ID, cycles) of the machines it goes through, in the
+                                  order of the production line
+
+        Production sequences are int16 arrays of product IDs (see encode_sequence), and are only converted back to
+        product labels (decode_sequence) for the reports.
+    """
+
+    def __init__(self, operating_machines_list, product_machine_cycles_mapping_dict, products):
+
+        self.machines = list(operating_machines_list)
+        self.products = list(products)
+
+        self.machine_ids = {machine: machine_id for machine_id, machine in enumerate(self.machines)}
+        self.product_ids = {product: product_id for product_id, product in enumerate(self.products)}
+
+        self.cycle_matrix = build_cycle_matrix(product_machine_cycles_mapping_dict, self.products, self.machines)
+
+        self.product_operations = [
+            [(machine_id, int(cycles)) for machine_id, cycles in enumerate(product_cycles) if cycles > 0]
+            for product_cycles in self.cycle_matrix
+        ]
+
+    def encode_sequence(self, production_sequence):
+
+        """
+            Converts a production sequence of product labels to an int16 array of product IDs.
+        """
+
+        return np.fromiter((self.product_ids[product] for product in production_sequence), dtype=sequence_dtype, count=len(production_sequence))
+
+    def encode_sequences(self, production_sequences):
+
+        """
+            Converts production sequences of product labels with the same length to a (sequences x positions) int16
+            array of product IDs.
+        """
+
+        return np.array([self.encode_sequence(production_sequence) for production_sequence in production_sequences], dtype=sequence_dtype)
+
+    def decode_sequence(self, production_sequence):
+
+        """
+            Converts an array of product IDs back to the list of product labels, for the reports.
+        """
+
+        return [self.products[product_id] for product_id in production_sequence.tolist()]
+
+
+def compile_scenario(operating_machines_list, product_machine_cycles_mapping_dict, production_requirements_dict):
+
+    """
+        Builds the CompiledScenario of the products required in production_requirements_dict.
+    """
+
+    return CompiledScenario(operating_machines_list, product_machine_cycles_mapping_dict, production_requirements_dict.keys())
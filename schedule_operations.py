@@ -1,72 +1,304 @@
-import pandas as pd
+import numpy as np
 
-def schedule_setup(operating_machines_list):
+scheduling_table_time_units = 40000 # default number of timeslots of the per-timeslot tables (they grow if the production needs more)
+
+# state codes stored in the scheduling table
+FREE = 0
+PRODUCING = 1
+MAINTENANCE = 2
+UNAVAILABLE = 3
+
+schedule_state_labels = ['Free', 'Producing', 'Maintenance', 'Unavailable']
+
+def extend_time_units(table, time_units, fill_value):
+
+    """
+        Returns a copy of a (machines x timeslots) array extended to time_units timeslots with fill_value.
+    """
+
+    return np.pad(table, ((0, 0), (0, time_units - table.shape[1])), constant_values=fill_value)
+
+class Schedule:
 
     """
-        Initial setup of a scheduling table that allows to check machines availability during production cycles.
+        Scheduling table stored as NumPy arrays, with one row per machine and one column per timeslot:
+            - states: state code of each timeslot (FREE, PRODUCING, MAINTENANCE or UNAVAILABLE)
+            - product_ids: index in product_labels of the product being produced in each timeslot (-1 if none)
+
+        The labelled table (machines x 'tx' columns, with the product label in the producing timeslots and the state
+        name in the others) is only built by to_dataframe, when it is exported.
     """
 
-    scheduling_table_time_units = 40000 # max value (of columns in an Excel sheet)
-    time_slots = [f"t{i}" for i in range(scheduling_table_time_units)]
+    def __init__(self, operating_machines_list, time_units=scheduling_table_time_units):
+
+        self.machines = list(operating_machines_list)
+        self.machine_rows = {machine: row for row, machine in enumerate(self.machines)}
+
+        self.states = np.full((len(self.machines), time_units), FREE, dtype=np.int8)
+        self.product_ids = np.full((len(self.machines), time_units), -1, dtype=np.int32)
+
+        self.product_labels = [] # unique product labels, ex: A0_1, A0_2, ...
+
+    def ensure_time_units(self, time_units):
+
+        """
+            Extends the table (doubling its size) if it has less than time_units timeslots.
+        """
+
+        current_time_units = self.states.shape[1]
+
+        if time_units <= current_time_units:
+            return
+
+        new_time_units = max(time_units, 2 * current_time_units)
+
+        self.states = extend_time_units(self.states, new_time_units, FREE)
+        self.product_ids = extend_time_units(self.product_ids, new_time_units, -1)
+
+    def set_producing(self, machine, start_time, duration, product_label):
+
+        """
+            Marks a machine as producing product_label from start_time during duration timeslots.
+        """
+
+        self.ensure_time_units(start_time + duration)
+
+        row = self.machine_rows[machine]
+
+        self.states[row, start_time:start_time + duration] = PRODUCING
+        self.product_ids[row, start_time:start_time + duration] = len(self.product_labels)
+
+        self.product_labels.append(product_label)
 
-    schedule = pd.DataFrame(index=operating_machines_list, columns=time_slots)
-    schedule[:] = 'Free'
+    def set_state(self, machines, start_time, duration, state):
 
-    return schedule, time_slots
+        """
+            Sets the state of one or more machines from start_time during duration timeslots.
+        """
 
+        self.ensure_time_units(start_time + duration)
 
-def update_schedule_for_product(schedule, product, machine, start_time, operation_duration, machine_operation_information,current_cycle_number, product_counts):
+        rows = [self.machine_rows[machine] for machine in machines]
+
+        self.states[rows, start_time:start_time + duration] = state
+        self.product_ids[rows, start_time:start_time + duration] = -1
+
+    def to_dataframe(self, final_time_slot=None):
+
+        """
+            Builds the labelled scheduling table (up to and including final_time_slot), with the product label
+            in the producing timeslots and the state name ('Free', 'Maintenance', 'Unavailable') in the others.
+        """
+
+        import pandas as pd # only needed for the export
+
+        time_units = self.states.shape[1] if final_time_slot is None else final_time_slot + 1
+        self.ensure_time_units(time_units)
+
+        states = self.states[:, :time_units]
+        product_ids = self.product_ids[:, :time_units]
+
+        cell_labels = np.array(schedule_state_labels + self.product_labels, dtype=object)
+        cell_codes = np.where(states == PRODUCING, len(schedule_state_labels) + product_ids, states)
+
+        time_slots = [f"t{i}" for i in range(time_units)]
+
+        return pd.DataFrame(cell_labels[cell_codes], index=self.machines, columns=time_slots)
+
+
+class MachineOperationInformation:
 
     """
-        Update the machine's scheduling table / production
-        timeslots based on each product in the production sequence.
+        Records the machine activity over time in columnar NumPy arrays, with one row per machine and one column
+        per timeslot (the column index is the timeslot number):
+            - cycle_numbers: current cycle count of the machine (-1 while under maintenance)
+            - production_flags: state code of the machine (FREE, PRODUCING, MAINTENANCE or UNAVAILABLE)
+            - product_ids: index in product_labels of the product being processed (-1 if none)
+
+        Example:
+            m1: t9  -> cycle_numbers = 100, production_flags = PRODUCING, product_ids -> "A3_4"
+                t10 -> cycle_numbers = 0,   production_flags = FREE,      product_ids = -1
     """
 
-    product_count = product_counts[machine].get(product, 0) # keep track how many times this product type has been produced in this machine, example: 1 = means first A0 to be produced, 2 = second A0, ...
-    current_cycle_number = current_cycle_number - 1
+    def __init__(self, operating_machines_list, time_units=scheduling_table_time_units):
 
-    for cycle in range(operation_duration): # operation_duration <=> number of cycle required to product the product in a certain machine
+        self.machines = list(operating_machines_list)
+        self.machine_rows = {machine: row for row, machine in enumerate(self.machines)}
 
-        time_slot = f"t{start_time + cycle}"
+        self.cycle_numbers = np.zeros((len(self.machines), time_units), dtype=np.int32)
+        self.production_flags = np.full((len(self.machines), time_units), FREE, dtype=np.int8)
+        self.product_ids = np.full((len(self.machines), time_units), -1, dtype=np.int32)
 
-        current_cycle_number = current_cycle_number + 1
-        product_label = f"{product}_{product_count + 1}"  # unique product label like Ax_1, ..., Ax_500, ...
+        self.product_labels = [] # unique product labels, ex: A0_1, A0_2, ...
 
-        machine_operation_information[machine][time_slot]['production_flag'] = "Producing"
-        machine_operation_information[machine][time_slot]['cycle_number'] = current_cycle_number
-        machine_operation_information[machine][time_slot]['product_label'] = product_label
+    def ensure_time_units(self, time_units):
 
-        schedule.at[machine, time_slot] = product_label
+        """
+            Extends the arrays (doubling their size) if they have less than time_units timeslots.
+        """
 
-    product_counts[machine][product] = product_count + 1
+        current_time_units = self.cycle_numbers.shape[1]
+
+        if time_units <= current_time_units:
+            return
+
+        new_time_units = max(time_units, 2 * current_time_units)
+
+        self.cycle_numbers = extend_time_units(self.cycle_numbers, new_time_units, 0)
+        self.production_flags = extend_time_units(self.production_flags, new_time_units, FREE)
+        self.product_ids = extend_time_units(self.product_ids, new_time_units, -1)
+
+    def set_producing(self, machine, start_time, duration, first_cycle_number, product_label):
+
+        """
+            Records that a machine produces product_label from start_time during duration timeslots,
+            starting at cycle first_cycle_number.
+        """
+
+        self.ensure_time_units(start_time + duration)
+
+        row = self.machine_rows[machine]
+
+        self.production_flags[row, start_time:start_time + duration] = PRODUCING
+        self.cycle_numbers[row, start_time:start_time + duration] = np.arange(first_cycle_number, first_cycle_number + duration)
+        self.product_ids[row, start_time:start_time + duration] = len(self.product_labels)
+
+        self.product_labels.append(product_label)
+
+    def set_maintenance(self, machines, start_time, duration):
 
-def update_schedule_for_maintenance(schedule, maintenance_start_time, machine_under_maintenance, machine_operation_information, operating_machines_list, maintenance_duration, scheduled_maintenance_intervals):
+        """
+            Records that the machines are under maintenance from start_time during duration timeslots.
+        """
+
+        self.ensure_time_units(start_time + duration)
+
+        rows = [self.machine_rows[machine] for machine in machines]
+
+        self.production_flags[rows, start_time:start_time + duration] = MAINTENANCE
+        self.cycle_numbers[rows, start_time:start_time + duration] = -1  # -1 to signal maintenance
+        self.product_ids[rows, start_time:start_time + duration] = -1
+
+    def set_unavailable(self, machines, start_time, duration):
+
+        """
+            Records that the machines can't produce (another machine is under maintenance) from start_time
+            during duration timeslots. Only the state changes, the cycle number and product are kept.
+        """
+
+        self.ensure_time_units(start_time + duration)
+
+        rows = [self.machine_rows[machine] for machine in machines]
+
+        self.production_flags[rows, start_time:start_time + duration] = UNAVAILABLE
+
+
+class ProductionTimeline:
 
     """
-            Update the machine's scheduling table / production
-            timeslots based on the maintenance intervals of each machine.
+        Event list of the production simulation: each event is a (machine, start_time, end_time, state, product_label,
+        cycle_number) interval, with end_time inclusive, where cycle_number is the machine's cycle count at start_time
+        (only for production events). Recording one event per product and per maintenance keeps the simulation cost
+        independent of the number of cycles of each operation.
+
+        The per-timeslot views (the scheduling table and the machine operation information) are only built from the
+        events, in the same order they were recorded, when they are needed for the export or the plots.
     """
 
-    if isinstance(machine_under_maintenance, str):
-        machine_under_maintenance = [machine_under_maintenance] # since machine_under_maintenance can either be 1 or multiple, always treat it as list
+    def __init__(self, operating_machines_list):
+
+        self.machines = list(operating_machines_list)
+        self.events = []
+        self.end_time = 0 # first timeslot after the last event
+
+    def add_production(self, machine, start_time, duration, first_cycle_number, product_label):
+
+        """
+            Records that a machine produces product_label from start_time during duration timeslots.
+        """
+
+        self.events.append((machine, start_time, start_time + duration - 1, PRODUCING, product_label, first_cycle_number))
+        self.end_time = max(self.end_time, start_time + duration)
+
+    def add_maintenance(self, machines_under_maintenance, start_time, duration):
+
+        """
+            Records that the machines are under maintenance from start_time during duration timeslots,
+            and that all the other machines are unavailable in the meantime.
+        """
+
+        for machine in machines_under_maintenance:
+            self.events.append((machine, start_time, start_time + duration - 1, MAINTENANCE, None, -1))
+
+        for machine in self.machines:
+            if machine not in machines_under_maintenance:
+                self.events.append((machine, start_time, start_time + duration - 1, UNAVAILABLE, None, None))
+
+        self.end_time = max(self.end_time, start_time + duration)
+
+    def to_schedule(self):
+
+        """
+            Builds the scheduling table from the events.
+        """
 
-    for cycle in range(maintenance_duration):
+        schedule = Schedule(self.machines, self.end_time)
 
-        time_slot = f"t{maintenance_start_time + cycle}"
+        for machine, start_time, end_time, state, product_label, _ in self.events:
 
-        for machine in machine_under_maintenance: # update for each machine under maintenance
+            if state == PRODUCING:
+                schedule.set_producing(machine, start_time, end_time - start_time + 1, product_label)
 
-            schedule.at[machine, time_slot] = "Maintenance"
-            machine_operation_information[machine][time_slot]['production_flag'] = "Maintenance"
-            machine_operation_information[machine][time_slot]['cycle_number'] = -1  # -1 to signal maintenance
-            machine_operation_information[machine][time_slot]['product_label'] = None
+            else:
+                schedule.set_state([machine], start_time, end_time - start_time + 1, state)
 
-        for machine in operating_machines_list: # for the other machines (can't be producing)
+        return schedule
 
-            if machine not in machine_under_maintenance:  # only if the machine is not under maintenance
-                schedule.at[machine, time_slot] = "Unavailable"
-                machine_operation_information[machine][time_slot]['production_flag'] = "Unavailable"
+    def to_machine_operation_information(self):
 
-    for machine in machine_under_maintenance:
-        scheduled_maintenance_intervals.append((machine, (maintenance_start_time, maintenance_start_time+maintenance_duration-1)))
+        """
+            Builds the machine operation information from the events (the cycle numbers of the 'Free' and
+            'Unavailable' timeslots are not propagated, see propagate_machine_cycles).
+        """
+
+        machine_operation_information = MachineOperationInformation(self.machines, self.end_time)
+
+        for machine, start_time, end_time, state, product_label, cycle_number in self.events:
+
+            if state == PRODUCING:
+                machine_operation_information.set_producing(machine, start_time, end_time - start_time + 1, cycle_number, product_label)
+
+            elif state == MAINTENANCE:
+                machine_operation_information.set_maintenance([machine], start_time, end_time - start_time + 1)
+
+            else:
+                machine_operation_information.set_unavailable([machine], start_time, end_time - start_time + 1)
+
+        return machine_operation_information
+
+
+def update_schedule_for_product(timeline, product, machine, start_time, operation_duration, current_cycle_number, product_counts):
+
+    """
+        Update the machine's production timeline based on each product in the production sequence.
+    """
+
+    product_count = product_counts[machine].get(product, 0) # keep track how many times this product type has been produced in this machine, example: 1 = means first A0 to be produced, 2 = second A0, ...
+    product_label = f"{product}_{product_count + 1}"  # unique product label like Ax_1, ..., Ax_500, ...
+
+    # operation_duration <=> number of cycle required to product the product in a certain machine
+    timeline.add_production(machine, start_time, operation_duration, current_cycle_number, product_label)
+
+    product_counts[machine][product] = product_count + 1
+
+def update_schedule_for_maintenance(timeline, maintenance_start_time, machine_under_maintenance, maintenance_duration):
+
+    """
+            Update the machine's production timeline based on the maintenance intervals of each machine
+            (the other machines can't be producing in the meantime).
+    """
+
+    if isinstance(machine_under_maintenance, str):
+        machine_under_maintenance = [machine_under_maintenance] # since machine_under_maintenance can either be 1 or multiple, always treat it as list
 
+    timeline.add_maintenance(machine_under_maintenance, maintenance_start_time, maintenance_duration)
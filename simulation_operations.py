@@ -1,15 +1,22 @@
+import numpy as np
+
 from survival_function_operations import get_survival_cycles
 
-from file_operations import save_schedule_and_machine_operation_information_excel_files
+from report_operations import create_report_snapshot
+from report_operations import run_reports
 
-from schedule_operations import schedule_setup
+from schedule_operations import ProductionTimeline
 from schedule_operations import update_schedule_for_product
 from schedule_operations import update_schedule_for_maintenance
+from schedule_operations import PRODUCING
+from schedule_operations import MAINTENANCE
 
-from plot_print_operations import plot_survival_prob_over_cycles
 from plot_print_operations import print_stats_maintenance
 from plot_print_operations import print_stats_production
 
+simultaneous_maintenance_lookahead = 100 # other machines reaching maintenance within this number of products after the separation position can be maintained at the same time
+segment_checkpoint_interval = 32 # products between two checkpoints inside a part of the divided sequence (see simulate_production_sequence)
+
 def calculate_downtime(maintenance_intervals):
 
     """
@@ -34,7 +41,22 @@ def calculate_downtime(maintenance_intervals):
     return total_downtime
 
 
-def calculate_required_cycle_for_production_sequence(product_machine_cycles_mapping_dict, production_sequence, operating_machines_list):
+def calculate_cumulative_cycles(cycle_matrix, production_sequence):
+
+    """
+        Calculates the prefix sums of the cycles required by a production sequence (array of product IDs) on each
+        machine, given the (products x machines) cycle_matrix of the scenario, as a (machines x (len(production_sequence) + 1))
+        array where cumulative_cycles[m, i] is the number of cycles machine m needs for the first i products of the
+        sequence (cumulative_cycles[m, 0] = 0).
+        The cycles needed for products i to j-1 are cumulative_cycles[m, j] - cumulative_cycles[m, i].
+    """
+
+    cumulative_cycles = np.zeros((cycle_matrix.shape[1], len(production_sequence) + 1), dtype=np.int64)
+    np.cumsum(cycle_matrix[production_sequence].T, axis=1, out=cumulative_cycles[:, 1:])
+
+    return cumulative_cycles
+
+def calculate_required_cycle_for_production_sequence(scenario, production_sequence):
 
     """
         Calculates the cumulative cycles for each machine based on a given production sequence.
@@ -46,21 +68,54 @@ def calculate_required_cycle_for_production_sequence(product_machine_cycles_mapp
                             - ...
     """
 
+    cumulative_cycles = calculate_cumulative_cycles(scenario.cycle_matrix, production_sequence)
+
     required_cycles_for_production_sequence = {
-        machine: [] for machine in operating_machines_list
+        machine: cumulative_cycles[row, 1:].tolist() for row, machine in enumerate(scenario.machines)
     }
 
-    accumulated_cycles = {machine: 0 for machine in operating_machines_list}
+    return required_cycles_for_production_sequence
+
+def calculate_downtime_lower_bound(scenario, production_sequence, initial_cycles, maintenance_duration, s_maintenance_max, survival_dict):
+
+    """
+        Calculates a lower bound of the downtime of any order of the products of production_sequence, from the minimum
+        number of maintenances each machine needs:
+            - a machine produces less than (maintenance cycles - current cycle) cycles before each maintenance, where
+              the maintenance cycles are the ones at s_maintenance_max, and starts again from cycle 1 after it
+            - so, with total_cycles for the whole sequence, it needs at least
+              ceil((total_cycles - (maintenance cycles - initial cycle - 1)) / (maintenance cycles - 2)) maintenances
+              (and at least one if it starts beyond its maintenance cycles)
+
+        In the best case the maintenances of all the machines are merged, so the downtime is at least maintenance_duration
+        times the largest number of maintenances of a machine. The bound holds for every simulation where the whole
+        sequence is produced once (an immediate maintenance restarts the sequence, and the maintenances of the
+        interrupted productions could overlap the ones of the restarted production).
+
+        Returns the downtime lower bound and the minimum number of maintenances of each machine.
+    """
 
-    for product in production_sequence:
+    machine_total_cycles = np.bincount(production_sequence, minlength=len(scenario.products)) @ scenario.cycle_matrix
 
-        for machine in operating_machines_list:
+    machine_min_maintenance_counts = {}
 
-            cycles = product_machine_cycles_mapping_dict[machine].get(product, 0)
-            accumulated_cycles[machine] += cycles
-            required_cycles_for_production_sequence[machine].append(accumulated_cycles[machine])
+    for machine_id, machine in enumerate(scenario.machines):
 
-    return required_cycles_for_production_sequence
+        maintenance_cycles = get_survival_cycles(machine, s_maintenance_max, survival_dict)
+        remaining_cycles = maintenance_cycles - initial_cycles.get(machine, 0)
+        cycles_between_maintenances = max(maintenance_cycles - 2, 1) # from cycle 1 to the last cycle before the maintenance cycles
+
+        total_cycles = int(machine_total_cycles[machine_id])
+
+        if remaining_cycles <= 0: # the machine needs immediate maintenance
+            machine_min_maintenance_counts[machine] = max(1, -(-total_cycles // cycles_between_maintenances))
+
+        else:
+            machine_min_maintenance_counts[machine] = max(0, -(-(total_cycles - (remaining_cycles - 1)) // cycles_between_maintenances))
+
+    downtime_lower_bound = maintenance_duration * max(machine_min_maintenance_counts.values(), default=0)
+
+    return downtime_lower_bound, machine_min_maintenance_counts
 
 def calculate_remaining_cycles_until_recommended_maintenance(machine_cycle_numbers, s_maintenance_max, s_maintenance_min, operating_machines_list, survival_dict):
 
@@ -89,48 +144,54 @@ def calculate_remaining_cycles_until_recommended_maintenance(machine_cycle_numbe
     return remaining_cycles_until_start_of_recommended_maintenance, remaining_cycles_until_end_of_recommended_maintenance
 
 
-def divide_production_sequence(product_machine_cycles_mapping_dict, production_sequence, operating_machines_list, machine_cycle_numbers,
+def divide_production_sequence(cumulative_cycles, sequence_start, operating_machines_list, machine_cycle_numbers,
                                s_maintenance_max, s_maintenance_min, survival_dict):
 
     """
-        Divides the production sequence into two parts based on machine maintenance intervals.
+        Divides the production sequence that starts at position sequence_start (and goes until the end of the
+        sequence) into two parts based on machine maintenance intervals.
         The separation point is determined by the machine with the lowest remaining cycles before maintenance.
+
+        The separation position of each machine (the number of products it can produce before reaching its remaining
+        cycles) is found with a binary search in the prefix sums of the sequence cycles (see calculate_cumulative_cycles).
+
+        Returns the machine(s) for maintenance and the separation position (relative to sequence_start):
+            - None, None: no need to divide the sequence
+            - machine, 0: the machine needs immediate maintenance before producing
+            - machine(s), position: the first part of the sequence ends before the product at that position
     """
 
-    required_cycles_for_production_sequence = calculate_required_cycle_for_production_sequence(product_machine_cycles_mapping_dict, production_sequence, operating_machines_list)
     remaining_cycles_until_start_of_recommended_maintenance, remaining_cycles_until_end_of_recommended_maintenance = calculate_remaining_cycles_until_recommended_maintenance(machine_cycle_numbers, s_maintenance_max, s_maintenance_min, operating_machines_list,survival_dict)
 
+    sequence_length = cumulative_cycles.shape[1] - 1 - sequence_start
+
     machines_separation_position = {
         machine: [] for machine in operating_machines_list
     }
 
-    for machine in remaining_cycles_until_start_of_recommended_maintenance.keys():
-
-        machine_separation_position = 0
+    for row, machine in enumerate(operating_machines_list):
 
-        for acumulated_cycles in required_cycles_for_production_sequence[machine]:
+        # first position where the accumulated cycles are greater than the machine's remaining cycles before maintenance
+        machine_separation_position = int(np.searchsorted(cumulative_cycles[row, sequence_start + 1:],
+                                                          cumulative_cycles[row, sequence_start] + remaining_cycles_until_start_of_recommended_maintenance[machine][0]))
 
-            if acumulated_cycles < remaining_cycles_until_start_of_recommended_maintenance[machine][0]:
-                machine_separation_position += 1 # increment the separation position until the accumulated cycles are greater than the machine's remaining cycles before maintenance
-
-            else:
-                machines_separation_position[machine].append(machine_separation_position)
-                break
+        if machine_separation_position < sequence_length:
+            machines_separation_position[machine].append(machine_separation_position)
 
     if all(len(positions) == 0 for positions in machines_separation_position.values()): #if there is no need to divide the sequence <=> the machines can produce the sequence without any maintenance intervals
-        return None, production_sequence, None
+        return None, None
 
 
     valid_machines = [(k, v[0]) for k, v in machines_separation_position.items() if v] # only non-empty lists for separation positions
 
     if not valid_machines:
-        return None, production_sequence, None
+        return None, None
 
 
     machine_for_separation_position, min_separation_position = min(valid_machines, key=lambda item: item[1]) # find the smallest separation position among machines to ensure that no machine operates past its maintenance interval
     all_other_separation_positions = [position for _, position in valid_machines if position != min_separation_position]
 
-    if all(other_position > min_separation_position + 100 for other_position in all_other_separation_positions):
+    if all(other_position > min_separation_position + simultaneous_maintenance_lookahead for other_position in all_other_separation_positions):
         valid_machines = [(machine_for_separation_position, min_separation_position)]
 
 
@@ -140,14 +201,11 @@ def divide_production_sequence(product_machine_cycles_mapping_dict, production_s
         # print('\nPRODUCTION WARNING')
         # print(f'   Machine {machine_for_separation_position} needs immediate maintenance before producing.')
 
-        return machine_for_separation_position, None, None
+        return machine_for_separation_position, 0
 
     if len(valid_machines) == 1: # if only one machine needs maintenance
 
-        first_production_sequence = production_sequence[:min_separation_position]
-        second_production_sequence = production_sequence[min_separation_position:]
-
-        return machine_for_separation_position, first_production_sequence, second_production_sequence
+        return machine_for_separation_position, min_separation_position
 
     elif len(valid_machines) > 1: # if multiple machines need maintenance, check for any overlapping intervals
 
@@ -168,10 +226,7 @@ def divide_production_sequence(product_machine_cycles_mapping_dict, production_s
             machine_for_separation_position = [machine_for_separation_position] + overlapping_machines
 
         # divide the current production sequence in two
-        first_production_sequence = production_sequence[:min_separation_position]
-        second_production_sequence = production_sequence[min_separation_position:]
-
-        return machine_for_separation_position,first_production_sequence, second_production_sequence
+        return machine_for_separation_position, min_separation_position
 
 
 def propagate_machine_cycles(machine_operation_information):
@@ -192,17 +247,17 @@ def propagate_machine_cycles(machine_operation_information):
 
     """
 
-    for machine, time_slots_info in machine_operation_information.items():
-
-        last_cycle_number = None
+    production_flags = machine_operation_information.production_flags
+    cycle_numbers = machine_operation_information.cycle_numbers
 
-        for time_slot, info in time_slots_info.items():
+    valid_cycle = (production_flags == PRODUCING) | (production_flags == MAINTENANCE)
 
-            if info["production_flag"] == "Producing" or info["production_flag"] == "Maintenance":
-                last_cycle_number = info["cycle_number"]
+    # for each timeslot, the index of the last timeslot (up to it) with a valid cycle number, -1 if there is none
+    last_valid_time_slot = np.maximum.accumulate(np.where(valid_cycle, np.arange(cycle_numbers.shape[1]), -1), axis=1)
 
-            elif (info["production_flag"] == "Free" or info["production_flag"] == "Unavailable") and last_cycle_number is not None:
-                info["cycle_number"] = last_cycle_number
+    propagate = ~valid_cycle & (last_valid_time_slot >= 0) # 'Free' or 'Unavailable' after a valid cycle number
+    rows, time_slots = np.nonzero(propagate)
+    cycle_numbers[rows, time_slots] = cycle_numbers[rows, last_valid_time_slot[rows, time_slots]]
 
     return
 
@@ -263,174 +318,887 @@ def check_for_maintenance_overlap(remaining_cycles_until_start_of_recommended_ma
 ####################################################################################################################################################################################
 ####################################################################################################################################################################################
 
-def production_simulation(production_requirements_dict, production_sequence, operating_machines_list,
-                                      initial_cycles, product_machine_cycles_mapping_dict, maintenance_duration,
-                                      s_maintenance_min, s_maintenance_max, survival_dict, logger, optimized_sequence):
+def simulate_production_sequence(production_sequence, scenario, initial_cycles, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict,
+                                 timeline=None, product_counts=None, checkpoints=None, resume_checkpoint=None, join_checkpoints=None):
 
-    product_counts = {  # to save how many times a product type has been scheduled for a certain machine
-        machine: {product: 0 for product in production_requirements_dict} for machine in operating_machines_list}
+    """
+        Simulates the production of a sequence (array of product IDs of the CompiledScenario), splitting it whenever
+        maintenance is needed, and returns:
+            - scheduled_maintenance_intervals: list of (machine, (maintenance_start_time, maintenance_end_time))
+            - machine_maintenance_counts: number of times each machine was under maintenance
+            - final_time_slot: last time slot of the production (the first time slot where all machines are 'Free', minus 1)
+            - end_state: the state of the simulation when it ended, in the checkpoint format (see below)
+
+        The production and maintenance events are only recorded if a timeline is given. Without it only the
+        maintenance intervals are computed, which is all the optimization algorithm needs.
+
+        Checkpoints (used by evaluate_production_sequence_incrementally, only without a timeline):
+            - checkpoints: if given, a checkpoint of the simulation state is appended to it at the start of each part
+                           of the divided sequence (segment boundary, where position = sequence_start) and every
+                           segment_checkpoint_interval products inside each part. Each checkpoint keeps the division of
+                           its part of the sequence (machine(s) for maintenance and separation position)
+            - resume_checkpoint: if given, the simulation starts from this checkpoint instead of time slot 0 (inside a
+                                 part of the sequence, with the division of the checkpoint)
+            - join_checkpoints: {position: checkpoint} of another simulation. When this simulation reaches the position
+                                of one of them in the same state (right after a maintenance with the same machine cycle
+                                numbers, or inside the same part of the sequence with the same division, cycle numbers and
+                                machine end times relative to time_slot_0), the rest of the simulation would be the same
+                                (shifted in time), so it stops there and end_state['joined_checkpoint'] is set to that checkpoint
+    """
 
-    time_slot_0 = 0 # assuming that the simulation always starts from time slot 0
+    record_timeline = timeline is not None
 
-    schedule, time_slots = schedule_setup(operating_machines_list)
+    operating_machines_list = scenario.machines
+    machine_ids = scenario.machine_ids
 
-    machine_end_times = {machine: 0 for machine in operating_machines_list} # to store the time slot when each machine will be available
-    machine_cycle_numbers = {machine: initial_cycles.get(machine, 0) for machine in operating_machines_list} # initialize the initial cycle number for each machine based on the initial_cycles dictionary
+    # the machine states are lists indexed by machine ID
+    if resume_checkpoint is None:
 
-    scheduled_maintenance_intervals = []
+        time_slot_0 = 0 # assuming that the simulation always starts from time slot 0
 
-    machine_operation_information = {
-        machine: {
-            time_slot: {
-                "cycle_number": 0,
-                "production_flag": "Free",
-                "product_label": None
-            }
-            for time_slot in time_slots
-        }
-        for machine in operating_machines_list
-    }
+        machine_end_times = [0] * len(operating_machines_list) # to store the time slot when each machine will be available
+        machine_cycle_numbers = [initial_cycles.get(machine, 0) for machine in operating_machines_list] # initialize the initial cycle number for each machine based on the initial_cycles dictionary
+
+        scheduled_maintenance_intervals = []
+        last_busy_time_slot = 0 # first time slot after all the production and maintenance scheduled so far
 
-    first_production_sequence = production_sequence
+        sequence_start = 0 # the part of the sequence still to produce goes from sequence_start to the end of the sequence
+        position = 0 # next product to produce
+        division = None # (machine(s) for maintenance, separation position) of the part of the sequence being produced
+        dependency_end = 0 # the state of the simulation depends only on the products before this position
+        after_split_maintenance = False # if the last event was the maintenance between two parts of the sequence
+        immediate_maintenance_count = 0
+
+        aux_count_machine_maintenance = {machine: 0 for machine in operating_machines_list}
+
+    else:
+
+        time_slot_0 = resume_checkpoint['time_slot_0']
+
+        machine_end_times = list(resume_checkpoint['machine_end_times'])
+        machine_cycle_numbers = list(resume_checkpoint['machine_cycle_numbers'])
+
+        scheduled_maintenance_intervals = list(resume_checkpoint['scheduled_maintenance_intervals'])
+        last_busy_time_slot = resume_checkpoint['last_busy_time_slot']
+
+        sequence_start = resume_checkpoint['sequence_start']
+        position = resume_checkpoint['position']
+        division = resume_checkpoint['division'] if position > sequence_start else None # at a segment boundary the division is computed again
+        dependency_end = resume_checkpoint['dependency_end']
+        after_split_maintenance = resume_checkpoint['after_split_maintenance']
+        immediate_maintenance_count = resume_checkpoint['immediate_maintenance_count']
+
+        aux_count_machine_maintenance = dict(resume_checkpoint['machine_maintenance_counts'])
+
+    # prefix sums of the cycles of the whole sequence, computed once and used to divide every part of the sequence
+    cumulative_cycles = calculate_cumulative_cycles(scenario.cycle_matrix, production_sequence)
+
+    product_operations = scenario.product_operations # (machine ID, cycles) of the machines required for each product ID, in the order of the production line
+    product_ids = production_sequence.tolist()
+
+    def simulation_state():
+        return {
+            'sequence_start': sequence_start,
+            'position': position,
+            'division': division,
+            'dependency_end': dependency_end,
+            'after_split_maintenance': after_split_maintenance,
+            'immediate_maintenance_count': immediate_maintenance_count,
+            'time_slot_0': time_slot_0,
+            'last_busy_time_slot': last_busy_time_slot,
+            'machine_end_times': list(machine_end_times),
+            'machine_cycle_numbers': list(machine_cycle_numbers),
+            'machine_maintenance_counts': dict(aux_count_machine_maintenance),
+            'scheduled_maintenance_intervals': tuple(scheduled_maintenance_intervals),
+            'joined_checkpoint': None
+        }
 
     # print('\n************************************************************************************************')
-    # print(f'   REQUIRED SEQUENCE {first_production_sequence}')
+    # print(f'   REQUIRED SEQUENCE {production_sequence}')
     # print('************************************************************************************************')
 
     aux_count = 0
-    aux_count_machine_maintenance = {machine: 0 for machine in operating_machines_list}
+    immediate_maintenance_cycle_numbers = set() # machine cycle numbers after each immediate maintenance
+
+    def joined_state():
+
+        """
+            Checkpoint of join_checkpoints whose state is the current one, if any.
+        """
+
+        join_checkpoint = join_checkpoints.get(position)
+
+        if join_checkpoint is None or join_checkpoint['machine_cycle_numbers'] != machine_cycle_numbers:
+            return None
+
+        if position == sequence_start: # right after a maintenance, when all the machines are free
+            return join_checkpoint if after_split_maintenance and join_checkpoint['position'] == join_checkpoint['sequence_start'] else None
+
+        if join_checkpoint['sequence_start'] != sequence_start or join_checkpoint['division'] != division:
+            return None
+
+        join_time_slot_0 = join_checkpoint['time_slot_0']
+
+        if join_checkpoint['last_busy_time_slot'] - join_time_slot_0 != last_busy_time_slot - time_slot_0:
+            return None
+
+        # the machines that are free before time_slot_0 start the next product at time_slot_0 anyway
+        for end_time, join_end_time in zip(machine_end_times, join_checkpoint['machine_end_times']):
+            if max(end_time - time_slot_0, 0) != max(join_end_time - join_time_slot_0, 0):
+                return None
+
+        return join_checkpoint
+
+    def joined_end(joined_checkpoint):
+
+        end_state = simulation_state()
+        end_state['joined_checkpoint'] = joined_checkpoint
+
+        return scheduled_maintenance_intervals, aux_count_machine_maintenance, last_busy_time_slot - 1, end_state
+
+    while sequence_start < len(production_sequence):
+
+        if division is None: # segment boundary
+
+            if join_checkpoints:
+
+                joined_checkpoint = joined_state()
+                if joined_checkpoint is not None: # the rest of the simulation is already known
+                    return joined_end(joined_checkpoint)
+
+            if checkpoints is not None:
+                checkpoints.append(simulation_state())
+
+            division = divide_production_sequence(cumulative_cycles, sequence_start, operating_machines_list, dict(zip(operating_machines_list, machine_cycle_numbers)), s_maintenance_max, s_maintenance_min, survival_dict)
+
+            if checkpoints is not None:
+                checkpoints[-1]['division'] = division
+
+            # the division depends on the products up to the lookahead after the separation position (or on all the rest of the sequence)
+            if division[1] is None:
+                dependency_end = len(production_sequence)
+
+            else:
+                dependency_end = max(dependency_end, min(len(production_sequence), sequence_start + division[1] + simultaneous_maintenance_lookahead + 1))
 
-    while first_production_sequence is not None:
+        machine_for_separation_position, separation_position = division
 
-        machine_for_separation_position, first_production_sequence, second_production_sequence = divide_production_sequence(product_machine_cycles_mapping_dict, first_production_sequence, operating_machines_list, machine_cycle_numbers,s_maintenance_max, s_maintenance_min, survival_dict)
-        # if first_production_sequence and second_production_sequence:
-        if first_production_sequence:
+        if separation_position != 0:
+
+            sequence_end = len(production_sequence) if separation_position is None else sequence_start + separation_position
 
             aux_count += 1
 
             # print('\n-------------------------------------------------------------------')
-            # print(f'SIMULATING SEQUENCE {aux_count} {first_production_sequence}')
+            # print(f'SIMULATING SEQUENCE {aux_count} {scenario.decode_sequence(production_sequence[sequence_start:sequence_end])}')
             # print('-------------------------------------------------------------------')
 
-            for product in first_production_sequence:
+            while position < sequence_end:
+
+                if position > sequence_start: # checkpoint inside the part of the sequence, every segment_checkpoint_interval products
+
+                    if join_checkpoints:
+
+                        joined_checkpoint = joined_state()
+                        if joined_checkpoint is not None: # the rest of the simulation is already known
+                            return joined_end(joined_checkpoint)
+
+                    if checkpoints is not None:
+                        checkpoints.append(simulation_state())
 
-                # print(f'\n  ****PRODUCT {product}****')
+                chunk_end = min(sequence_end, position + segment_checkpoint_interval)
 
-                product_start_time = time_slot_0
+                for product_id in product_ids[position:chunk_end]:
 
-                for machine in operating_machines_list:
+                    # print(f'\n  ****PRODUCT {scenario.products[product_id]}****')
 
-                    # print(f'\n     Machine {machine}')
+                    product_start_time = time_slot_0
 
-                    production_cycles = product_machine_cycles_mapping_dict[machine].get(product, 0) # number of cycles required for the machine to produce that product
+                    for machine_id, production_cycles in product_operations[product_id]: # number of cycles required for the machine to produce that product
 
-                    if production_cycles > 0: # if the machine is required for the current product
+                        # print(f'\n     Machine {operating_machines_list[machine_id]}')
 
-                        current_cycle_number = machine_cycle_numbers[machine]
+                        current_cycle_number = machine_cycle_numbers[machine_id]
 
-                        start_time = max(product_start_time, machine_end_times[machine]) # the start time for the machine's operation can only be when the machine is free
+                        start_time = max(product_start_time, machine_end_times[machine_id]) # the start time for the machine's operation can only be when the machine is free
 
-                        update_schedule_for_product(schedule, product, machine, start_time, production_cycles, machine_operation_information, current_cycle_number, product_counts)
+                        if record_timeline: # the timeline is only for the reports, with the product and machine labels
+                            update_schedule_for_product(timeline, scenario.products[product_id], operating_machines_list[machine_id], start_time, production_cycles, current_cycle_number, product_counts)
 
-                        for current_cycle in range(production_cycles):
+                        machine_cycle_numbers[machine_id] = current_cycle_number + production_cycles # update the machine's "starting" cycle number after it finishes the current product to ensure that the next product starts from the correct cycle number
 
-                            # print(f'     - Machine Cycle Number: {current_cycle_number}')
-                            current_cycle_number += 1
+                        machine_end_times[machine_id] = start_time + production_cycles # update when the machine will be free / operation ends
 
-                        machine_cycle_numbers[machine] = current_cycle_number # update the machine's "starting" cycle number after it finishes the current product to ensure that the next product starts from the correct cycle number
+                        product_start_time = machine_end_times[machine_id] # update the starting time slot for the next cycle
 
-                        machine_end_times[machine] = start_time + production_cycles # update when the machine will be free / operation ends
+                        last_busy_time_slot = max(last_busy_time_slot, product_start_time)
 
-                        product_start_time = machine_end_times[machine] # update the starting time slot for the next cycle
+                position = chunk_end
 
 
-            if second_production_sequence is not None:
+            if separation_position is not None:
 
-                maintenance_start_time = max(machine_end_times.values())
+                maintenance_start_time = max(machine_end_times)
                 time_slot_0 = maintenance_start_time + maintenance_duration # the next timeslot available for production is after maintenance
 
-                update_schedule_for_maintenance(schedule, maintenance_start_time, machine_for_separation_position, machine_operation_information, operating_machines_list, maintenance_duration, scheduled_maintenance_intervals)
+                if record_timeline:
+                    update_schedule_for_maintenance(timeline, maintenance_start_time, machine_for_separation_position, maintenance_duration)
+
+                add_scheduled_maintenance_intervals(scheduled_maintenance_intervals, maintenance_start_time, machine_for_separation_position, maintenance_duration)
+                last_busy_time_slot = max(last_busy_time_slot, maintenance_start_time + maintenance_duration)
 
                 if isinstance(machine_for_separation_position,list):  # if it's a list <=> multiple machines were under maintenance/repaired
                     for machine in machine_for_separation_position:
 
-                        if machine in machine_cycle_numbers:
-                            machine_cycle_numbers[machine] = 1
+                        if machine in machine_ids:
+                            machine_cycle_numbers[machine_ids[machine]] = 1
                             aux_count_machine_maintenance[machine] += 1
 
                 else:  # if only a machine was under maintenance
-                    if machine_for_separation_position in machine_cycle_numbers:
-                        machine_cycle_numbers[machine_for_separation_position] = 1
+                    if machine_for_separation_position in machine_ids:
+                        machine_cycle_numbers[machine_ids[machine_for_separation_position]] = 1
                         aux_count_machine_maintenance[machine_for_separation_position] += 1
 
-                first_production_sequence = second_production_sequence
+                sequence_start = sequence_end
+                division = None
+                after_split_maintenance = True
 
             else:
                 break
 
         # case when the machine needs immediate maintenance before the production starts
-        elif machine_for_separation_position  and not first_production_sequence and not second_production_sequence:
-
-            update_schedule_for_maintenance(schedule, time_slot_0, machine_for_separation_position, machine_operation_information, operating_machines_list, maintenance_duration, scheduled_maintenance_intervals)
+        else:
 
-            machine_for_separation_position = str(machine_for_separation_position)
+            if record_timeline:
+                update_schedule_for_maintenance(timeline, time_slot_0, machine_for_separation_position, maintenance_duration)
 
-            if isinstance(machine_for_separation_position, list): # if it's a list <=> multiple machines were under maintenance/repaired
-                for machine in machine_for_separation_position:
+            add_scheduled_maintenance_intervals(scheduled_maintenance_intervals, time_slot_0, machine_for_separation_position, maintenance_duration)
+            last_busy_time_slot = max(last_busy_time_slot, time_slot_0 + maintenance_duration)
 
-                    if machine in machine_cycle_numbers:
-                        machine_cycle_numbers[machine] = 1
-                        aux_count_machine_maintenance[machine] += 1
+            if machine_for_separation_position in machine_ids: # only one machine can need immediate maintenance
+                machine_cycle_numbers[machine_ids[machine_for_separation_position]] = 1
+                aux_count_machine_maintenance[machine_for_separation_position] += 1
 
-            else: # if only a machine was under maintenance
-                if machine_for_separation_position in machine_cycle_numbers:
-                    machine_cycle_numbers[machine_for_separation_position] = 1
-                    aux_count_machine_maintenance[machine_for_separation_position] += 1
+            # the whole sequence is divided again from these cycle numbers, so if they were already reached after
+            # another immediate maintenance the same divisions repeat forever
+            restart_cycle_numbers = tuple(machine_cycle_numbers)
+            if restart_cycle_numbers in immediate_maintenance_cycle_numbers:
+                raise ValueError(f"The production sequence can't be completed: the immediate maintenances repeat endlessly (machine cycle numbers {dict(zip(operating_machines_list, machine_cycle_numbers))})")
+            immediate_maintenance_cycle_numbers.add(restart_cycle_numbers)
 
             time_slot_0 = maintenance_duration
-            first_production_sequence = production_sequence
+            sequence_start = 0 # the whole sequence is produced after the maintenance
+            position = 0
+            division = None
+            after_split_maintenance = False
+            immediate_maintenance_count += 1
             continue
 
-        else:
-            break
+    # the production and maintenance timeslots always form one contiguous block starting at t0 (every operation starts
+    # at t0, when its machine becomes free or when the previous machine finishes the product), so the first time slot
+    # where all machines are 'Free' is the end of that block
+    final_time_slot = last_busy_time_slot - 1
+
+    return scheduled_maintenance_intervals, aux_count_machine_maintenance, final_time_slot, simulation_state()
+
+
+def add_scheduled_maintenance_intervals(scheduled_maintenance_intervals, maintenance_start_time, machine_under_maintenance, maintenance_duration):
+
+    """
+        Adds the maintenance interval of each machine under maintenance to the list of scheduled maintenance intervals.
+    """
+
+    if isinstance(machine_under_maintenance, str):
+        machine_under_maintenance = [machine_under_maintenance] # since machine_under_maintenance can either be 1 or multiple, always treat it as list
+
+    for machine in machine_under_maintenance:
+        scheduled_maintenance_intervals.append((machine, (maintenance_start_time, maintenance_start_time+maintenance_duration-1)))
+
+
+def evaluate_production_sequence(production_sequence, scenario, initial_cycles, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict):
+
+    """
+        Fast evaluation of a production sequence, used by the optimization algorithm: computes only the maintenance
+        intervals, the total downtime and the final time slot of the production, without recording the production
+        timeline. The results are identical to production_simulation.
+    """
+
+    scheduled_maintenance_intervals, _, final_time_slot, _ = simulate_production_sequence(production_sequence, scenario, initial_cycles, maintenance_duration,
+                                                                                          s_maintenance_min, s_maintenance_max, survival_dict)
 
-    propagate_machine_cycles(machine_operation_information) # update machine's cycles in machine_operation_information
     total_downtime = calculate_downtime(scheduled_maintenance_intervals)
 
-    # ------ NOTA ------
-    # esta solução não é a mais robusta pq estou a assumir que qnd as todas as máquinas estão 'Free' ao mesmo
-    # tempo é pq a produção acabou (na maneira como o scheduling está agora não há problema, só haveria problema
-    # se essa lógica fosse alterada)
+    return scheduled_maintenance_intervals, total_downtime, final_time_slot
 
-    for final_time_slot in machine_operation_information[next(iter(machine_operation_information))].keys():
 
-        # to calculate the total duration of the production, by seeing what is the first time slot where all machines are Free
-        all_free = True
+def evaluate_production_sequence_incrementally(production_sequence, scenario, initial_cycles, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict,
+                                               reference_evaluation=None, changed_positions=None):
 
-        for machine in machine_operation_information:
-            if machine_operation_information[machine][final_time_slot]['production_flag'] != 'Free':
-                all_free = False
+    """
+        Evaluates a production sequence like evaluate_production_sequence, keeping checkpoints of the simulation state
+        (machine cycle numbers, end times, maintenance intervals, ...) at each segment boundary and every
+        segment_checkpoint_interval products inside the segments.
+
+        Given the evaluation of a reference sequence with the same length that only differs from this one at
+        changed_positions (e.g. the current sequence of the optimization algorithm and one of its neighbors), the
+        simulation resumes from the last checkpoint before the first changed product whose divisions of the sequence
+        are still the same (the divisions that depend on the changed products, through the lookahead, are computed
+        again for this sequence and compared with the reference), and stops as soon as it reaches the state of the
+        reference simulation at a checkpoint after the last changed product.
+        The results are identical to a full evaluation.
+
+        Returns the evaluation as a dict with: scheduled_maintenance_intervals, total_downtime, final_time_slot,
+        machine_maintenance_counts, checkpoints and end_state.
+    """
+
+    checkpoints = []
+    resume_checkpoint = None
+    join_checkpoints = None
+
+    if reference_evaluation is not None:
+
+        if not changed_positions:
+            return reference_evaluation
+
+        first_changed_position = min(changed_positions)
+        last_changed_position = max(changed_positions)
+
+        cumulative_cycles = calculate_cumulative_cycles(scenario.cycle_matrix, production_sequence)
+
+        valid_checkpoints = [] # the checkpoints are in the order of the reference simulation
+        division = None # division of this sequence at the last segment boundary, if it's different from the reference
+        for checkpoint in reference_evaluation['checkpoints']:
+
+            if checkpoint['position'] > first_changed_position:
                 break
 
-        if all_free:
+            if checkpoint['position'] == checkpoint['sequence_start']: # segment boundary
+
+                if division is not None: # the previous segment ends at another position
+                    break
+
+                segment_division = divide_checkpoint_segment(checkpoint, cumulative_cycles, first_changed_position, scenario, s_maintenance_min, s_maintenance_max, survival_dict)
+
+                if segment_division != checkpoint['division']:
+
+                    division = segment_division
+                    segment_checkpoint_index = len(valid_checkpoints)
+                    segment_end = len(production_sequence) if division[1] is None else checkpoint['sequence_start'] + division[1]
+                    dependency_end = len(production_sequence) if division[1] is None else max(checkpoint['dependency_end'], min(len(production_sequence), segment_end + simultaneous_maintenance_lookahead + 1))
+
+            elif division is not None and checkpoint['position'] > segment_end:
+                break
+
+            valid_checkpoints.append(checkpoint)
+
+        # the products before the checkpoints inside a segment whose division changed are produced in the same way,
+        # only the end of the segment is different
+        if division is not None:
+            valid_checkpoints[segment_checkpoint_index:] = [{**checkpoint, 'division': division} if checkpoint['position'] == checkpoint['sequence_start']
+                                                            else {**checkpoint, 'division': division, 'dependency_end': dependency_end}
+                                                            for checkpoint in valid_checkpoints[segment_checkpoint_index:]]
+
+        if valid_checkpoints:
+            resume_checkpoint = valid_checkpoints[-1]
+            checkpoints = valid_checkpoints[:-1] # the resume checkpoint is added again when the simulation resumes
+
+        reference_immediate_maintenance_count = reference_evaluation['end_state']['immediate_maintenance_count']
+
+        join_checkpoints = {
+            checkpoint['position']: checkpoint for checkpoint in reference_evaluation['checkpoints']
+            if checkpoint['position'] > last_changed_position
+            and checkpoint['immediate_maintenance_count'] == reference_immediate_maintenance_count # no immediate maintenance (that restarts the sequence) afterwards
+        }
+
+    scheduled_maintenance_intervals, machine_maintenance_counts, final_time_slot, end_state = simulate_production_sequence(production_sequence, scenario, initial_cycles, maintenance_duration,
+                                                                                                                          s_maintenance_min, s_maintenance_max, survival_dict,
+                                                                                                                          checkpoints=checkpoints, resume_checkpoint=resume_checkpoint,
+                                                                                                                          join_checkpoints=join_checkpoints)
+
+    joined_checkpoint = end_state['joined_checkpoint']
+
+    if joined_checkpoint is not None: # the rest of the simulation is the rest of the reference simulation, shifted in time
+
+        reference_checkpoints = reference_evaluation['checkpoints']
+        joined_checkpoint_index = next(index for index, checkpoint in enumerate(reference_checkpoints) if checkpoint is joined_checkpoint)
+
+        checkpoints += [shift_checkpoint(checkpoint, joined_checkpoint, end_state) for checkpoint in reference_checkpoints[joined_checkpoint_index:]]
+        end_state = shift_checkpoint(reference_evaluation['end_state'], joined_checkpoint, end_state)
+
+        scheduled_maintenance_intervals = list(end_state['scheduled_maintenance_intervals'])
+        machine_maintenance_counts = end_state['machine_maintenance_counts']
+        final_time_slot = end_state['last_busy_time_slot'] - 1
+
+    return {
+        'scheduled_maintenance_intervals': scheduled_maintenance_intervals,
+        'total_downtime': calculate_downtime(scheduled_maintenance_intervals),
+        'final_time_slot': final_time_slot,
+        'machine_maintenance_counts': machine_maintenance_counts,
+        'checkpoints': checkpoints,
+        'end_state': end_state
+    }
+
+
+def divide_checkpoint_segment(checkpoint, cumulative_cycles, first_changed_position, scenario, s_maintenance_min, s_maintenance_max, survival_dict):
+
+    """
+        Division of the sequence at a segment boundary checkpoint of a reference simulation, for a sequence that only
+        differs from the reference from first_changed_position on, given the cumulative cycles of that sequence: it can
+        only be different from the division of the reference if first_changed_position is before the lookahead after
+        the separation position, and then it's computed again.
+    """
+
+    separation_position = checkpoint['division'][1]
+
+    if separation_position is not None and checkpoint['sequence_start'] + separation_position + simultaneous_maintenance_lookahead + 1 <= first_changed_position:
+        return checkpoint['division']
+
+    return divide_production_sequence(cumulative_cycles, checkpoint['sequence_start'], scenario.machines, dict(zip(scenario.machines, checkpoint['machine_cycle_numbers'])),
+                                      s_maintenance_max, s_maintenance_min, survival_dict)
+
+
+def estimate_production_sequence_downtime(production_sequence, scenario, initial_cycles, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict,
+                                           reference_evaluation, changed_positions):
+
+    """
+        Surrogate of the downtime of a production sequence that only differs from the sequence of reference_evaluation
+        (see evaluate_production_sequence_incrementally) at changed_positions: only the divisions of the sequence (the
+        crossing points of the cumulative cycles, see divide_production_sequence) are computed, from the last checkpoint
+        of the reference that doesn't depend on the changed products, without scheduling the products. Each division
+        adds a maintenance, and once the divisions reach a segment boundary of the reference with the same machine
+        cycle numbers, the rest of the downtime is the one of the reference.
+
+        The immediate maintenances before the first product are added like in the simulation (the first one at time
+        slot 0 and the others at maintenance_duration, so they add at most two maintenances), but an immediate
+        maintenance after a division interrupts the production (and its maintenances could overlap the ones of the
+        restarted production), so in that case None is returned: the surrogate is only used to screen the neighbors
+        of the optimization algorithm before simulating them.
+    """
+
+    operating_machines_list = scenario.machines
+    machine_ids = scenario.machine_ids
 
-            final_time_slot = int(final_time_slot[1:])
-            final_time_slot = final_time_slot - 1
+    first_changed_position = min(changed_positions)
+    last_changed_position = max(changed_positions)
+
+    segment_checkpoints = [checkpoint for checkpoint in reference_evaluation['checkpoints'] if checkpoint['position'] == checkpoint['sequence_start']] # segment boundaries
+
+    resume_checkpoint = None
+    for checkpoint in segment_checkpoints: # ordered by dependency_end
+
+        if checkpoint['dependency_end'] > first_changed_position:
+            break
+
+        resume_checkpoint = checkpoint
+
+    if resume_checkpoint is None:
+        machine_cycle_numbers = [initial_cycles.get(machine, 0) for machine in operating_machines_list]
+        sequence_start = 0
+        after_split_maintenance = False
+        downtime = 0
+
+    else:
+        machine_cycle_numbers = list(resume_checkpoint['machine_cycle_numbers'])
+        sequence_start = resume_checkpoint['sequence_start']
+        after_split_maintenance = resume_checkpoint['after_split_maintenance']
+        downtime = calculate_downtime(resume_checkpoint['scheduled_maintenance_intervals'])
+
+    reference_immediate_maintenance_count = reference_evaluation['end_state']['immediate_maintenance_count']
+
+    join_checkpoints = {
+        checkpoint['sequence_start']: checkpoint for checkpoint in segment_checkpoints
+        if checkpoint['sequence_start'] > last_changed_position and checkpoint['after_split_maintenance']
+        and checkpoint['immediate_maintenance_count'] == reference_immediate_maintenance_count
+    }
+
+    cumulative_cycles = calculate_cumulative_cycles(scenario.cycle_matrix, production_sequence)
+    immediate_maintenance_cycle_numbers = set()
+
+    while sequence_start < len(production_sequence):
+
+        if after_split_maintenance and sequence_start in join_checkpoints and join_checkpoints[sequence_start]['machine_cycle_numbers'] == machine_cycle_numbers:
+
+            joined_checkpoint = join_checkpoints[sequence_start]
+
+            return downtime + reference_evaluation['total_downtime'] - calculate_downtime(joined_checkpoint['scheduled_maintenance_intervals'])
+
+        machine_for_separation_position, separation_position = divide_production_sequence(cumulative_cycles, sequence_start, operating_machines_list, dict(zip(operating_machines_list, machine_cycle_numbers)),
+                                                                                          s_maintenance_max, s_maintenance_min, survival_dict)
+
+        if separation_position is None:
             break
 
-    if optimized_sequence: # only prints the information for the optimized sequence that was returned by the optimization algorithm
+        if separation_position == 0:
+
+            if sequence_start > 0:
+                return None
+
+            machine_cycle_numbers[machine_ids[machine_for_separation_position]] = 1
+
+            if tuple(machine_cycle_numbers) in immediate_maintenance_cycle_numbers: # they repeat endlessly
+                return None
+
+            if len(immediate_maintenance_cycle_numbers) < 2: # the next ones overlap the second one
+                downtime += maintenance_duration
+
+            immediate_maintenance_cycle_numbers.add(tuple(machine_cycle_numbers))
+            continue
+
+        sequence_end = sequence_start + separation_position
+        machine_cycle_numbers = (np.array(machine_cycle_numbers) + cumulative_cycles[:, sequence_end] - cumulative_cycles[:, sequence_start]).tolist()
+
+        maintained_machines = machine_for_separation_position if isinstance(machine_for_separation_position, list) else [machine_for_separation_position]
+        for machine in maintained_machines:
+            if machine in machine_ids:
+                machine_cycle_numbers[machine_ids[machine]] = 1
+
+        downtime += maintenance_duration # the maintenances of different divisions are separated by production, so they don't merge
+        sequence_start = sequence_end
+        after_split_maintenance = True
+
+    return downtime
+
+
+def shift_checkpoint(checkpoint, joined_checkpoint, join_state):
+
+    """
+        Translates a checkpoint of a reference simulation, taken after joined_checkpoint, to the simulation that reached
+        the same state as joined_checkpoint in join_state: the times are shifted and the maintenance intervals and counts
+        of the reference before joined_checkpoint are replaced by the ones of join_state.
+    """
+
+    time_shift = join_state['time_slot_0'] - joined_checkpoint['time_slot_0']
+    joined_intervals_count = len(joined_checkpoint['scheduled_maintenance_intervals'])
+
+    shifted_intervals = [(machine, (maintenance_start_time + time_shift, maintenance_end_time + time_shift))
+                         for machine, (maintenance_start_time, maintenance_end_time) in checkpoint['scheduled_maintenance_intervals'][joined_intervals_count:]]
+
+    # machines that didn't produce after joined_checkpoint keep the end time they had in join_state
+    machine_end_times = [end_time + time_shift if end_time > joined_checkpoint['time_slot_0'] else join_state['machine_end_times'][machine_id]
+                         for machine_id, end_time in enumerate(checkpoint['machine_end_times'])]
+
+    machine_maintenance_counts = {machine: join_state['machine_maintenance_counts'][machine] + count - joined_checkpoint['machine_maintenance_counts'][machine]
+                                  for machine, count in checkpoint['machine_maintenance_counts'].items()}
+
+    return {
+        **checkpoint,
+        'dependency_end': max(checkpoint['dependency_end'], join_state['dependency_end']),
+        'immediate_maintenance_count': join_state['immediate_maintenance_count'],
+        'time_slot_0': checkpoint['time_slot_0'] + time_shift,
+        'last_busy_time_slot': checkpoint['last_busy_time_slot'] + time_shift,
+        'machine_end_times': machine_end_times,
+        'machine_maintenance_counts': machine_maintenance_counts,
+        'scheduled_maintenance_intervals': join_state['scheduled_maintenance_intervals'] + tuple(shifted_intervals),
+        'joined_checkpoint': None
+    }
+
+
+def calculate_downtimes(maintenance_start_times, maintenance_counts, maintenance_duration):
+
+    """
+        Vectorized calculate_downtime for many simulations at once: maintenance_start_times is a (simulations x events)
+        array with the start time of each maintenance (all of them last maintenance_duration timeslots), where only the
+        first maintenance_counts[k] events of row k are used. Returns the production downtime of each simulation.
+    """
+
+    used_events = np.arange(maintenance_start_times.shape[1])[None, :] < maintenance_counts[:, None]
+
+    sentinel_time = np.iinfo(np.int64).max // 4 # the unused events are sorted after the used ones
+    start_times = np.sort(np.where(used_events, maintenance_start_times, sentinel_time), axis=1)
+    end_times = start_times + maintenance_duration - 1
+
+    # each interval only adds its timeslots after the end of the intervals that start before it
+    previous_end_times = np.full(start_times.shape, -sentinel_time, dtype=np.int64)
+    previous_end_times[:, 1:] = np.maximum.accumulate(end_times, axis=1)[:, :-1]
+
+    added_time_slots = np.clip(end_times - np.maximum(start_times, previous_end_times + 1) + 1, 0, None)
+
+    return np.where(used_events, added_time_slots, 0).sum(axis=1)
+
+def divide_production_sequences(cumulative_cycles, cumulative_cycle_keys, key_step, rows, sequence_starts, machine_cycle_numbers,
+                                cycles_for_start_of_recommended_maintenance, cycles_for_end_of_recommended_maintenance):
+
+    """
+        Vectorized divide_production_sequence for some rows of a batch of production sequences:
+            - cumulative_cycles: (sequences x machines x (positions + 1)) prefix sums of the cycles of each sequence
+            - cumulative_cycle_keys, key_step: the flattened cumulative_cycles, where key_step * r was added to the
+                                               r-th (sequence, machine) row so that the whole array is sorted
+            - rows, sequence_starts, machine_cycle_numbers: the sequences to divide, the position where their remaining
+                                                            part starts and their (rows x machines) cycle numbers
+            - cycles_for_start/end_of_recommended_maintenance: cycle number of each machine at s_maintenance_max/min
+
+        Returns, for each row, the separation position (-1 if there is no need to divide the sequence, 0 if a machine
+        needs immediate maintenance) and the indexes of the machines for maintenance, in the same order as
+        divide_production_sequence returns them and padded with -1.
+    """
+
+    machines_count = cumulative_cycles.shape[1]
+    positions_count = cumulative_cycles.shape[2] - 1
+
+    machine_indexes = np.arange(machines_count)
+    row_indexes = np.arange(len(rows))
+
+    cumulative_cycles_at_start = cumulative_cycles[rows[:, None], machine_indexes[None, :], sequence_starts[:, None]]
+    cumulative_cycles_at_end = cumulative_cycles[rows, :, -1]
+
+    remaining_cycles_until_start_of_recommended_maintenance = cycles_for_start_of_recommended_maintenance[None, :] - machine_cycle_numbers
+    remaining_cycles_until_end_of_recommended_maintenance = cycles_for_end_of_recommended_maintenance[None, :] - machine_cycle_numbers
+
+    # first position (after sequence_start) where the accumulated cycles reach the remaining cycles of each machine, found
+    # with one binary search for all the rows (clipping the targets to the values of each row doesn't change the result)
+    key_rows = rows[:, None] * machines_count + machine_indexes[None, :]
+
+    targets = np.clip(cumulative_cycles_at_start + remaining_cycles_until_start_of_recommended_maintenance,
+                      cumulative_cycles_at_start, cumulative_cycles_at_end + 1)
+
+    key_positions = np.searchsorted(cumulative_cycle_keys, targets + key_rows * key_step)
+    machines_separation_position = np.maximum(key_positions - key_rows * (positions_count + 1) - sequence_starts[:, None] - 1, 0)
+
+    valid_machines = machines_separation_position < (positions_count - sequence_starts)[:, None]
+
+    # machine with the smallest separation position (the first one in case of a tie)
+    masked_separation_positions = np.where(valid_machines, machines_separation_position, positions_count + 1)
+    machine_for_separation_position = np.argmin(masked_separation_positions, axis=1)
+    min_separation_position = masked_separation_positions[row_indexes, machine_for_separation_position]
+
+    other_machines = valid_machines & (machines_separation_position != min_separation_position[:, None])
+    single_machine = ~np.any(other_machines & (machines_separation_position <= min_separation_position[:, None] + simultaneous_maintenance_lookahead), axis=1)
+
+    # check_for_maintenance_overlap: the machines sorted by the start of their recommended maintenance interval form a new
+    # group when their interval starts after the end of all the previous ones, and the groups with more than one machine overlap
+    sorted_machines = np.argsort(remaining_cycles_until_start_of_recommended_maintenance, axis=1, kind='stable')
+    sorted_start_times = np.take_along_axis(remaining_cycles_until_start_of_recommended_maintenance, sorted_machines, axis=1)
+    sorted_end_times = np.take_along_axis(remaining_cycles_until_end_of_recommended_maintenance, sorted_machines, axis=1)
+
+    new_group = np.ones(sorted_machines.shape, dtype=bool)
+    new_group[:, 1:] = sorted_start_times[:, 1:] > np.maximum.accumulate(sorted_end_times, axis=1)[:, :-1]
+
+    group_continues = np.zeros(sorted_machines.shape, dtype=bool)
+    group_continues[:, :-1] = ~new_group[:, 1:]
+
+    overlapping = (~new_group | group_continues) & ~(single_machine | (min_separation_position == 0))[:, None]
+
+    # maintenance order: the machine with the smallest separation position, then the overlapping machines
+    maintenance_ranks = np.full(sorted_machines.shape, machines_count + 1)
+    np.put_along_axis(maintenance_ranks, sorted_machines, np.where(overlapping, machine_indexes[None, :] + 1, machines_count + 1), axis=1)
+    maintenance_ranks[row_indexes, machine_for_separation_position] = 0
+
+    maintenance_order = np.argsort(maintenance_ranks, axis=1, kind='stable')
+    machines_for_maintenance = np.where(np.take_along_axis(maintenance_ranks, maintenance_order, axis=1) <= machines_count, maintenance_order, -1)
+
+    needs_division = valid_machines.any(axis=1)
+
+    separation_positions = np.where(needs_division, min_separation_position, -1)
+    machines_for_maintenance[~needs_division] = -1
+
+    return separation_positions, machines_for_maintenance
+
+def evaluate_production_sequences(production_sequences, scenario, initial_cycles, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict):
+
+    """
+        Evaluates many production sequences at once, for population based searches: production_sequences is a
+        (sequences x positions) array of product IDs of the CompiledScenario (see CompiledScenario.encode_sequences).
+
+        All the sequences are simulated together, one product position at a time, with NumPy operations over the
+        sequences instead of a Python loop per product and machine: the prefix sums of the cycles of every sequence
+        are computed once, the divisions of all the sequences that reach a segment boundary are found with one binary
+        search and the production times of the next product of every sequence are updated machine by machine.
+
+        Returns, for each sequence, the same results as evaluate_production_sequence:
+            - scheduled_maintenance_intervals: list with the list of (machine, (maintenance_start_time, maintenance_end_time)) of each sequence
+            - total_downtimes: float array with the total downtime of each sequence
+            - final_time_slots: array with the final time slot of each sequence
+
+        A sequence that can't be completed (its immediate maintenances repeat endlessly, where evaluate_production_sequence
+        raises a ValueError) doesn't stop the others: its maintenance intervals are None, its downtime is inf and its
+        final time slot is -1.
+    """
+
+    production_sequences = np.asarray(production_sequences)
+    sequences_count, positions_count = production_sequences.shape
+
+    operating_machines_list = scenario.machines
+    machines_count = len(operating_machines_list)
+
+    sequence_indexes = np.arange(sequences_count)
+
+    cycle_matrix = scenario.cycle_matrix
+
+    cumulative_cycles = np.zeros((sequences_count, machines_count, positions_count + 1), dtype=np.int64)
+    np.cumsum(cycle_matrix[production_sequences].transpose(0, 2, 1), axis=2, out=cumulative_cycles[:, :, 1:])
+
+    key_step = int(cumulative_cycles[:, :, -1].max(initial=0)) + 2 # greater than any clipped target of divide_production_sequences
+    cumulative_cycle_keys = (cumulative_cycles + (np.arange(sequences_count * machines_count) * key_step).reshape(sequences_count, machines_count, 1)).ravel()
+
+    cycles_for_start_of_recommended_maintenance = np.array([get_survival_cycles(machine, s_maintenance_max, survival_dict) for machine in operating_machines_list], dtype=np.int64)
+    cycles_for_end_of_recommended_maintenance = np.array([get_survival_cycles(machine, s_maintenance_min, survival_dict) for machine in operating_machines_list], dtype=np.int64)
+
+    # simulation state of each sequence
+    time_slot_0 = np.zeros(sequences_count, dtype=np.int64)
+    last_busy_time_slot = np.zeros(sequences_count, dtype=np.int64)
+    machine_end_times = np.zeros((sequences_count, machines_count), dtype=np.int64)
+    machine_cycle_numbers = np.tile(np.array([initial_cycles.get(machine, 0) for machine in operating_machines_list], dtype=np.int64), (sequences_count, 1))
+
+    positions = np.zeros(sequences_count, dtype=np.int64) # next product to produce
+    segment_ends = np.zeros(sequences_count, dtype=np.int64) # end of the part of the sequence being produced
+    machines_for_maintenance = np.full((sequences_count, machines_count), -1, dtype=np.int64) # maintenance at the end of that part
+    finished = np.zeros(sequences_count, dtype=bool)
+    endless = np.zeros(sequences_count, dtype=bool) # sequences whose immediate maintenances repeat endlessly
+
+    scheduled_maintenance_intervals = [[] for _ in range(sequences_count)]
+    maintenance_start_times = [[] for _ in range(sequences_count)]
+    immediate_maintenance_cycle_numbers = [set() for _ in range(sequences_count)]
+
+    while True:
+
+        boundary_rows = np.flatnonzero(~finished & (positions == segment_ends))
+
+        if boundary_rows.size:
+
+            # maintenance between two parts of the sequence
+            split_rows = boundary_rows[machines_for_maintenance[boundary_rows, 0] >= 0]
+
+            if split_rows.size:
+
+                maintenance_start_time = machine_end_times[split_rows].max(axis=1)
+
+                for row, start_time in zip(split_rows.tolist(), maintenance_start_time.tolist()):
+                    maintenance_start_times[row].append(start_time)
+                    for machine_index in machines_for_maintenance[row]:
+                        if machine_index >= 0:
+                            scheduled_maintenance_intervals[row].append((operating_machines_list[machine_index], (start_time, start_time + maintenance_duration - 1)))
+
+                maintained_rows, maintained_machines = np.nonzero(np.any(machines_for_maintenance[split_rows, :, None] == np.arange(machines_count), axis=1))
+                machine_cycle_numbers[split_rows[maintained_rows], maintained_machines] = 1
+
+                time_slot_0[split_rows] = maintenance_start_time + maintenance_duration
+                last_busy_time_slot[split_rows] = np.maximum(last_busy_time_slot[split_rows], maintenance_start_time + maintenance_duration)
+                machines_for_maintenance[split_rows] = -1
+
+            finished[boundary_rows[segment_ends[boundary_rows] == positions_count]] = True
+            dividing_rows = boundary_rows[segment_ends[boundary_rows] < positions_count]
+
+            while dividing_rows.size:
+
+                separation_positions, division_machines = divide_production_sequences(cumulative_cycles, cumulative_cycle_keys, key_step, dividing_rows, positions[dividing_rows],
+                                                                                      machine_cycle_numbers[dividing_rows], cycles_for_start_of_recommended_maintenance,
+                                                                                      cycles_for_end_of_recommended_maintenance)
+
+                immediate = separation_positions == 0
+
+                segment_ends[dividing_rows] = np.where(separation_positions < 0, positions_count, positions[dividing_rows] + separation_positions)
+                machines_for_maintenance[dividing_rows] = np.where(immediate[:, None], -1, division_machines)
+
+                # the machine needs immediate maintenance before producing, and the whole sequence is produced after it
+                dividing_rows = dividing_rows[immediate]
+                immediate_machines = division_machines[immediate, 0]
+
+                for row, machine_index in zip(dividing_rows.tolist(), immediate_machines.tolist()):
+                    start_time = int(time_slot_0[row])
+                    maintenance_start_times[row].append(start_time)
+                    scheduled_maintenance_intervals[row].append((operating_machines_list[machine_index], (start_time, start_time + maintenance_duration - 1)))
+
+                last_busy_time_slot[dividing_rows] = np.maximum(last_busy_time_slot[dividing_rows], time_slot_0[dividing_rows] + maintenance_duration)
+                machine_cycle_numbers[dividing_rows, immediate_machines] = 1
+
+                for row in dividing_rows.tolist():
+                    restart_cycle_numbers = tuple(machine_cycle_numbers[row].tolist())
+                    if restart_cycle_numbers in immediate_maintenance_cycle_numbers[row]:
+                        endless[row] = True
+                    immediate_maintenance_cycle_numbers[row].add(restart_cycle_numbers)
+
+                finished[dividing_rows[endless[dividing_rows]]] = True
+                dividing_rows = dividing_rows[~endless[dividing_rows]]
+
+                time_slot_0[dividing_rows] = maintenance_duration
+                positions[dividing_rows] = 0
+
+            if finished.all():
+                break
+
+        # produce the next product of every unfinished sequence, machine by machine in the order of the production line
+        producing = ~finished
+        products_cycles = cycle_matrix[production_sequences[sequence_indexes, np.minimum(positions, positions_count - 1)]] * producing[:, None]
+
+        product_start_time = time_slot_0.copy()
+
+        for machine_index in range(machines_count):
+
+            production_cycles = products_cycles[:, machine_index]
+            machine_producing = production_cycles > 0
+
+            operation_end_time = np.maximum(product_start_time, machine_end_times[:, machine_index]) + production_cycles
+
+            machine_end_times[:, machine_index] = np.where(machine_producing, operation_end_time, machine_end_times[:, machine_index])
+            product_start_time = np.where(machine_producing, operation_end_time, product_start_time)
+
+        machine_cycle_numbers += products_cycles
+        last_busy_time_slot = np.where(producing, np.maximum(last_busy_time_slot, product_start_time), last_busy_time_slot)
+        positions += producing
+
+    maintenance_counts = np.array([len(start_times) for start_times in maintenance_start_times], dtype=np.int64)
+
+    padded_maintenance_start_times = np.zeros((sequences_count, maintenance_counts.max(initial=0)), dtype=np.int64)
+    for row, start_times in enumerate(maintenance_start_times):
+        padded_maintenance_start_times[row, :len(start_times)] = start_times
+
+    total_downtimes = np.where(endless, np.inf, calculate_downtimes(padded_maintenance_start_times, maintenance_counts, maintenance_duration))
+    final_time_slots = np.where(endless, -1, last_busy_time_slot - 1)
+
+    for row in np.flatnonzero(endless).tolist():
+        scheduled_maintenance_intervals[row] = None
+
+    return scheduled_maintenance_intervals, total_downtimes, final_time_slots
+
+
+def production_simulation(production_requirements_dict, production_sequence, scenario,
+                                      initial_cycles, maintenance_duration,
+                                      s_maintenance_min, s_maintenance_max, survival_dict, logger, optimized_sequence,
+                                      export_formats=None, report_pipeline=None):
+
+    """
+        Simulates the production of a sequence with the production timeline, and for the optimized sequence prints
+        and logs the statistics and runs the reports (export in export_formats, None = default_export_formats of
+        file_operations, and plot) on a snapshot of the results:
+        in report_pipeline (a ReportPipeline) if given, so they finish in the background, or before returning.
+
+        Returns the maintenance intervals, the total downtime and the ReportHandle of the reports (None if there are
+        no reports), whose wait() returns the saved files and raises the errors of the reports.
+    """
+
+    operating_machines_list = scenario.machines
+
+    product_counts = {  # to save how many times a product type has been scheduled for a certain machine
+        machine: {product: 0 for product in production_requirements_dict} for machine in operating_machines_list}
+
+    timeline = ProductionTimeline(operating_machines_list)
+
+    scheduled_maintenance_intervals, aux_count_machine_maintenance, final_time_slot, _ = simulate_production_sequence(production_sequence, scenario, initial_cycles, maintenance_duration,
+                                                                                                                  s_maintenance_min, s_maintenance_max, survival_dict,
+                                                                                                                  timeline, product_counts)
+
+    total_downtime = calculate_downtime(scheduled_maintenance_intervals)
+    report_handle = None
+
+    if optimized_sequence is not None and len(optimized_sequence) > 0: # only prints the information for the optimized sequence that was returned by the optimization algorithm
+
+        # per timeslot views of the production timeline, for the export and the plot
+        schedule = timeline.to_schedule()
+        machine_operation_information = timeline.to_machine_operation_information()
+        propagate_machine_cycles(machine_operation_information) # update machine's cycles in machine_operation_information
 
         print('\n   -------------------------')
         print('     SIMULATION STATISTICS')
         print('   -------------------------')
 
         logger.info('SIMULATION RESULTS')
-        logger.info(f'Optimal Production Sequence: {production_sequence}')
+        logger.info(f'Optimal Production Sequence: {scenario.decode_sequence(production_sequence)}')
         logger.info(' ')
 
-        print_stats_production(production_sequence, production_requirements_dict, final_time_slot, product_machine_cycles_mapping_dict, operating_machines_list, logger)
+        print_stats_production(production_sequence, production_requirements_dict, final_time_slot, scenario, logger)
         print_stats_maintenance(total_downtime, operating_machines_list, aux_count_machine_maintenance, scheduled_maintenance_intervals, logger)
-        save_schedule_and_machine_operation_information_excel_files(schedule, final_time_slot, machine_operation_information)
-        plot_survival_prob_over_cycles(machine_operation_information, survival_dict, final_time_slot)
 
-    return scheduled_maintenance_intervals, total_downtime
+        report_snapshot = create_report_snapshot(schedule, final_time_slot, machine_operation_information, survival_dict)
+        report_handle = run_reports(report_snapshot, export_formats, report_pipeline)
+
+    return scheduled_maintenance_intervals, total_downtime, report_handle
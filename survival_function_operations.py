@@ -1,8 +1,29 @@
 import numpy as np
-import pandas as pd
 
 base_survival_function_path = 'data/base_survival_function/base_survival_function.csv'
-base_survival_function = pd.read_csv(base_survival_function_path)
+base_survival_function = None # read from base_survival_function_path the first time it's needed (see load_base_survival_function)
+
+survival_function_cache = {} # fitted polynomial coefficients, keyed by (machine, degree, version of the machine's survival data)
+survival_function_cache_stats = {'hits': 0, 'misses': 0}
+survival_cycles_index = {} # threshold index: cycle numbers for survival probabilities, keyed by (machine, degree, probability, version)
+survival_data_versions = {} # incremented every time the survival data of a machine is (re)loaded or replaced in a survival_dict
+survival_data_objects = {} # survival data of each machine for its current version (kept alive, and compared by identity)
+
+def load_base_survival_function():
+
+    """
+        Returns the base survival function (DF with the 'prod_idx' and 'surv_prob' columns), read from
+        base_survival_function_path on the first call and cached afterwards. pandas is only imported here, so the
+        modules that use the survival data (and the worker processes of the optimization) don't import it.
+    """
+
+    global base_survival_function
+
+    if base_survival_function is None:
+        import pandas as pd
+        base_survival_function = pd.read_csv(base_survival_function_path)
+
+    return base_survival_function
 
 def starting_survival_function_data(machine, survival_dict):
 
@@ -10,25 +31,82 @@ def starting_survival_function_data(machine, survival_dict):
         Filter the required survival data based on the initial cycle number of each machine.
     """
 
-    machine_survival_function = base_survival_function.copy()
+    machine_survival_function = load_base_survival_function().copy()
 
     machine_survival_function_dict = dict(zip(machine_survival_function['prod_idx'], machine_survival_function['surv_prob']))
     survival_dict[machine] = machine_survival_function_dict
+    update_survival_data_version(machine, machine_survival_function_dict)
+
+def update_survival_data_version(machine, survival_data):
+
+    survival_data_objects[machine] = survival_data
+    survival_data_versions[machine] = survival_data_versions.get(machine, 0) + 1
+
+def survival_data_version(machine, survival_dict):
+
+    """
+        Identifies the current version of the survival data of a machine. It changes when the data is reloaded with
+        starting_survival_function_data or when survival_dict[machine] is replaced by another object: the data of the
+        current version is kept in survival_data_objects and compared by identity (a reference is kept, so the id of a
+        replaced dict can't be reused by its replacement).
+    """
+
+    survival_data = survival_dict[machine]
+
+    if survival_data_objects.get(machine) is not survival_data:
+        update_survival_data_version(machine, survival_data)
+
+    return survival_data_versions[machine]
 
 def survival_function(machine, degree, survival_dict):
 
     """
         Polynomial regression to approximate the survival function for all points/cycles.
+        The fitted coefficients are cached per machine, degree and survival data version, so the regression only
+        runs again when survival_dict changes. The returned array is shared by the cache and must not be modified.
     """
 
+    cache_key = (machine, degree, survival_data_version(machine, survival_dict))
+    poly_coeffs = survival_function_cache.get(cache_key)
+
+    if poly_coeffs is not None:
+        survival_function_cache_stats['hits'] += 1
+        return poly_coeffs
+
+    survival_function_cache_stats['misses'] += 1
+    invalidate_survival_function_cache(machine) # drop the fits of older versions of the machine's data
+
     survival_data = survival_dict[machine]
     prod_idx = np.array(list(survival_data.keys()))
     surv_prob = np.array(list(survival_data.values()))
 
     poly_coeffs = np.polyfit(prod_idx, surv_prob, degree)
+    poly_coeffs.flags.writeable = False
+
+    survival_function_cache[cache_key] = poly_coeffs
 
     return poly_coeffs
 
+def invalidate_survival_function_cache(machine=None):
+
+    """
+        Removes the cached fits and threshold cycles of a machine (or of all machines). Needed only when the survival data inside
+        survival_dict is edited in place, since reloading or replacing it already changes its version.
+    """
+
+    for cache in (survival_function_cache, survival_cycles_index):
+        for cache_key in list(cache):
+            if machine is None or cache_key[0] == machine:
+                del cache[cache_key]
+
+def get_survival_function_cache_info():
+
+    """
+        Returns the number of cache hits and misses (= polynomial fits) and the number of cached fits.
+    """
+
+    return {**survival_function_cache_stats, 'size': len(survival_function_cache)}
+
 def get_survival_prob(machine, cycle, survival_dict, degree=5):
 
     """
@@ -40,15 +118,51 @@ def get_survival_prob(machine, cycle, survival_dict, degree=5):
 
     return survival_prob
 
+def get_machines_survival_probs(machines, cycles_matrix, survival_dict, degree=5):
+
+    """
+        Returns the survival probabilities (clipped to [0, 1]) for a machines x slots matrix of cycle numbers,
+        where row i holds the cycle numbers of machines[i]. All rows are evaluated in one pass of Horner's method.
+    """
+
+    cycles_matrix = np.asarray(cycles_matrix, dtype=float)
+    poly_coeffs = np.array([survival_function(machine, degree, survival_dict) for machine in machines]) # machines x (degree + 1)
+
+    survival_probs = np.zeros_like(cycles_matrix)
+
+    for coeff in poly_coeffs.T:
+        survival_probs = survival_probs * cycles_matrix + coeff[:, np.newaxis]
+
+    return np.clip(survival_probs, 0, 1)
+
 
 def get_survival_cycles(machine, target_prob, survival_dict, degree=5):
 
     """
         Returns the closest integer cycle number for a given survival probability, for a given machine.
         The result is always rounded down to the nearest integer.
+        The inverted curve is stored in a threshold index, so each (machine, probability) pair is only solved once
+        for each version of the machine's survival data.
     """
 
-    poly_coeffs = survival_function(machine, degree, survival_dict)
+    index_key = (machine, degree, target_prob, survival_data_version(machine, survival_dict))
+    survival_cycles = survival_cycles_index.get(index_key)
+
+    if survival_cycles is None:
+        survival_cycles = invert_survival_function(machine, target_prob, survival_dict, degree)
+        survival_cycles_index[index_key] = survival_cycles
+
+    return survival_cycles
+
+def invert_survival_function(machine, target_prob, survival_dict, degree=5):
+
+    """
+        Solves the fitted survival function for the first non-negative cycle where it reaches target_prob.
+        If the polynomial never reaches it, the cycle of the stored survival data whose fitted probability is
+        the closest to target_prob is returned instead.
+    """
+
+    poly_coeffs = survival_function(machine, degree, survival_dict).copy() # copy, the cached coefficients are read-only
     poly_coeffs[-1] -= target_prob
 
     roots = np.roots(poly_coeffs)
@@ -58,10 +172,20 @@ def get_survival_cycles(machine, target_prob, survival_dict, degree=5):
         return int(min(real_roots))
 
     else:
-        prod_idx, surv_prob, _ = survival_function(machine, degree, survival_dict)
-        closest_cycle = min(prod_idx,key=lambda c: abs(get_survival_prob(machine, c, survival_dict, degree) - target_prob))
+        prod_idx = np.fromiter(survival_dict[machine].keys(), dtype=float)
+        surv_prob = np.clip(np.polyval(survival_function(machine, degree, survival_dict), prod_idx), 0, 1)
+        closest_cycle = prod_idx[np.argmin(np.abs(surv_prob - target_prob))]
 
         return int(closest_cycle)
 
+def build_survival_threshold_index(operating_machines_list, target_probs, survival_dict, degree=5):
 
+    """
+        Fills the threshold index for the given machines and survival probabilities (e.g. s_maintenance_min and
+        s_maintenance_max) before the simulation starts, and returns the cycles as {machine: {probability: cycle}}.
+    """
 
+    return {
+        machine: {target_prob: get_survival_cycles(machine, target_prob, survival_dict, degree) for target_prob in target_probs}
+        for machine in operating_machines_list
+    }
@@ -0,0 +1,67 @@
+import pandas as pd
+
+from file_operations import transform_machine_operation_information_to_df
+from file_operations import transform_machine_operation_information_to_long_df
+from file_operations import write_csv_file
+from schedule_operations import ProductionTimeline
+
+
+def create_production_timeline():
+
+    """
+        Timeline of two machines with the same product labels on both (A0_1 goes through m1 and m2), idle timeslots
+        (no product) and a maintenance of m1 while m2 is unavailable. Returns the timeline and its final time slot.
+    """
+
+    timeline = ProductionTimeline(['m1', 'm2'])
+
+    timeline.add_production('m1', 0, 3, 1, 'A0_1')
+    timeline.add_production('m2', 3, 2, 1, 'A0_1')
+    timeline.add_production('m1', 3, 4, 4, 'A1_1')
+    timeline.add_maintenance(['m1'], 8, 2)
+    timeline.add_production('m2', 10, 3, 3, 'A1_1')
+
+    return timeline, timeline.end_time + 1 # the last timeslot has no product on any machine
+
+
+def test_long_table_matches_the_wide_table():
+
+    timeline, final_time_slot = create_production_timeline()
+    machine_operation_information = timeline.to_machine_operation_information()
+
+    df_long = transform_machine_operation_information_to_long_df(machine_operation_information, final_time_slot)
+    df_wide = transform_machine_operation_information_to_df(machine_operation_information, final_time_slot)
+
+    assert len(df_long) == 2 * final_time_slot
+    assert df_long.dtypes.astype(str).to_dict() == {'machine': 'category', 'slot': 'int32', 'state': 'category', 'cycle': 'int32', 'product': 'category'}
+    assert sorted(df_long['product'].cat.categories) == ['A0_1', 'A1_1'] # the labels shared by the machines are categories once
+
+    for row in df_long.itertuples(index=False):
+
+        cell = df_wide.loc[row.machine, f't{row.slot}']
+
+        assert (row.state, row.cycle) == (cell['State'], cell['Cycle'])
+        assert (None if pd.isna(row.product) else row.product) == cell['Product']
+
+    assert df_long['product'].isna().any() # the timeslots without a product (product code -1)
+
+def test_csv_is_written_in_chunks(tmp_path):
+
+    timeline, final_time_slot = create_production_timeline()
+    df_long = transform_machine_operation_information_to_long_df(timeline.to_machine_operation_information(), final_time_slot)
+
+    production_timeline_file = tmp_path / 'production_timeline.csv'
+    write_csv_file(df_long, production_timeline_file, chunk_rows=4)
+
+    lines = production_timeline_file.read_text().splitlines()
+
+    assert lines[0] == 'machine,slot,state,cycle,product'
+    assert lines.count(lines[0]) == 1
+    assert len(lines) == len(df_long) + 1
+
+    df_csv = pd.read_csv(production_timeline_file)
+
+    assert df_csv['slot'].tolist() == df_long['slot'].tolist()
+    assert df_csv['cycle'].tolist() == df_long['cycle'].tolist()
+    assert df_csv['state'].tolist() == df_long['state'].astype(str).tolist()
+    assert df_csv['product'].isna().tolist() == df_long['product'].isna().tolist()
@@ -0,0 +1,423 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+import optimization_algorithm
+from dynamic_programming_operations import build_segment_sequence
+from dynamic_programming_operations import calculate_segment_capacities
+from dynamic_programming_operations import estimate_dynamic_programming_memory
+from dynamic_programming_operations import pack_production_segments
+from optimization_algorithm import FitnessCache
+from optimization_algorithm import create_annealing_chain
+from optimization_algorithm import create_annealing_scenario
+from optimization_algorithm import dynamic_programming_solver
+from optimization_algorithm import parallel_tempering
+from optimization_algorithm import run_annealing_chain
+from optimization_algorithm import simulated_annealing
+from optimization_algorithm import update_zobrist_key
+from optimization_algorithm import zobrist_key
+from scenario_operations import compile_scenario
+from simulation_operations import calculate_downtime
+from simulation_operations import calculate_downtime_lower_bound
+from simulation_operations import evaluate_production_sequence
+from simulation_operations import evaluate_production_sequence_incrementally
+from simulation_operations import evaluate_production_sequences
+
+
+def create_random_scenario(rng):
+
+    """
+        Random scenario with synthetic survival data (a Weibull curve per machine, sampled every 10 cycles), so that
+        the tests don't read the base survival function. Returns the compiled scenario, a random production sequence
+        and the evaluation arguments (initial_cycles, maintenance_duration, s_maintenance_min, s_maintenance_max,
+        survival_dict).
+    """
+
+    machines_count = rng.randint(1, 4)
+    products_count = rng.randint(1, 5)
+
+    operating_machines_list = [f'm{machine_index}' for machine_index in range(1, machines_count + 1)]
+    products = [f'A{product_index}' for product_index in range(products_count)]
+
+    product_machine_cycles_mapping_dict = {
+        machine: {product: rng.choice([0, rng.randint(1, 60)]) for product in products} for machine in operating_machines_list
+    }
+    for product in products: # every product goes through at least one machine
+        if all(product_machine_cycles_mapping_dict[machine][product] == 0 for machine in operating_machines_list):
+            product_machine_cycles_mapping_dict[rng.choice(operating_machines_list)][product] = rng.randint(1, 60)
+
+    survival_dict = {}
+    initial_cycles = {}
+
+    for machine in operating_machines_list:
+
+        scale = rng.randint(300, 3000)
+        shape = rng.uniform(1.5, 4)
+
+        cycles = np.arange(0, 2 * scale, 10)
+        survival_dict[machine] = dict(zip(cycles.tolist(), np.exp(-(cycles / scale) ** shape).tolist()))
+        initial_cycles[machine] = rng.randint(0, scale)
+
+    production_requirements_dict = {product: rng.randint(1, 120) for product in products}
+    scenario = compile_scenario(operating_machines_list, product_machine_cycles_mapping_dict, production_requirements_dict)
+
+    production_sequence = [product for product, count in production_requirements_dict.items() for _ in range(count)]
+    rng.shuffle(production_sequence)
+
+    s_maintenance_max = rng.uniform(0.15, 0.5)
+    s_maintenance_min = s_maintenance_max - rng.uniform(0, 0.05)
+
+    return scenario, scenario.encode_sequence(production_sequence), (initial_cycles, rng.randint(1, 10), s_maintenance_min, s_maintenance_max, survival_dict)
+
+def generate_neighbor(production_sequence, rng):
+
+    """
+        Neighbor of a sequence like the ones of the simulated annealing (4 products swapped), or with the swapped
+        products close to each other. Returns the neighbor and its changed positions.
+    """
+
+    if rng.random() < 0.3:
+        center = rng.randrange(len(production_sequence))
+        positions = [min(len(production_sequence) - 1, max(0, center + rng.randint(-8, 8))) for _ in range(4)]
+    else:
+        positions = rng.sample(range(len(production_sequence)), 4)
+
+    i, j, w, k = positions
+    neighbor_sequence = production_sequence.copy()
+    neighbor_sequence[[i, j, w, k]] = production_sequence[[k, w, i, j]]
+
+    changed_positions = sorted({position for position in positions if neighbor_sequence[position] != production_sequence[position]})
+
+    return neighbor_sequence, changed_positions
+
+def evaluate_or_none(evaluation_function, *arguments, **keyword_arguments):
+
+    try:
+        return evaluation_function(*arguments, **keyword_arguments)
+
+    except ValueError: # the immediate maintenances repeat endlessly
+        return None
+
+def create_completable_scenario():
+
+    """
+        Scenario where every sequence can be completed (the products are short compared to the survival curves), for
+        the optimizers, which stop if a neighbor can't be completed. Returns the compiled scenario, a production
+        sequence, the production requirements and the evaluation arguments.
+    """
+
+    product_machine_cycles_mapping_dict = {'m1': {'A0': 12, 'A1': 3, 'A2': 0}, 'm2': {'A0': 0, 'A1': 8, 'A2': 15}}
+    production_requirements_dict = {'A0': 60, 'A1': 80, 'A2': 60}
+    scenario = compile_scenario(['m1', 'm2'], product_machine_cycles_mapping_dict, production_requirements_dict)
+
+    cycles = np.arange(0, 3000, 10)
+    survival_dict = {machine: dict(zip(cycles.tolist(), np.exp(-(cycles / 400) ** 2).tolist())) for machine in ('m1', 'm2')}
+    production_sequence = scenario.encode_sequence([product for product, count in production_requirements_dict.items() for _ in range(count)])
+
+    return scenario, production_sequence, production_requirements_dict, ({'m1': 0, 'm2': 150}, 5, 0.3, 0.35, survival_dict)
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_incremental_evaluation_matches_full_evaluation(seed):
+
+    rng = random.Random(seed)
+    scenario, production_sequence, evaluation_arguments = create_random_scenario(rng)
+
+    if len(production_sequence) < 4:
+        return
+
+    current_sequence = production_sequence
+    current_evaluation = evaluate_or_none(evaluate_production_sequence_incrementally, current_sequence, scenario, *evaluation_arguments)
+
+    if current_evaluation is None:
+        return
+
+    for _ in range(60):
+
+        neighbor_sequence, changed_positions = generate_neighbor(current_sequence, rng)
+
+        full_evaluation = evaluate_or_none(evaluate_production_sequence, neighbor_sequence, scenario, *evaluation_arguments)
+        incremental_evaluation = evaluate_or_none(evaluate_production_sequence_incrementally, neighbor_sequence, scenario, *evaluation_arguments,
+                                                  reference_evaluation=current_evaluation, changed_positions=changed_positions)
+
+        assert (full_evaluation is None) == (incremental_evaluation is None)
+
+        if full_evaluation is None:
+            continue
+
+        scheduled_maintenance_intervals, total_downtime, final_time_slot = full_evaluation
+
+        assert incremental_evaluation['scheduled_maintenance_intervals'] == scheduled_maintenance_intervals
+        assert incremental_evaluation['total_downtime'] == total_downtime
+        assert incremental_evaluation['final_time_slot'] == final_time_slot
+
+        # the evaluation of an accepted neighbor (possibly joined to its reference) is the reference of the next ones
+        if rng.random() < 0.5:
+            current_sequence = neighbor_sequence
+            current_evaluation = incremental_evaluation
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_downtime_lower_bound_holds_for_random_sequences(seed):
+
+    rng = random.Random(seed)
+    scenario, production_sequence, evaluation_arguments = create_random_scenario(rng)
+    initial_cycles, maintenance_duration, _, s_maintenance_max, survival_dict = evaluation_arguments
+
+    downtime_lower_bound, _ = calculate_downtime_lower_bound(scenario, production_sequence, initial_cycles, maintenance_duration, s_maintenance_max, survival_dict)
+
+    for _ in range(20):
+
+        sequence = production_sequence.copy()
+        rng.shuffle(sequence)
+
+        full_evaluation = evaluate_or_none(evaluate_production_sequence, sequence, scenario, *evaluation_arguments)
+
+        if full_evaluation is not None:
+            assert downtime_lower_bound <= full_evaluation[1]
+
+@pytest.mark.parametrize('seed', range(40))
+def test_dynamic_programming_bound_and_segment_sequence(seed):
+
+    rng = random.Random(seed)
+    scenario, production_sequence, evaluation_arguments = create_random_scenario(rng)
+    initial_cycles, maintenance_duration, _, s_maintenance_max, survival_dict = evaluation_arguments
+
+    downtime_lower_bound, machine_min_maintenance_counts = calculate_downtime_lower_bound(scenario, production_sequence, initial_cycles, maintenance_duration,
+                                                                                         s_maintenance_max, survival_dict)
+
+    product_counts = np.bincount(production_sequence, minlength=len(scenario.products))
+    if estimate_dynamic_programming_memory(product_counts, max(machine_min_maintenance_counts.values(), default=0) + 2) > 64 * 1024**2: # over the memory budget of the test
+        return
+
+    first_capacities, capacities = calculate_segment_capacities(scenario, initial_cycles, s_maintenance_max, survival_dict)
+    segments, min_maintenances = pack_production_segments(product_counts, scenario.cycle_matrix, first_capacities, capacities, max_work=10**7)
+
+    if segments is None: # over the work budget of the test
+        return
+
+    segment_sequence = build_segment_sequence(segments)
+
+    assert np.bincount(segment_sequence, minlength=len(scenario.products)).tolist() == product_counts.tolist()
+    assert min_maintenances * maintenance_duration >= downtime_lower_bound
+
+    for sequence in [segment_sequence] + [np.random.default_rng(seed + shuffle).permutation(production_sequence) for shuffle in range(10)]:
+
+        full_evaluation = evaluate_or_none(evaluate_production_sequence, sequence, scenario, *evaluation_arguments)
+
+        if full_evaluation is not None:
+            assert min_maintenances * maintenance_duration <= full_evaluation[1]
+
+@pytest.mark.parametrize('seed', range(11, 27))
+def test_dynamic_programming_solver_returns_the_required_products(seed):
+
+    rng = random.Random(seed)
+    scenario, production_sequence, evaluation_arguments = create_random_scenario(rng)
+    initial_cycles, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict = evaluation_arguments
+
+    if len(production_sequence) < 4 or evaluate_or_none(evaluate_production_sequence, production_sequence, scenario, *evaluation_arguments) is None:
+        return
+
+    production_requirements_dict = dict(zip(scenario.products, np.bincount(production_sequence, minlength=len(scenario.products)).tolist()))
+
+    optimized_sequence, optimized_downtime, best_maintenance_intervals, solver_statistics = dynamic_programming_solver(production_sequence, scenario, maintenance_duration,
+                                                                                                                      s_maintenance_min, s_maintenance_max, survival_dict,
+                                                                                                                      initial_cycles, production_requirements_dict,
+                                                                                                                      time_budget=0.1)
+
+    scheduled_maintenance_intervals, total_downtime, _ = evaluate_production_sequence(optimized_sequence, scenario, *evaluation_arguments)
+    downtime_lower_bound, _ = calculate_downtime_lower_bound(scenario, production_sequence, initial_cycles, maintenance_duration, s_maintenance_max, survival_dict)
+
+    assert dict(zip(scenario.products, np.bincount(optimized_sequence, minlength=len(scenario.products)).tolist())) == production_requirements_dict
+    assert (optimized_downtime, best_maintenance_intervals) == (total_downtime, scheduled_maintenance_intervals)
+
+    if solver_statistics['downtime_lower_bound'] is not None: # the instance fits the memory budget
+        assert downtime_lower_bound <= solver_statistics['downtime_lower_bound'] <= total_downtime
+        assert solver_statistics['optimal'] == (total_downtime == solver_statistics['downtime_lower_bound'])
+
+@pytest.mark.parametrize('seed', range(40))
+def test_batch_evaluation_matches_evaluate_production_sequence(seed):
+
+    rng = random.Random(seed)
+    scenario, production_sequence, evaluation_arguments = create_random_scenario(rng)
+
+    # neighbors, shuffles and sequences with other products (the rows only need the same length)
+    production_sequences = [production_sequence]
+    for _ in range(30):
+
+        if len(production_sequence) >= 4 and rng.random() < 0.5:
+            production_sequences.append(generate_neighbor(production_sequences[-1], rng)[0])
+
+        else:
+            production_sequences.append(np.array([rng.randrange(len(scenario.products)) for _ in production_sequence], dtype=production_sequence.dtype))
+
+    scheduled_maintenance_intervals, total_downtimes, final_time_slots = evaluate_production_sequences(np.array(production_sequences), scenario, *evaluation_arguments)
+
+    for row, sequence in enumerate(production_sequences):
+
+        full_evaluation = evaluate_or_none(evaluate_production_sequence, sequence, scenario, *evaluation_arguments)
+
+        if full_evaluation is None:
+            assert scheduled_maintenance_intervals[row] is None and total_downtimes[row] == np.inf and final_time_slots[row] == -1
+            continue
+
+        assert scheduled_maintenance_intervals[row] == full_evaluation[0]
+        assert total_downtimes[row] == full_evaluation[1] == calculate_downtime(scheduled_maintenance_intervals[row])
+        assert final_time_slots[row] == full_evaluation[2]
+
+def test_batch_evaluation_marks_endless_sequences():
+
+    # m1 reaches its maintenance cycles before the end of A0, so every sequence with A0 restarts endlessly
+    product_machine_cycles_mapping_dict = {'m1': {'A0': 200, 'A1': 2}, 'm2': {'A0': 0, 'A1': 3}}
+    scenario = compile_scenario(['m1', 'm2'], product_machine_cycles_mapping_dict, {'A0': 1, 'A1': 9})
+
+    cycles = np.arange(0, 400, 10)
+    survival_dict = {machine: dict(zip(cycles.tolist(), np.exp(-(cycles / 100) ** 2).tolist())) for machine in ('m1', 'm2')}
+    evaluation_arguments = ({'m1': 0, 'm2': 0}, 5, 0.19, 0.2, survival_dict)
+
+    production_sequences = scenario.encode_sequences([['A1'] * 10, ['A1'] * 5 + ['A0'] + ['A1'] * 4, ['A1'] * 9 + ['A0']])
+
+    with pytest.raises(ValueError):
+        evaluate_production_sequence(production_sequences[1], scenario, *evaluation_arguments)
+
+    scheduled_maintenance_intervals, total_downtimes, final_time_slots = evaluate_production_sequences(production_sequences, scenario, *evaluation_arguments)
+
+    assert total_downtimes.tolist() == [evaluate_production_sequence(production_sequences[0], scenario, *evaluation_arguments)[1], np.inf, np.inf]
+    assert scheduled_maintenance_intervals[1:] == [None, None]
+    assert final_time_slots[1:].tolist() == [-1, -1]
+
+@pytest.mark.parametrize('seed', range(10))
+def test_updated_zobrist_key_matches_the_recomputed_key(seed):
+
+    rng = random.Random(seed)
+    scenario, production_sequence, evaluation_arguments = create_random_scenario(rng)
+    initial_cycles, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict = evaluation_arguments
+
+    if len(production_sequence) < 4:
+        return
+
+    annealing_scenario = create_annealing_scenario(production_sequence, scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict, initial_cycles)
+    key = zobrist_key(production_sequence, annealing_scenario)
+
+    for _ in range(200):
+
+        neighbor_sequence, changed_positions = generate_neighbor(production_sequence, rng)
+        neighbor_key = update_zobrist_key(key, annealing_scenario, changed_positions, production_sequence, neighbor_sequence)
+
+        assert neighbor_key == zobrist_key(neighbor_sequence, annealing_scenario)
+        assert (neighbor_key == key) == np.array_equal(neighbor_sequence, production_sequence)
+
+        production_sequence, key = neighbor_sequence, neighbor_key
+
+def test_fitness_cache_evicts_the_least_recently_used_sequences(monkeypatch):
+
+    monkeypatch.setattr(optimization_algorithm, 'fitness_cache_size', 5)
+    fitness_cache = create_annealing_chain(np.zeros(4, dtype=np.uint8), random.Random(0))['fitness_cache']
+
+    for key in range(5):
+        fitness_cache.put(key, key * 10)
+
+    assert fitness_cache.get(0) == 0 # the first sequence becomes the most recently used
+
+    for key in range(5, 8):
+        fitness_cache.put(key, key * 10)
+
+    assert len(fitness_cache) == 5 and fitness_cache.evictions == 3
+    assert [key for key in range(8) if key in fitness_cache] == [0, 4, 5, 6, 7]
+    assert fitness_cache.get(1) is None
+
+    unlimited_cache = FitnessCache(None)
+    for key in range(1000):
+        unlimited_cache.put(key, key)
+
+    assert len(unlimited_cache) == 1000 and unlimited_cache.evictions == 0
+
+@pytest.mark.parametrize('seed', range(8))
+def test_annealing_chain_scoring_neighbors_together_keeps_its_evaluations(seed):
+
+    rng = random.Random(seed)
+    scenario, production_sequence, evaluation_arguments = create_random_scenario(rng)
+    initial_cycles, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict = evaluation_arguments
+
+    if len(production_sequence) < 4 or evaluate_or_none(evaluate_production_sequence, production_sequence, scenario, *evaluation_arguments) is None:
+        return
+
+    annealing_scenario = create_annealing_scenario(production_sequence, scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict, initial_cycles)
+    chain = create_annealing_chain(production_sequence, rng, neighbors_per_iteration=8, chain_max_stagnation=None)
+    chain = run_annealing_chain(chain, annealing_scenario, 20)
+
+    for sequence, downtime, maintenance_intervals in ((chain['sequence'], chain['downtime'], chain['evaluation']['scheduled_maintenance_intervals']),
+                                                      (chain['best_sequence'], chain['best_downtime'], chain['best_maintenance_intervals'])):
+
+        scheduled_maintenance_intervals, total_downtime, _ = evaluate_production_sequence(sequence, scenario, *evaluation_arguments)
+
+        assert downtime == total_downtime
+        assert maintenance_intervals == scheduled_maintenance_intervals
+
+def test_parallel_tempering_rejects_temperatures_of_another_replicas_count():
+
+    rng = random.Random(0)
+    scenario, production_sequence, evaluation_arguments = create_random_scenario(rng)
+    initial_cycles, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict = evaluation_arguments
+
+    with pytest.raises(ValueError):
+        parallel_tempering(production_sequence, scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict, initial_cycles, {},
+                           replicas_count=3, temperatures=[50, 100])
+
+def test_parallel_tempering_replicas_keep_the_best_state_they_held(monkeypatch):
+
+    scenario, production_sequence, production_requirements_dict, evaluation_arguments = create_completable_scenario()
+    initial_cycles, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict = evaluation_arguments
+
+    exchange_replica_states = optimization_algorithm.exchange_replica_states
+    held_downtimes = {} # lowest downtime of the states received by each replica in the exchanges
+
+    def recording_exchange_replica_states(replica, other_replica):
+
+        exchange_replica_states(replica, other_replica)
+
+        for exchanged_replica in (replica, other_replica):
+            held_downtimes[exchanged_replica['chain_index']] = min(held_downtimes.get(exchanged_replica['chain_index'], math.inf), exchanged_replica['downtime'])
+            assert exchanged_replica['best_downtime'] <= exchanged_replica['downtime']
+
+    monkeypatch.setattr(optimization_algorithm, 'exchange_replica_states', recording_exchange_replica_states)
+
+    _, best_downtime, _, replica_statistics = parallel_tempering(production_sequence, scenario, maintenance_duration, s_maintenance_min, s_maintenance_max,
+                                                                 survival_dict, initial_cycles, production_requirements_dict, replicas_count=4, workers_count=2, time_budget=2,
+                                                                 exchange_interval=5, temperatures=[1, 10, 100, 1000], seed=0)
+
+    assert best_downtime == min(statistics['best_downtime'] for statistics in replica_statistics)
+
+    for statistics in replica_statistics:
+        assert statistics['best_downtime'] <= statistics['final_downtime']
+        assert statistics['best_downtime'] <= held_downtimes.get(statistics['replica'], math.inf)
+
+@pytest.mark.parametrize('seed', range(3))
+def test_screening_returns_simulated_downtimes(seed):
+
+    scenario, production_sequence, production_requirements_dict, evaluation_arguments = create_completable_scenario()
+    initial_cycles, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict = evaluation_arguments
+
+    production_sequence = np.random.default_rng(seed).permutation(production_sequence)
+
+    # a chain with screening keeps simulated downtimes for its current and best sequences
+    annealing_scenario = create_annealing_scenario(production_sequence, scenario, maintenance_duration, s_maintenance_min, s_maintenance_max, survival_dict, initial_cycles)
+    annealing_scenario['downtime_lower_bound'] = -1 # so that the chain doesn't stop before the screening is used
+    chain = run_annealing_chain(create_annealing_chain(production_sequence, random.Random(seed), screening=True), annealing_scenario, 300)
+
+    scheduled_maintenance_intervals, total_downtime, _ = evaluate_production_sequence(chain['best_sequence'], scenario, *evaluation_arguments)
+
+    assert chain['screened_rejections'] > 0
+    assert chain['downtime'] == evaluate_production_sequence(chain['sequence'], scenario, *evaluation_arguments)[1]
+    assert (chain['best_downtime'], chain['best_maintenance_intervals']) == (total_downtime, scheduled_maintenance_intervals)
+
+    random.seed(seed)
+    optimized_sequence, optimized_downtime, best_maintenance_intervals = simulated_annealing(production_sequence, scenario, maintenance_duration, s_maintenance_min,
+                                                                                             s_maintenance_max, survival_dict, initial_cycles, production_requirements_dict,
+                                                                                             time_budget=0.3, screening=True)
+
+    scheduled_maintenance_intervals, total_downtime, _ = evaluate_production_sequence(optimized_sequence, scenario, *evaluation_arguments)
+
+    assert (optimized_downtime, best_maintenance_intervals) == (total_downtime, scheduled_maintenance_intervals)